@@ -0,0 +1,260 @@
+"""This module contains the action scheduler for timed gameplay actions.
+
+Actions are generator functions or async coroutines that are resumed by
+the game loop instead of running their own tick loops. An action pauses
+by yielding (or awaiting) a Wait object, and receives the current game
+time in milliseconds when it is resumed:
+
+    def chop(game_object):
+        curr_time_ms = yield actions.Wait(500)
+        while True:
+            curr_time_ms = yield actions.NEXT_FRAME
+            ...
+
+    async def respawn(map_obj):
+        await actions.Wait(30000)
+        ...
+
+Many actions (skilling, NPC movement, respawn timers) can then progress
+in the same frame. Sleeping actions are kept in a heap ordered by wake
+time, so each update only touches the actions that are due.
+"""
+
+import heapq
+import itertools
+import logging
+import pygame
+
+
+class Wait:
+    """Command that pauses an action for the given number of milliseconds.
+
+    A duration of 0 resumes the action on the next scheduler update.
+    Can be yielded from generator actions or awaited from async actions.
+    """
+
+    __slots__ = ('duration_ms',)
+
+    def __init__(self, duration_ms=0):
+        self.duration_ms = max(0, int(duration_ms))
+
+    def __await__(self):
+        curr_time_ms = yield self
+        return curr_time_ms
+
+
+# Resumes the action on the next frame.
+NEXT_FRAME = Wait(0)
+
+
+class Action:
+    """Handle for a scheduled action.
+
+    Attributes:
+        name: name of the action, for logging.
+        owner: optional object that owns the action, such as the Entity
+            that is skilling.
+        cancel_keys: set of pygame key IDs that cancel the action when
+            pressed.
+    """
+
+    def __init__(self, coroutine, name='', owner=None, cancel_keys=None):
+        self._coroutine = coroutine
+        self._started = False
+        self._done = False
+        self._cancelled = False
+        self.name = name
+        self.owner = owner
+        self.cancel_keys = frozenset(cancel_keys) if cancel_keys else frozenset()
+
+    @property
+    def done(self):
+        """Returns True if the action has finished or was cancelled."""
+
+        return self._done
+
+    @property
+    def cancelled(self):
+        """Returns True if the action was cancelled."""
+
+        return self._cancelled
+
+    def resume(self, curr_time_ms):
+        """Runs the action until its next Wait and returns the Wait, or None
+        if the action finished."""
+
+        try:
+            if self._started:
+                command = self._coroutine.send(curr_time_ms)
+            else:
+                self._started = True
+                command = self._coroutine.send(None)
+        except StopIteration:
+            self._done = True
+            return None
+
+        if command is None:
+            command = NEXT_FRAME
+        elif not isinstance(command, Wait):
+            self.close()
+            raise Exception('Action {0} yielded invalid command {1}'.format(self.name, command))
+        return command
+
+    def close(self):
+        """Stops the action. Cleanup code in the action (finally blocks)
+        runs immediately."""
+
+        if not self._done:
+            self._done = True
+            self._cancelled = True
+            self._coroutine.close()
+
+
+class ActionScheduler:
+    """Runs scheduled actions from the game loop.
+
+    The game loop calls update() once per frame and forwards key presses
+    to handle_key_event() so that actions can be cancelled by the keys
+    they registered.
+    """
+
+    def __init__(self):
+        # Heap of (wake time in ms, insertion order, Action).
+        self._wait_queue = []
+        self._order = itertools.count()
+        self._actions = set()
+        self._curr_time_ms = 0
+
+    @property
+    def curr_time_ms(self):
+        """Returns the game time in milliseconds of the last update."""
+
+        return self._curr_time_ms
+
+    @property
+    def num_actions(self):
+        """Returns the number of actions that have not finished."""
+
+        return len(self._actions)
+
+    def start(self, coroutine, name='', owner=None, cancel_keys=None, start_now=False):
+        """Schedules the generator or coroutine to start on the next update
+        and returns its Action handle.
+
+        Args:
+            coroutine: generator or coroutine object for the action.
+            name: name of the action, for logging.
+            owner: optional object that owns the action.
+            cancel_keys: optional set of pygame key IDs that cancel the
+                action when pressed.
+            start_now: if True, runs the action up to its first Wait right
+                away instead of on the next update.
+
+        Returns:
+            Action object for the scheduled action.
+        """
+
+        action = Action(coroutine, name=name, owner=owner, cancel_keys=cancel_keys)
+        wake_time_ms = self._curr_time_ms
+        if start_now:
+            command = action.resume(self._curr_time_ms)
+            if command is None:
+                logging.debug('Finished action %s', name)
+                return action
+            wake_time_ms += command.duration_ms
+
+        self._actions.add(action)
+        heapq.heappush(self._wait_queue, (wake_time_ms, next(self._order), action))
+        logging.debug('Scheduled action %s', name)
+        return action
+
+    def cancel(self, action):
+        """Cancels the given action if it has not finished."""
+
+        if action in self._actions:
+            self._actions.discard(action)
+            action.close()
+            logging.info('Cancelled action %s', action.name)
+
+    def cancel_owned_by(self, owner):
+        """Cancels all actions owned by the given object."""
+
+        for action in [x for x in self._actions if x.owner is owner]:
+            self.cancel(action)
+
+    def cancel_all(self):
+        """Cancels all actions."""
+
+        for action in list(self._actions):
+            self.cancel(action)
+        self._wait_queue = []
+
+    def get_actions_owned_by(self, owner):
+        """Returns list of unfinished actions owned by the given object."""
+
+        return [x for x in self._actions if x.owner is owner]
+
+    def handle_key_event(self, key):
+        """Cancels the actions that registered the given pressed key.
+
+        Returns:
+            True if at least one action was cancelled, False otherwise.
+        """
+
+        to_cancel = [x for x in self._actions if key in x.cancel_keys]
+        for action in to_cancel:
+            self.cancel(action)
+        return bool(to_cancel)
+
+    def update(self, curr_time_ms=None, max_resumes=None):
+        """Resumes every action whose wait has elapsed.
+
+        Each action is resumed at most once per update, so an action that
+        waits for 0 ms continues on the next update.
+
+        Args:
+            curr_time_ms: current game time in milliseconds. Defaults to
+                pygame.time.get_ticks().
+            max_resumes: optional limit on the number of actions to resume
+                in this update. Remaining due actions run on the next
+                update, which bounds the per-frame cost.
+
+        Returns:
+            Number of actions resumed.
+        """
+
+        if curr_time_ms is None:
+            curr_time_ms = pygame.time.get_ticks()
+        self._curr_time_ms = curr_time_ms
+
+        # Collect due actions first so rescheduled actions wait for the
+        # next update.
+        due_actions = []
+        while self._wait_queue and self._wait_queue[0][0] <= curr_time_ms:
+            if max_resumes is not None and len(due_actions) >= max_resumes:
+                break
+            action = heapq.heappop(self._wait_queue)[2]
+            if not action.done:
+                due_actions.append(action)
+
+        for action in due_actions:
+            if action.done:
+                # Cancelled by an earlier action in this update.
+                continue
+            try:
+                command = action.resume(curr_time_ms)
+            except Exception as e:
+                logging.exception('Exception in action {0}: {1}'.format(action.name, e))
+                command = None
+                action.close()
+
+            if command is None:
+                self._actions.discard(action)
+                logging.debug('Finished action %s', action.name)
+            else:
+                heapq.heappush(
+                    self._wait_queue,
+                    (curr_time_ms + command.duration_ms, next(self._order), action)
+                )
+
+        return len(due_actions)
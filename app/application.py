@@ -5,20 +5,26 @@ import json
 import re
 import pprint
 
+from app.actions import actions
+from app.audio import audio
 from app.interactions import interaction
 from app.items import inventory
-from app.maps import maps, directions
+from app.maps import maps, directions, exploration, terrain
 from app.overworld_obj import protagonist as protag
 from app.images import image_ids
 from app.items import items
 from app.save import save_game
 from app.skills import skills
 from app.tiles import tiles
-from app.viewing import viewing, menu_options, display, selection, colors
+from app.viewing import viewing, menu_options, display, selection, colors, minimap, particles
 from lang import language
 from util import timekeeper, util
 from conf import settings
 
+# Time to wait before trying again to respawn an object whose tiles are
+# occupied.
+RESPAWN_RETRY_DELAY_MS = 1000
+
 
 class Application(object):
     def __init__(self, display_surface):
@@ -35,6 +41,9 @@ class Application(object):
         # Set main display screen.
         self.main_display_screen = display_surface
 
+        # Runs timed gameplay actions such as skilling.
+        self.action_scheduler = actions.ActionScheduler()
+
         # Create initial viewing overworld_obj.
         self.overworld_viewing = viewing.OverworldView.create_overworld_viewing(self.main_display_screen)
 
@@ -62,6 +71,8 @@ class Application(object):
         else:
             logging.debug('Created viewing overworld_obj.')
 
+        language.Language.add_language_change_listener(self._on_language_change)
+
     # TODO document
     # centers map automatically depending on where protagonist is
     # DOES NOT UPDATE SURFACE
@@ -84,10 +95,13 @@ class Application(object):
                 self.curr_map.protagonist_location
             )
 
-            # Load map music
-            if curr_map.music_file:
-                pygame.mixer.music.load(curr_map.music_file)
-                pygame.mixer.music.play(loops=-1)
+            # Switch to the map music without waiting on file loading, and
+            # start loading music for neighbouring maps.
+            audio.Audio.play_music(curr_map.music_file)
+            audio.Audio.preload_music_files(curr_map.get_adjacent_music_files())
+
+            # Start downscaling the map for the minimap in the background.
+            minimap.Minimap.request_pyramid(curr_map)
 
     # TODO
     def build_protagonist(self, name):
@@ -116,7 +130,9 @@ class Application(object):
     def set_object_respawn(self, target_object, target_object_loc):
         """Sets the respawn for the given object at the given location.
 
-        Does not reblit or refresh the map or display.
+        The object is replaced right away by its replacement object, if it
+        has one, and a scheduled action puts the original object back after
+        its respawn time. Does not reblit or refresh the map or display.
 
         Args:
             target_object: object to set respawn for, typically a resource
@@ -125,13 +141,25 @@ class Application(object):
                 object.
         """
 
+        if self.curr_map and target_object and target_object_loc:
+            self.action_scheduler.start(
+                self._respawn_object_action(self.curr_map, target_object, target_object_loc),
+                name='respawn {0} at {1}'.format(target_object.object_id, target_object_loc),
+                owner=self.curr_map,
+                start_now=True,
+            )
+
+    def _respawn_object_action(self, map_obj, target_object, target_object_loc):
+        """Generator action that swaps the object for its replacement and
+        places the original object back once its respawn time has passed."""
+
         # Get exhausted version of object.
         replacement_id = target_object.replacement_object_id
         respawn_time_s = target_object.respawn_time_s
         original_id = target_object.object_id
 
         logging.info(
-            "Replacing object %d with %d for %d seconds. Bottom tile loc %s",
+            "Replacing object %s with %s for %s seconds. Bottom tile loc %s",
             original_id,
             replacement_id,
             respawn_time_s,
@@ -139,28 +167,35 @@ class Application(object):
         )
 
         # Clear previous object and add replacement obj.
-        self.set_pending_spawn_action_curr_map(
-            target_object_loc,
-            object_id=replacement_id,
-            countdown_time_s=0,
-        )
-
-        # Set pending spawn action and update map.
-        # None respawn time means never respawn.
-        if respawn_time_s is not None:
-            self.set_pending_spawn_action_curr_map(
-                target_object_loc,
-                object_id=original_id,
-                countdown_time_s=respawn_time_s,
-            )
+        map_obj.remove_object(target_object_loc)
+        if replacement_id is not None:
+            map_obj.place_object(replacement_id, target_object_loc)
+
+        # None or 0 respawn time means never respawn.
+        if not respawn_time_s:
+            return
+        yield actions.Wait(respawn_time_s * timekeeper.MS_PER_SECOND)
+
+        # Wait until the tiles are free, e.g. when the protagonist is
+        # standing where the original object goes.
+        while True:
+            if replacement_id is not None:
+                map_obj.remove_object(target_object_loc)
+            if map_obj.place_object(original_id, target_object_loc):
+                break
+            if replacement_id is not None:
+                map_obj.place_object(replacement_id, target_object_loc)
+            yield actions.Wait(RESPAWN_RETRY_DELAY_MS)
+
+        logging.info("Respawned object %s at %s", original_id, target_object_loc)
+        if map_obj is self.curr_map:
+            self.refresh_and_blit_overworld_viewing()
 
     # change and transition to new map
     # updates display screen
     # TODO document and change - also change music if needed
     def change_current_map(self, dest_map_id, protag_dest_tile_pos):
         if dest_map_id and protag_dest_tile_pos:
-            pygame.mixer.music.unload()
-
             # Set and blit map.#$$
             self.set_and_blit_game_map(dest_map_id, protag_dest_tile_pos)
 
@@ -379,6 +414,8 @@ class Application(object):
                         auto_advance=False,
                     )
 
+        return levels_gained
+
     def get_input_quantity(self, viewing_obj, display_obj, prompt_text):
         ret_quantity = None
 
@@ -560,10 +597,18 @@ class Application(object):
             new_language: language ID value for the langauge to change to.
         """
         if new_language is not None:
+            # Visible viewings are refreshed by the language change listener.
             language.Language.set_current_language(new_language)
 
-            # Refresh viewings.
-            self.refresh_and_blit_overworld_viewing()
+    def _on_language_change(self, old_language, new_language):
+        """Re-renders the visible overworld viewing in the new language.
+
+        Other viewings render their text when they are next displayed, so
+        they do not need to be refreshed here.
+        """
+        logging.info('Language changed from %s to %s', old_language, new_language)
+        if self.curr_map:
+            self.refresh_and_blit_overworld_viewing(display_update=False)
 
     def refresh_and_blit_overworld_viewing(self, display_update=True):
         """Updates the overworld viewing and updates the pygame display if
@@ -650,73 +695,6 @@ class Application(object):
     def get_bottom_left_tile_of_occupied_tile(self, tile_loc):
         return self.curr_map.get_bottom_left_tile_of_occupied_tile(tile_loc)
 
-    # Sets spawn action for the given map.
-    def set_pending_spawn_action(
-            self,
-            map_obj,
-            bottom_left_tile_loc,
-            object_id=None,
-            countdown_time_s=0,
-    ):
-        """Sets a pending spawn action for the given location on the given map,
-        and then refreshes the map.
-
-        Args:
-            map_obj: Map object for which to set the pending spawn action.
-            bottom_left_tile_loc: bottom left tile coordinate for the spawn
-                action.
-            object_id: object ID to spawn at the specified bottom left tile
-                location. If None, removes any object that is occupying
-                the bottom left tile location.
-            countdown_time_s: time in seconds before the Map should spawn
-                the given object (or remove the current object). If 0,
-                the action will occur right away.
-        """
-
-        logging.info(
-            "Setting spawn action for tile loc %s using obj id %s with countdown %s",
-            bottom_left_tile_loc,
-            object_id,
-            countdown_time_s,
-        )
-
-        if map_obj and bottom_left_tile_loc:
-            map_obj.set_pending_spawn_action(
-                bottom_left_tile_loc,
-                object_id=object_id,
-                countdown_time_s=countdown_time_s,
-            )
-
-            map_obj.refresh_self()
-
-    # Sets spawn action for the current map.
-    def set_pending_spawn_action_curr_map(
-            self,
-            bottom_left_tile_loc,
-            object_id=None,
-            countdown_time_s=0,
-    ):
-        """Sets a pending spawn action for the given location on the current
-        map, and then refreshes the map.
-
-        Args:
-            bottom_left_tile_loc: bottom left tile coordinate for the spawn
-                action.
-            object_id: object ID to spawn at the specified bottom left tile
-                location. If None, removes any object that is occupying
-                the bottom left tile location.
-            countdown_time_s: time in seconds before the Map should spawn
-                the given object (or remove the current object). If 0,
-                the action will occur right away.
-        """
-
-        self.set_pending_spawn_action(
-            self.curr_map,
-            bottom_left_tile_loc,
-            object_id=object_id,
-            countdown_time_s=countdown_time_s,
-        )
-
     def get_save_data(self):
         """Returns dict containing save data for the game."""
 
@@ -732,9 +710,10 @@ class Application(object):
         save_data[save_game.PROTAG_TOOLBELT] = self.protagonist.tool_inventory.get_listing_dict()
 
         saved_equipment = {}
-        for equipmentslot, item_info in self.protagonist.equipment_dict:
+        for equipmentslot, item_info in self.protagonist.equipment_dict.items():
             # Store just item ID and quantity.
-            saved_equipment[equipmentslot] = [item_info[0], item_info[2]]
+            saved_equipment[equipmentslot.value] = [item_info[0], item_info[2]]
+        save_data[save_game.PROTAG_EQUIPMENT] = saved_equipment
 
         # Save stats.
         save_data[save_game.PROTAG_STATS] = \
@@ -744,6 +723,15 @@ class Application(object):
         save_data[save_game.PROTAG_RUN_ON] = self.protagonist.run_on
         save_data[save_game.PROTAG_RUN_ENERGY] = self.protagonist.run_energy
 
+        # Save time of day.
+        save_data[save_game.GAME_TIME_MS] = timekeeper.Timekeeper.get_game_time_ms()
+
+        # Save terrain changed since the maps loaded.
+        save_data[save_game.TERRAIN_CHANGES] = terrain.Terrain.get_save_data()
+
+        # Save explored tiles as compressed bitsets.
+        save_data[save_game.EXPLORED_TILES] = exploration.Exploration.get_save_data()
+
         # TODO implement further
 
         return save_data
@@ -782,8 +770,15 @@ class Application(object):
                 image_ids.ImageSequenceID.FACE_SOUTH
             )
 
-            # Set protagonist items. TODO equipment.
+            # Set protagonist items.
             self.protagonist.clear_all_items()
+            self.protagonist.equipment.clear()
+            for item_info in save_data.get(save_game.PROTAG_EQUIPMENT, {}).values():
+                equipped_item = items.Item.get_item(item_info[0])
+                if equipped_item:
+                    self.protagonist.equipment.equip(equipped_item, quantity=item_info[1])
+                else:
+                    logging.error("Invalid equipped item ID {0}".format(item_info[0]))
             for item_id, quantity in save_data.get(save_game.PROTAG_INVENTORY, {}).items():
                 self.protagonist.add_item_to_inventory(
                     item_id,
@@ -798,11 +793,12 @@ class Application(object):
 
             # Set protagonist skills.
             for skill_id, skill_info in save_data.get(save_game.PROTAG_STATS, {}).items():
-                self.protagonist.skill_info_mapping[skill_id] = [
+                self.protagonist.set_skill_info(
+                    skill_id,
                     skill_info[0],
                     skill_info[1],
                     skill_info[2]
-                ]
+                )
 
             # Set protagonist run info.
             self.protagonist.run_on = save_data.get(
@@ -832,6 +828,12 @@ class Application(object):
                     # TODO load changed map data.
                     map_obj.last_refresh_time_ms = pygame.time.get_ticks()
 
+            terrain.Terrain.load_save_data(save_data.get(save_game.TERRAIN_CHANGES, []), maps.Map.map_listing)
+            exploration.Exploration.load_save_data(save_data.get(save_game.EXPLORED_TILES, []))
+            timekeeper.Timekeeper.set_game_time_ms(
+                save_data.get(save_game.GAME_TIME_MS, timekeeper.GAME_START_TIME_MS)
+            )
+
             # Set map and protagonist location.
             self.set_and_blit_game_map(
                 save_data.get(save_game.MAP_ID),
@@ -1025,13 +1027,25 @@ class Application(object):
         num_ticks = 0
 
         while continue_playing:
-            # Tick clock.
+            # Tick clock and run the logic ticks that are due, catching up
+            # after slow frames.
             timekeeper.Timekeeper.tick()
-            num_ticks = num_ticks + 1
-
-            if num_ticks % timekeeper.MAP_REFRESH_TICK_INTERVAL == 0:
+            refresh_due = False
+            reblit_due = False
+            for i in range(timekeeper.Timekeeper.consume_logic_ticks()):
+                num_ticks = num_ticks + 1
+                if num_ticks % timekeeper.MAP_REFRESH_TICK_INTERVAL == 0:
+                    refresh_due = True
+                elif num_ticks % timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL == 0:
+                    reblit_due = True
+
+            # Particles move every frame, not just when the map is
+            # reblitted.
+            self.overworld_viewing.update_particles()
+
+            if refresh_due:
                 self.refresh_and_blit_overworld_viewing()
-            elif num_ticks % timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL == 0:
+            elif (reblit_due or particles.Particles.is_active()) and timekeeper.Timekeeper.should_render():
                 self.overworld_viewing.blit_self()
                 pygame.display.update()
 
@@ -1043,6 +1057,9 @@ class Application(object):
                     pygame.quit()
                     sys.exit(0)
                 elif events.type == pygame.KEYDOWN:
+                    # Cancel any actions, such as skilling, that end on this key.
+                    self.action_scheduler.handle_key_event(events.key)
+
                     if events.key == pygame.K_RIGHT:
                         pressed_right = True
                         protag_move_dir = directions.CardinalDirection.EAST
@@ -1181,6 +1198,12 @@ class Application(object):
                         # move_down = False
                         logging.debug("Down released")
 
+            # Resume any scheduled actions that are due.
+            self.action_scheduler.update()
+
+            # Start any music that finished loading.
+            audio.Audio.update()
+
             if pressed_up or pressed_down or pressed_right or pressed_left:
                 # TODO for now, just stick with walking
                 transport_type = tiles.Accessibility.WALKABLE_F
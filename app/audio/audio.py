@@ -0,0 +1,325 @@
+"""This module contains the audio subsystem for music and sound effects.
+
+File reads and sound decoding run on a background thread, so changing
+maps or playing an effect never waits on audio I/O. Music for
+neighbouring maps can be preloaded ahead of time.
+
+Music in formats that pygame can decode into a Sound (such as .ogg and
+.wav) plays on one of two reserved channels, which lets the old and new
+tracks crossfade. Other formats (such as MIDI) stream through
+pygame.mixer.music from memory, fading out the old track before fading
+in the new one.
+
+Sound effects are decoded once, kept in a bounded cache, and played on a
+fixed pool of channels.
+"""
+
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import pygame
+
+# File extensions that can be decoded into pygame Sound objects.
+SOUND_DECODABLE_EXTENSIONS = {'.ogg', '.wav'}
+
+DEFAULT_MUSIC_FADE_MS = 1000
+NUM_MUSIC_CHANNELS = 2
+DEFAULT_NUM_EFFECT_CHANNELS = 8
+
+# Maximum number of music tracks and sound effects to keep loaded.
+MAX_CACHED_MUSIC = 4
+MAX_CACHED_SOUNDS = 64
+
+NUM_LOADER_THREADS = 2
+
+
+class LoadedMusic:
+    """Music file contents loaded by the background loader.
+
+    Attributes:
+        path: file path of the music.
+        data: raw bytes of the music file.
+        sound: decoded pygame Sound for the music, or None if the format
+            must be streamed.
+    """
+
+    def __init__(self, path, data, sound=None):
+        self.path = path
+        self.data = data
+        self.sound = sound
+
+
+class Audio:
+    """Handles music and sound effect playback.
+
+    The user should not generate Audio objects, as the class is
+    primarily for class methods related to the pygame mixer. Call
+    update() once per frame to start music that finished loading.
+    """
+
+    _initialized = False
+    _executor = None
+
+    # Maps music file path to Future for a LoadedMusic object.
+    _music_cache = collections.OrderedDict()
+
+    # Maps sound effect file path to Future for a pygame Sound.
+    _sound_cache = collections.OrderedDict()
+
+    _music_channels = []
+    _effect_channels = []
+    _next_effect_channel_index = 0
+
+    # Music that is playing or about to play.
+    _curr_music_path = ''
+    _curr_music_channel = None
+
+    # Music channel that most recently started fading out.
+    _fading_music_channel = None
+    _curr_music_streamed = False
+    _pending_music = None
+    _stream_fade_end_ms = 0
+
+    @classmethod
+    def init_audio(cls, num_effect_channels=DEFAULT_NUM_EFFECT_CHANNELS):
+        """Sets up mixer channels and the background loader.
+
+        Requires pygame.mixer to be initialized.
+        """
+
+        pygame.mixer.set_num_channels(NUM_MUSIC_CHANNELS + num_effect_channels)
+        pygame.mixer.set_reserved(NUM_MUSIC_CHANNELS)
+        cls._music_channels = [pygame.mixer.Channel(i) for i in range(NUM_MUSIC_CHANNELS)]
+        cls._effect_channels = [
+            pygame.mixer.Channel(i) for i in range(NUM_MUSIC_CHANNELS, NUM_MUSIC_CHANNELS + num_effect_channels)
+        ]
+        cls._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=NUM_LOADER_THREADS,
+            thread_name_prefix='audio_loader',
+        )
+        cls._initialized = True
+        logging.info('Initialized audio with %d effect channels.', num_effect_channels)
+
+    @staticmethod
+    def _load_music_file(path):
+        """Reads (and decodes, if possible) the music file. Runs on a
+        loader thread."""
+
+        with open(path, 'rb') as music_file:
+            data = music_file.read()
+
+        sound = None
+        if os.path.splitext(path)[1].lower() in SOUND_DECODABLE_EXTENSIONS:
+            sound = pygame.mixer.Sound(file=io.BytesIO(data))
+        return LoadedMusic(path, data, sound=sound)
+
+    @staticmethod
+    def _load_sound_file(path):
+        """Decodes the sound effect file. Runs on a loader thread."""
+
+        return pygame.mixer.Sound(file=path)
+
+    @staticmethod
+    def _add_to_cache(cache, max_size, key, loader, protected_key=None):
+        """Returns the cached Future for key, submitting the loader if the
+        key is not cached yet. Evicts the oldest entries past max_size."""
+
+        future = cache.get(key, None)
+        if future:
+            cache.move_to_end(key)
+            return future
+
+        future = Audio._executor.submit(loader, key)
+        cache[key] = future
+        for old_key in list(cache.keys()):
+            if len(cache) <= max_size:
+                break
+            if old_key != key and old_key != protected_key:
+                cache.pop(old_key)
+        return future
+
+    @classmethod
+    def preload_music(cls, music_path):
+        """Starts loading the music file in the background, if it isn't
+        already loaded."""
+
+        if cls._initialized and music_path:
+            cls._add_to_cache(
+                cls._music_cache,
+                MAX_CACHED_MUSIC,
+                music_path,
+                Audio._load_music_file,
+                protected_key=cls._curr_music_path,
+            )
+
+    @classmethod
+    def preload_music_files(cls, music_paths):
+        """Starts loading each of the music files in the background."""
+
+        for music_path in music_paths:
+            cls.preload_music(music_path)
+
+    @classmethod
+    def preload_sounds(cls, sound_paths):
+        """Starts decoding each of the sound effect files in the background."""
+
+        if cls._initialized:
+            for sound_path in sound_paths:
+                if sound_path:
+                    cls._add_to_cache(cls._sound_cache, MAX_CACHED_SOUNDS, sound_path, Audio._load_sound_file)
+
+    @classmethod
+    def play_music(cls, music_path, fade_ms=DEFAULT_MUSIC_FADE_MS):
+        """Switches to the given looping music track.
+
+        Does nothing if the track is already playing. Returns immediately;
+        if the track is still loading, it starts on a later update() call.
+
+        Args:
+            music_path: file path of the music to play. An empty path fades
+                out the current music.
+            fade_ms: number of milliseconds to fade between tracks.
+        """
+
+        if not cls._initialized:
+            logging.warning('Audio not initialized, cannot play %s', music_path)
+            return
+
+        if music_path == cls._curr_music_path:
+            cls._pending_music = None
+            return
+
+        cls._fade_out_current_music(fade_ms)
+        cls._curr_music_path = music_path
+        if music_path:
+            cls.preload_music(music_path)
+            cls._pending_music = (music_path, fade_ms)
+            cls.update()
+        else:
+            cls._pending_music = None
+
+    @classmethod
+    def stop_music(cls, fade_ms=DEFAULT_MUSIC_FADE_MS):
+        """Fades out the current music."""
+
+        cls.play_music('', fade_ms=fade_ms)
+
+    @classmethod
+    def _fade_out_current_music(cls, fade_ms):
+        if cls._curr_music_channel:
+            cls._curr_music_channel.fadeout(fade_ms)
+            cls._fading_music_channel = cls._curr_music_channel
+            cls._curr_music_channel = None
+        elif cls._curr_music_streamed:
+            pygame.mixer.music.fadeout(fade_ms)
+            cls._stream_fade_end_ms = pygame.time.get_ticks() + fade_ms
+        cls._curr_music_streamed = False
+
+    @classmethod
+    def update(cls):
+        """Starts pending music whose file finished loading.
+
+        Call once per frame. Never blocks on file I/O.
+        """
+
+        if not cls._pending_music:
+            return
+
+        music_path, fade_ms = cls._pending_music
+        future = cls._music_cache.get(music_path, None)
+        if not future:
+            # Evicted before it could play. Load it again.
+            cls.preload_music(music_path)
+            return
+        if not future.done():
+            return
+
+        try:
+            loaded_music = future.result()
+        except Exception as e:
+            logging.error('Failed to load music {0}: {1}'.format(music_path, e))
+            cls._music_cache.pop(music_path, None)
+            cls._pending_music = None
+            return
+
+        if loaded_music.sound:
+            # Crossfade onto whichever music channel is free. If both are
+            # still fading, cut off the one that started fading first and
+            # keep the crossfade from the most recent track.
+            free_channels = [channel for channel in cls._music_channels if not channel.get_busy()]
+            if free_channels:
+                channel = free_channels[0]
+            else:
+                channel = next(
+                    channel for channel in cls._music_channels if channel is not cls._fading_music_channel
+                )
+                channel.stop()
+            channel.play(loaded_music.sound, loops=-1, fade_ms=fade_ms)
+            cls._curr_music_channel = channel
+        else:
+            # The music stream only plays one track at a time, so wait for
+            # the previous stream to fade out.
+            if pygame.time.get_ticks() < cls._stream_fade_end_ms:
+                return
+            try:
+                pygame.mixer.music.load(io.BytesIO(loaded_music.data), os.path.basename(music_path))
+            except pygame.error as e:
+                # Some formats can only be streamed from a file. Loading
+                # from the file here would block the frame, so skip the
+                # track instead.
+                logging.error('Cannot stream music {0} from memory, skipping it: {1}'.format(music_path, e))
+                cls._music_cache.pop(music_path, None)
+                cls._pending_music = None
+                return
+            pygame.mixer.music.play(loops=-1, fade_ms=fade_ms)
+            cls._curr_music_streamed = True
+
+        cls._pending_music = None
+        logging.info('Playing music %s', music_path)
+
+    @classmethod
+    def play_sound(cls, sound_path, volume=1.0):
+        """Plays the sound effect on a pooled channel.
+
+        If the sound is not decoded yet, starts decoding it and skips
+        playback, so preload sounds that must not be missed.
+
+        Args:
+            sound_path: file path of the sound effect.
+            volume: playback volume from 0.0 to 1.0.
+
+        Returns:
+            True if the sound started playing, False otherwise.
+        """
+
+        if not (cls._initialized and sound_path and cls._effect_channels):
+            return False
+
+        future = cls._add_to_cache(cls._sound_cache, MAX_CACHED_SOUNDS, sound_path, Audio._load_sound_file)
+        if not future.done():
+            return False
+        try:
+            sound = future.result()
+        except Exception as e:
+            logging.error('Failed to load sound {0}: {1}'.format(sound_path, e))
+            cls._sound_cache.pop(sound_path, None)
+            return False
+
+        # Use an idle channel if possible. Otherwise, cut off the channel
+        # that started playing longest ago.
+        num_channels = len(cls._effect_channels)
+        channel = None
+        for i in range(num_channels):
+            candidate = cls._effect_channels[(cls._next_effect_channel_index + i) % num_channels]
+            if not candidate.get_busy():
+                channel = candidate
+                break
+        if channel is None:
+            channel = cls._effect_channels[cls._next_effect_channel_index]
+        cls._next_effect_channel_index = (cls._effect_channels.index(channel) + 1) % num_channels
+
+        channel.set_volume(volume)
+        channel.play(sound)
+        return True
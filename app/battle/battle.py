@@ -6,7 +6,7 @@ class CombatType(Enum):
     MELEE = 0x2
     RANGED = 0x3
     WHITE_MAGIC = 0x4
-    BLACK_MAGIC = 0x4
+    BLACK_MAGIC = 0x5
 
 
 class DamageType(Enum):
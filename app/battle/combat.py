@@ -0,0 +1,336 @@
+"""This module contains the combat engine.
+
+Combatants are stored as a struct of arrays (one NumPy array per stat),
+and the pairwise hit chances and damage multipliers between combatants
+are precomputed when the battle is set up. The damage multiplier combines
+the effectiveness of the attacker's damage type against the defender's
+affinity (EFFECTIVENESS_MATRIX, indexed by DamageType) with the
+defender's resistance to that damage type.
+
+A round is resolved for all combatants at once: every living combatant
+picks a random living enemy, rolls to hit and for damage, and all damage
+is applied simultaneously. Combat state also has a leading battle axis,
+so many independent copies of a battle are resolved in the same
+vectorized step. simulate_battles() uses this, split over a process
+pool, to run thousands of headless battles for balance testing.
+
+Requires NumPy.
+"""
+
+import concurrent.futures
+import logging
+
+import numpy as np
+
+from app.battle import battle
+
+# DamageType order for matrix and resistance indexes.
+DAMAGE_TYPE_LIST = list(battle.DamageType)
+DAMAGE_TYPE_INDEX = {damage_type: index for index, damage_type in enumerate(DAMAGE_TYPE_LIST)}
+NUM_DAMAGE_TYPES = len(DAMAGE_TYPE_LIST)
+
+# Default damage type for each combat type.
+COMBAT_TYPE_DAMAGE_TYPES = {
+    battle.CombatType.NONE: battle.DamageType.NONE,
+    battle.CombatType.MELEE: battle.DamageType.MELEE,
+    battle.CombatType.RANGED: battle.DamageType.RANGED,
+    battle.CombatType.WHITE_MAGIC: battle.DamageType.MAGIC_HOLY,
+    battle.CombatType.BLACK_MAGIC: battle.DamageType.MAGIC_DARK,
+}
+
+# Maps (attacking damage type, defender affinity) to damage multipliers
+# that differ from 1.
+EFFECTIVENESS_OVERRIDES = {
+    (battle.DamageType.MAGIC_WATER, battle.DamageType.MAGIC_FIRE): 2.0,
+    (battle.DamageType.MAGIC_FIRE, battle.DamageType.MAGIC_WATER): 0.5,
+    (battle.DamageType.MAGIC_FIRE, battle.DamageType.MAGIC_ICE): 2.0,
+    (battle.DamageType.MAGIC_ICE, battle.DamageType.MAGIC_FIRE): 0.5,
+    (battle.DamageType.MAGIC_FIRE, battle.DamageType.MAGIC_NATURE): 2.0,
+    (battle.DamageType.MAGIC_NATURE, battle.DamageType.MAGIC_FIRE): 0.5,
+    (battle.DamageType.MAGIC_ELECTRIC, battle.DamageType.MAGIC_WATER): 2.0,
+    (battle.DamageType.MAGIC_EARTH, battle.DamageType.MAGIC_ELECTRIC): 2.0,
+    (battle.DamageType.MAGIC_ELECTRIC, battle.DamageType.MAGIC_EARTH): 0.0,
+    (battle.DamageType.MAGIC_AIR, battle.DamageType.MAGIC_EARTH): 0.5,
+    (battle.DamageType.MAGIC_HOLY, battle.DamageType.MAGIC_DARK): 2.0,
+    (battle.DamageType.MAGIC_DARK, battle.DamageType.MAGIC_HOLY): 2.0,
+}
+
+
+def build_effectiveness_matrix():
+    """Returns matrix of damage multipliers indexed by [attacking damage
+    type index, defender affinity index]."""
+
+    matrix = np.ones((NUM_DAMAGE_TYPES, NUM_DAMAGE_TYPES), dtype=np.float64)
+    matrix[DAMAGE_TYPE_INDEX[battle.DamageType.NONE], :] = 0.0
+    for (attack_type, affinity), multiplier in EFFECTIVENESS_OVERRIDES.items():
+        matrix[DAMAGE_TYPE_INDEX[attack_type], DAMAGE_TYPE_INDEX[affinity]] = multiplier
+    return matrix
+
+
+EFFECTIVENESS_MATRIX = build_effectiveness_matrix()
+
+# Hit chance when accuracy equals evasion, change in hit chance per point
+# of accuracy over evasion, and bounds on the hit chance.
+BASE_HIT_CHANCE = 0.75
+HIT_CHANCE_PER_POINT = 0.01
+MIN_HIT_CHANCE = 0.05
+MAX_HIT_CHANCE = 0.95
+
+# Damage rolls are uniform between this fraction of attack and attack.
+MIN_DAMAGE_ROLL = 0.5
+
+# Fraction of the defender's defence subtracted from each damage roll.
+DEFENCE_FACTOR = 0.5
+
+# Minimum damage for a hit that is not fully resisted.
+MIN_HIT_DAMAGE = 1
+
+DEFAULT_MAX_ROUNDS = 200
+
+# Winner value for battles without a single surviving team.
+NO_WINNER = -1
+
+# Maximum number of battles per batch job.
+MAX_BATTLES_PER_JOB = 2000
+
+
+class CombatantSpec:
+    """Stats for a combatant.
+
+    Attributes:
+        name: name of the combatant, for logs.
+        team: integer team number. Combatants attack other teams.
+        max_hp: starting hitpoints.
+        attack: maximum damage before defence and multipliers.
+        defence: reduces damage taken.
+        accuracy: increases chance to hit.
+        evasion: decreases chance to be hit.
+        combat_type: battle.CombatType of the combatant's attacks.
+        damage_type: battle.DamageType of the combatant's attacks. Defaults
+            to the damage type for combat_type.
+        affinity: battle.DamageType the combatant is aligned with, for
+            the effectiveness matrix.
+        resistances: dict mapping battle.DamageType to a damage multiplier
+            for damage taken of that type.
+    """
+
+    def __init__(self, name, team, max_hp, attack, defence=0, accuracy=0, evasion=0,
+                 combat_type=battle.CombatType.MELEE, damage_type=None, affinity=battle.DamageType.NEUTRAL,
+                 resistances=None):
+        self.name = name
+        self.team = team
+        self.max_hp = max_hp
+        self.attack = attack
+        self.defence = defence
+        self.accuracy = accuracy
+        self.evasion = evasion
+        self.combat_type = combat_type
+        self.damage_type = damage_type if damage_type else COMBAT_TYPE_DAMAGE_TYPES[combat_type]
+        self.affinity = affinity
+        self.resistances = dict(resistances) if resistances else {}
+
+
+class CombatState:
+    """Struct-of-arrays state for one or more copies of a battle.
+
+    Per-combatant stats are arrays of length N (the number of
+    combatants). Hitpoints have shape (number of battles, N), so each copy
+    of the battle has its own hitpoints.
+    """
+
+    def __init__(self, combatant_specs, num_battles=1):
+        if not combatant_specs:
+            raise Exception('No combatants for combat.')
+
+        self.names = [spec.name for spec in combatant_specs]
+        self.team = np.array([spec.team for spec in combatant_specs], dtype=np.int64)
+        self.max_hp = np.array([spec.max_hp for spec in combatant_specs], dtype=np.int64)
+        self.attack = np.array([spec.attack for spec in combatant_specs], dtype=np.float64)
+        self.defence = np.array([spec.defence for spec in combatant_specs], dtype=np.float64)
+        self.accuracy = np.array([spec.accuracy for spec in combatant_specs], dtype=np.float64)
+        self.evasion = np.array([spec.evasion for spec in combatant_specs], dtype=np.float64)
+        self.damage_type_index = np.array(
+            [DAMAGE_TYPE_INDEX[spec.damage_type] for spec in combatant_specs], dtype=np.int64)
+        self.affinity_index = np.array(
+            [DAMAGE_TYPE_INDEX[spec.affinity] for spec in combatant_specs], dtype=np.int64)
+
+        # Damage taken multiplier for each combatant and damage type.
+        self.resistances = np.ones((len(combatant_specs), NUM_DAMAGE_TYPES), dtype=np.float64)
+        for index, spec in enumerate(combatant_specs):
+            for damage_type, multiplier in spec.resistances.items():
+                self.resistances[index, DAMAGE_TYPE_INDEX[damage_type]] = multiplier
+
+        self.teams = np.unique(self.team)
+        self.hp = np.tile(self.max_hp, (num_battles, 1))
+        self.num_rounds = np.zeros(num_battles, dtype=np.int64)
+        self._precompute_pair_tables()
+
+    def _precompute_pair_tables(self):
+        """Precomputes [attacker, defender] tables that stay the same for
+        the whole battle."""
+
+        self.enemy_mask = self.team[:, None] != self.team[None, :]
+        self.hit_chance = np.clip(
+            BASE_HIT_CHANCE + HIT_CHANCE_PER_POINT * (self.accuracy[:, None] - self.evasion[None, :]),
+            MIN_HIT_CHANCE,
+            MAX_HIT_CHANCE,
+        )
+        self.damage_multiplier = EFFECTIVENESS_MATRIX[self.damage_type_index[:, None], self.affinity_index[None, :]] \
+            * self.resistances[:, self.damage_type_index].T
+
+    @property
+    def num_battles(self):
+        return self.hp.shape[0]
+
+    @property
+    def num_combatants(self):
+        return self.hp.shape[1]
+
+    def get_alive(self):
+        return self.hp > 0
+
+    def get_num_teams_alive(self):
+        """Returns array of the number of teams with a living combatant in
+        each battle."""
+
+        alive = self.get_alive()
+        return sum(np.any(alive & (self.team == team)[None, :], axis=1).astype(np.int64) for team in self.teams)
+
+    def get_finished(self):
+        """Returns boolean array of the battles with at most one team left."""
+
+        return self.get_num_teams_alive() <= 1
+
+    def get_winners(self):
+        """Returns array of the winning team of each battle, or NO_WINNER for
+        battles that are unfinished or where every combatant died."""
+
+        alive = self.get_alive()
+        winners = np.full(self.num_battles, NO_WINNER, dtype=np.int64)
+        finished = self.get_finished()
+        for team in self.teams:
+            team_alive = np.any(alive & (self.team == team)[None, :], axis=1)
+            winners[finished & team_alive] = team
+        return winners
+
+
+def resolve_round(state, rng, battle_mask=None):
+    """Resolves one round of attacks for every combatant in every battle.
+
+    Args:
+        state: CombatState to update.
+        rng: numpy.random.Generator to roll with.
+        battle_mask: optional boolean array of the battles to resolve.
+            Defaults to the battles that are not finished.
+
+    Returns:
+        Tuple (targets, damage) of arrays with shape (number of battles,
+        number of combatants): the index of each combatant's target (-1
+        for no attack) and the damage each combatant dealt.
+    """
+
+    num_battles, num_combatants = state.hp.shape
+    if battle_mask is None:
+        battle_mask = ~state.get_finished()
+    alive = state.get_alive() & battle_mask[:, None]
+
+    # Each living attacker picks a random living enemy, by taking the
+    # largest random key among its valid targets.
+    valid = alive[:, :, None] & alive[:, None, :] & state.enemy_mask[None, :, :]
+    keys = np.where(valid, rng.random(valid.shape), -1.0)
+    targets = np.argmax(keys, axis=2)
+    attacking = valid.any(axis=2)
+
+    attacker_index = np.broadcast_to(np.arange(num_combatants), targets.shape)
+    hits = attacking & (rng.random(targets.shape) < state.hit_chance[attacker_index, targets])
+
+    rolls = state.attack[None, :] * rng.uniform(MIN_DAMAGE_ROLL, 1.0, targets.shape)
+    raw_damage = np.maximum(0.0, rolls - DEFENCE_FACTOR * state.defence[targets])
+    multiplier = state.damage_multiplier[attacker_index, targets]
+    damage = np.floor(raw_damage * multiplier).astype(np.int64)
+    damage = np.where(multiplier > 0, np.maximum(damage, MIN_HIT_DAMAGE), 0)
+    damage = np.where(hits, damage, 0)
+
+    # Apply all damage at once.
+    flat_targets = (np.arange(num_battles)[:, None] * num_combatants + targets).ravel()
+    damage_taken = np.bincount(flat_targets, weights=damage.ravel(), minlength=num_battles * num_combatants)
+    state.hp = np.maximum(0, state.hp - damage_taken.reshape(num_battles, num_combatants).astype(np.int64))
+    state.num_rounds += battle_mask
+
+    return np.where(attacking, targets, -1), damage
+
+
+def run_battles(state, rng, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Resolves rounds until every battle in the state is finished or
+    max_rounds is reached.
+
+    Returns:
+        Array of the winning team of each battle, or NO_WINNER.
+    """
+
+    for _ in range(max_rounds):
+        active = ~state.get_finished()
+        if not active.any():
+            break
+        resolve_round(state, rng, battle_mask=active)
+    return state.get_winners()
+
+
+def _run_battle_job(job):
+    """Runs one batch job in a worker process. job is a tuple of
+    (combatant specs, number of battles, max rounds, seed)."""
+
+    combatant_specs, num_battles, max_rounds, seed = job
+    state = CombatState(combatant_specs, num_battles=num_battles)
+    winners = run_battles(state, np.random.default_rng(seed), max_rounds=max_rounds)
+    return winners, state.num_rounds, state.hp
+
+
+def simulate_battles(combatant_specs, num_battles, max_rounds=DEFAULT_MAX_ROUNDS, seed=None, max_workers=None):
+    """Simulates many independent copies of a battle for balance testing.
+
+    Args:
+        combatant_specs: list of CombatantSpec objects for the battle.
+        num_battles: number of battles to simulate.
+        max_rounds: maximum number of rounds per battle.
+        seed: optional seed for reproducible results.
+        max_workers: maximum number of worker processes. 1 runs the jobs
+            in the current process. Defaults to the number of CPUs.
+
+    Returns:
+        Dict with the win rate of each team, the draw rate, the mean
+        number of rounds, and the mean remaining hitpoints of each
+        combatant.
+    """
+
+    if num_battles <= 0:
+        raise Exception('Invalid number of battles: {}'.format(num_battles))
+
+    seed_sequence = np.random.SeedSequence(seed)
+    jobs = [
+        (combatant_specs, min(MAX_BATTLES_PER_JOB, num_battles - start), max_rounds, seed_sequence.spawn(1)[0])
+        for start in range(0, num_battles, MAX_BATTLES_PER_JOB)
+    ]
+
+    if max_workers == 1:
+        results = [_run_battle_job(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_run_battle_job, jobs))
+
+    winners = np.concatenate([result[0] for result in results])
+    num_rounds = np.concatenate([result[1] for result in results])
+    remaining_hp = np.concatenate([result[2] for result in results])
+
+    teams = sorted({spec.team for spec in combatant_specs})
+    summary = {
+        'num_battles': num_battles,
+        'win_rates': {team: float(np.mean(winners == team)) for team in teams},
+        'draw_rate': float(np.mean(winners == NO_WINNER)),
+        'mean_rounds': float(num_rounds.mean()),
+        'mean_remaining_hp': {
+            spec.name: float(remaining_hp[:, index].mean()) for index, spec in enumerate(combatant_specs)
+        },
+    }
+    logging.info('Simulated %d battles: %s', num_battles, summary['win_rates'])
+    return summary
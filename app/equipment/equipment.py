@@ -1,3 +1,5 @@
+import logging
+import types
 from enum import Enum
 # from lang import language
 # from app.viewing import icon
@@ -22,6 +24,153 @@ class EquipmentSlot(Enum):
     WRIST = 12  # Bracelets, etc.
 
 
+def _add_boost_values(total, value, sign):
+    """Returns total plus sign times value, where the values are numbers or
+    tuples of numbers added element by element."""
+
+    if isinstance(value, (tuple, list)):
+        total = tuple(total) if isinstance(total, (tuple, list)) else ()
+        length = max(len(total), len(value))
+        total = total + (0,) * (length - len(total))
+        value = tuple(value) + (0,) * (length - len(value))
+        return tuple(t + sign * v for t, v in zip(total, value))
+    return (total or 0) + sign * value
+
+
+class EquipmentLoadout:
+    """Equipped items for an entity, keyed by EquipmentSlot.
+
+    The loadout keeps running totals of the stats and combat boosts of the
+    equipped items. Totals are updated when items are equipped or
+    unequipped, so readers such as combat and stats panels never have to
+    sum every slot. The version counter increases on every change, so
+    readers can cache values derived from the totals and recompute them
+    only when the version changes.
+    """
+
+    def __init__(self):
+        # Maps equipment slot IDs to length-3 list of form
+        # [equipped item ID, item object, quantity of item].
+        self._slot_mapping = {}
+
+        # Maps stat types to the total for all equipped items.
+        self._stat_totals = {}
+
+        # Maps boost types to the total for all equipped items. Boost values
+        # that are tuples are added element by element.
+        self._boost_totals = {}
+
+        self._version = 0
+
+    @property
+    def version(self):
+        """Returns a number that increases each time the equipment changes."""
+
+        return self._version
+
+    @property
+    def stat_totals(self):
+        """Returns read-only dict mapping stat types to their totals."""
+
+        return types.MappingProxyType(self._stat_totals)
+
+    @property
+    def boost_totals(self):
+        """Returns read-only dict mapping boost types to their totals."""
+
+        return types.MappingProxyType(self._boost_totals)
+
+    def get_stat_total(self, stat_type, default=0):
+        return self._stat_totals.get(stat_type, default)
+
+    def get_boost_total(self, boost_type, default=0):
+        return self._boost_totals.get(boost_type, default)
+
+    def get_equipped_entry(self, slot_id):
+        """Returns [item ID, item object, quantity] for the slot, or None if
+        the slot is empty."""
+
+        return self._slot_mapping.get(slot_id, None)
+
+    def get_equipped_item(self, slot_id):
+        entry = self._slot_mapping.get(slot_id, None)
+        return entry[1] if entry else None
+
+    def get_equipment_dict(self):
+        """Returns dict mapping equipment slot IDs to [item ID, item object,
+        quantity] lists for the equipped slots."""
+
+        return {slot_id: list(entry) for slot_id, entry in self._slot_mapping.items()}
+
+    def _apply_item_totals(self, item_obj, sign):
+        for stat_type, value in getattr(item_obj, 'stats', {}).items():
+            new_total = self._stat_totals.get(stat_type, 0) + sign * value
+            if new_total:
+                self._stat_totals[stat_type] = new_total
+            else:
+                self._stat_totals.pop(stat_type, None)
+
+        for boost_type, value in getattr(item_obj, 'combat_boost_info', {}).items():
+            new_total = _add_boost_values(self._boost_totals.get(boost_type, 0), value, sign)
+            is_nonzero = any(new_total) if isinstance(new_total, tuple) else new_total
+            if is_nonzero:
+                self._boost_totals[boost_type] = new_total
+            else:
+                self._boost_totals.pop(boost_type, None)
+
+    def equip(self, item_obj, quantity=1):
+        """Equips the item in its equipment slot.
+
+        Args:
+            item_obj: the EquipableItem to equip.
+            quantity: number of the item to equip, for stackable items such
+                as ammo.
+
+        Returns:
+            The [item ID, item object, quantity] list for the item that was
+            previously in the slot, or None if the slot was empty.
+        """
+
+        slot_id = getattr(item_obj, 'equipment_slot_id', EquipmentSlot.NONE)
+        if slot_id == EquipmentSlot.NONE:
+            raise Exception('Item {} is not equipable.'.format(item_obj.item_id))
+
+        prev_entry = self.unequip(slot_id)
+        self._slot_mapping[slot_id] = [item_obj.item_id, item_obj, quantity]
+        self._apply_item_totals(item_obj, 1)
+        self._version += 1
+        logging.debug('Equipped item %s in slot %s', item_obj.item_id, slot_id)
+        return prev_entry
+
+    def unequip(self, slot_id):
+        """Removes the item in the slot.
+
+        Returns:
+            The [item ID, item object, quantity] list for the removed item, or
+            None if the slot was empty.
+        """
+
+        prev_entry = self._slot_mapping.pop(slot_id, None)
+        if prev_entry:
+            self._apply_item_totals(prev_entry[1], -1)
+            self._version += 1
+        return prev_entry
+
+    def clear(self):
+        for slot_id in list(self._slot_mapping):
+            self.unequip(slot_id)
+
+    @staticmethod
+    def meets_equip_requirements(item_obj, entity_obj):
+        """Returns True if the entity has the skill levels required to equip
+        the item."""
+
+        for skill_id, level in getattr(item_obj, 'required_equip_level_mapping', {}).items():
+            if (entity_obj.get_skill_level(skill_id) or 0) < level:
+                return False
+        return True
+
+
 """
 class Equipment:
     # For default equipment slot items.
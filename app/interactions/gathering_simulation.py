@@ -0,0 +1,298 @@
+"""This module contains a Monte-Carlo simulator for gathering yields.
+
+The simulator uses the same rolls as the in-game gathering action
+(Interaction.get_gathering_success_chance and
+Interaction.roll_gathering_attempt) to answer balancing questions such as
+"how many resources per hour does a level N gatherer get with tool T".
+
+simulate_gathering() plays out a single gatherer attempt by attempt with a
+seedable random.Random, the same way the game does. build_yield_table()
+runs many gatherers at once with NumPy and spreads the scenarios over a
+process pool, which makes millions of attempts take seconds.
+
+Skill levels are fixed for the duration of a simulation, so the results
+are rates at the given level. This module is meant for balancing tools.
+
+This module requires NumPy.
+"""
+
+import concurrent.futures
+import random
+
+import numpy as np
+
+from app.interactions import interaction
+from app.items import inventory
+
+MS_PER_HOUR = 3600 * 1000
+
+DEFAULT_NUM_TRIALS = 10000
+
+# Maximum number of trials to simulate in a single batch job.
+MAX_TRIALS_PER_JOB = 50000
+
+# Bounds on the number of successes per trial to lay out at a time.
+MIN_SUCCESS_BLOCK_SIZE = 32
+MAX_SUCCESS_BLOCK_SIZE = 4096
+
+
+class GatheringScenario:
+    """Parameters of a gathering scenario to simulate.
+
+    Attributes:
+        skill_level: the gatherer's level in the resource's skill.
+        min_required_level: the resource's minimum required level.
+        exhaustion_probability: chance from 0 to 1 that the resource is
+            exhausted after yielding a resource.
+        exp_per_resource: experience gained per resource.
+        tool_bonus: added success chance from the gatherer's tool.
+        respawn_time_ms: milliseconds until an exhausted resource can be
+            gathered from again.
+        inventory_capacity: number of resources the gatherer can hold.
+        banking_time_ms: milliseconds spent emptying a full inventory.
+    """
+
+    def __init__(self, skill_level, min_required_level=1, exhaustion_probability=0.0, exp_per_resource=0,
+                 tool_bonus=0.0, respawn_time_ms=0, inventory_capacity=inventory.DEFAULT_MAX_INVENT_SIZE,
+                 banking_time_ms=0):
+        self.skill_level = skill_level
+        self.min_required_level = min_required_level
+        self.exhaustion_probability = exhaustion_probability
+        self.exp_per_resource = exp_per_resource
+        self.tool_bonus = tool_bonus
+        self.respawn_time_ms = respawn_time_ms
+        self.inventory_capacity = inventory_capacity
+        self.banking_time_ms = banking_time_ms
+
+    def get_success_chance(self):
+        return interaction.Interaction.get_gathering_success_chance(
+            self.skill_level,
+            self.min_required_level,
+            tool_bonus=self.tool_bonus,
+        )
+
+
+def get_level_tool_scenarios(skill_levels, tool_bonuses, **scenario_kwargs):
+    """Returns list of GatheringScenario objects for every combination of
+    the given skill levels and tool bonuses. Other GatheringScenario
+    parameters are passed through scenario_kwargs."""
+
+    return [
+        GatheringScenario(skill_level, tool_bonus=tool_bonus, **scenario_kwargs)
+        for skill_level in skill_levels
+        for tool_bonus in tool_bonuses
+    ]
+
+
+def _get_num_interval_slots(duration_ms, interval_ms):
+    return max(0, int(duration_ms // interval_ms))
+
+
+def simulate_gathering(scenario, duration_ms=MS_PER_HOUR, seed=None):
+    """Simulates a single gatherer attempt by attempt.
+
+    Args:
+        scenario: GatheringScenario to simulate.
+        duration_ms: number of milliseconds to gather for.
+        seed: optional seed for reproducible results.
+
+    Returns:
+        Dict with the number of attempts, resources gathered, resources
+        exhausted and experience gained.
+    """
+
+    rng = random.Random(seed)
+    interval_ms = interaction.GATHERING_INTERVAL_MS
+    num_attempts = 0
+    num_resources = 0
+    num_exhausted = 0
+    num_held = 0
+    curr_time_ms = 0
+
+    while curr_time_ms + interval_ms <= duration_ms:
+        curr_time_ms += interval_ms
+        num_attempts += 1
+        gathered, exhausted = interaction.Interaction.roll_gathering_attempt(
+            rng,
+            scenario.skill_level,
+            scenario.min_required_level,
+            scenario.exhaustion_probability,
+            tool_bonus=scenario.tool_bonus,
+        )
+        if not gathered:
+            continue
+
+        num_resources += 1
+        num_held += 1
+        if exhausted:
+            num_exhausted += 1
+            curr_time_ms += scenario.respawn_time_ms
+        if num_held >= scenario.inventory_capacity:
+            num_held = 0
+            curr_time_ms += scenario.banking_time_ms
+
+    return {
+        'attempts': num_attempts,
+        'resources': num_resources,
+        'exhausted': num_exhausted,
+        'exp': num_resources * scenario.exp_per_resource,
+    }
+
+
+def _simulate_trials(success_chance, exhaustion_probability, respawn_slots, inventory_capacity, banking_slots,
+                     num_slots, num_trials, seed):
+    """Simulates num_trials gatherers of one scenario with NumPy arrays.
+
+    Time is measured in gathering interval slots, with respawn and banking
+    times rounded up to whole slots. Rather than rolling every slot, the
+    number of attempts until each success is drawn from a geometric
+    distribution, and blocks of successes are laid out on the timeline
+    with cumulative sums. Trials drop out once their next success falls
+    past the end of the simulation.
+
+    Returns:
+        Array of the number of resources gathered by each trial.
+    """
+
+    rng = np.random.default_rng(seed)
+    resources = np.zeros(num_trials, dtype=np.int64)
+    if success_chance <= 0 or num_slots <= 0:
+        return resources
+
+    # Geometric gaps are drawn by inverse transform sampling, which is
+    # much faster than Generator.geometric.
+    inv_log_failure = np.float32(1 / np.log1p(-success_chance)) if success_chance < 1 else np.float32(0)
+
+    # Size blocks to fit most trials' successes in one block.
+    mean_slots_per_success = 1 / success_chance + exhaustion_probability * respawn_slots \
+        + banking_slots / inventory_capacity
+    block_size = min(MAX_SUCCESS_BLOCK_SIZE, int(1.1 * num_slots / mean_slots_per_success) + MIN_SUCCESS_BLOCK_SIZE)
+
+    # Slot at which each active trial's next attempts begin.
+    start_slot = np.zeros(num_trials, dtype=np.int32)
+    active = np.arange(num_trials)
+
+    # Number of successes each active trial has had so far. All active
+    # trials have had the same number.
+    num_successes = 0
+
+    while len(active):
+        num_active = len(active)
+        uniform = 1 - rng.random((num_active, block_size), dtype=np.float32)
+        gaps = (np.log(uniform) * inv_log_failure).astype(np.int32) + 1
+        exhausted = rng.random((num_active, block_size), dtype=np.float32) < exhaustion_probability
+        success_numbers = np.arange(num_successes + 1, num_successes + block_size + 1)
+        banking = (success_numbers % inventory_capacity) == 0
+
+        # Delay after each success, for respawning and banking.
+        delays = (exhausted * respawn_slots + banking * banking_slots).astype(np.int32)
+        increments = gaps
+        increments[:, 1:] += delays[:, :-1]
+        success_slots = start_slot[active, None] + np.cumsum(increments, axis=1, dtype=np.int32)
+
+        within = success_slots <= num_slots
+        resources[active] += within.sum(axis=1)
+
+        # Trials with every success in the block within the simulation
+        # continue with the next block.
+        remaining = within[:, -1]
+        start_slot[active[remaining]] = success_slots[remaining, -1] + delays[remaining, -1]
+        active = active[remaining]
+        num_successes += block_size
+
+    return resources
+
+
+def _run_job(job):
+    """Runs one batch job in a worker process. job is a tuple of the
+    scenario index followed by the arguments for _simulate_trials."""
+
+    return job[0], _simulate_trials(*job[1:])
+
+
+def build_yield_table(scenarios, duration_ms=MS_PER_HOUR, num_trials=DEFAULT_NUM_TRIALS, seed=None,
+                      max_workers=None):
+    """Simulates each scenario many times and returns yield and experience
+    rates per hour.
+
+    Args:
+        scenarios: list of GatheringScenario objects.
+        duration_ms: number of milliseconds each trial gathers for.
+        num_trials: number of simulated gatherers per scenario.
+        seed: optional seed for reproducible results.
+        max_workers: maximum number of worker processes. 1 runs the jobs
+            in the current process. Defaults to the number of CPUs.
+
+    Returns:
+        List of dicts, one per scenario in the same order, with the
+        scenario, mean and percentile resources per hour, and mean
+        experience per hour.
+    """
+
+    if duration_ms <= 0 or num_trials <= 0:
+        raise Exception('Invalid simulation duration or number of trials.')
+
+    interval_ms = interaction.GATHERING_INTERVAL_MS
+    num_slots = _get_num_interval_slots(duration_ms, interval_ms)
+
+    # Split each scenario into jobs with independent random streams.
+    jobs = []
+    seed_sequence = np.random.SeedSequence(seed)
+    for index, scenario in enumerate(scenarios):
+        for start in range(0, num_trials, MAX_TRIALS_PER_JOB):
+            jobs.append((
+                index,
+                scenario.get_success_chance(),
+                scenario.exhaustion_probability,
+                -(-scenario.respawn_time_ms // interval_ms),
+                max(1, scenario.inventory_capacity),
+                -(-scenario.banking_time_ms // interval_ms),
+                num_slots,
+                min(MAX_TRIALS_PER_JOB, num_trials - start),
+                seed_sequence.spawn(1)[0],
+            ))
+
+    results = [[] for _ in scenarios]
+    if max_workers == 1:
+        for job in jobs:
+            index, resources = _run_job(job)
+            results[index].append(resources)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for index, resources in executor.map(_run_job, jobs):
+                results[index].append(resources)
+
+    hours = duration_ms / MS_PER_HOUR
+    table = []
+    for scenario, scenario_results in zip(scenarios, results):
+        resources_per_hour = np.concatenate(scenario_results) / hours
+        p10, p50, p90 = np.percentile(resources_per_hour, (10, 50, 90))
+        table.append({
+            'scenario': scenario,
+            'success_chance': scenario.get_success_chance(),
+            'resources_per_hour': float(resources_per_hour.mean()),
+            'resources_per_hour_p10': float(p10),
+            'resources_per_hour_p50': float(p50),
+            'resources_per_hour_p90': float(p90),
+            'exp_per_hour': float(resources_per_hour.mean() * scenario.exp_per_resource),
+        })
+    return table
+
+
+def format_yield_table(table):
+    """Returns the yield table from build_yield_table() as text."""
+
+    lines = ['{:>5} {:>6} {:>7} {:>9} {:>9} {:>9} {:>10}'.format(
+        'Level', 'Tool', 'Chance', 'Res/hr', 'P10', 'P90', 'Exp/hr')]
+    for row in table:
+        scenario = row['scenario']
+        lines.append('{:>5} {:>6.2f} {:>7.3f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f}'.format(
+            scenario.skill_level,
+            scenario.tool_bonus,
+            row['success_chance'],
+            row['resources_per_hour'],
+            row['resources_per_hour_p10'],
+            row['resources_per_hour_p90'],
+            row['exp_per_hour'],
+        ))
+    return '\n'.join(lines)
@@ -1,8 +1,11 @@
 import pygame
 import logging
+import random
 
 from enum import Enum
-from app.viewing import viewing
+from app.actions import actions
+from app.skills import skills
+from app.viewing import particles, viewing
 from lang import language
 from util import timekeeper
 
@@ -26,15 +29,16 @@ NOT_HIGH_ENOUGH_LEVEL_MESSAGE_INFO = language.MultiLanguageText(
 
 # Number of milliseconds in a gathering skilling interval.
 GATHERING_INTERVAL_MS = 1000
-GATHERING_INTERVAL_NUM_TICKS = int(
-    timekeeper.TICKS_PER_SECOND * (GATHERING_INTERVAL_MS / timekeeper.MS_PER_SECOND)
-)
+
+# Chance for a gathering attempt to yield a resource at the resource's
+# minimum required level, the added chance for each level above it, and
+# the highest chance possible.
+GATHERING_BASE_SUCCESS_CHANCE = 0.5
+GATHERING_SUCCESS_CHANCE_PER_LEVEL = 0.005
+GATHERING_MAX_SUCCESS_CHANCE = 0.95
 
 # Number of milliseconds between switching character gathering image IDs.
 GATHERING_IMAGE_INTERVAL_MS = int(timekeeper.MS_PER_SECOND / 4)
-GATHERING_IMAGE_INTERVAL_NUM_TICKS = int(
-    timekeeper.TICKS_PER_SECOND * (GATHERING_IMAGE_INTERVAL_MS / timekeeper.MS_PER_SECOND)
-)
 
 # Number of game ticks to hold the resource gather message.
 NUM_TICK_HOLD_RESOURCE_GATHER_MESSAGE = int(timekeeper.TICKS_PER_SECOND * 2)
@@ -60,10 +64,115 @@ class InteractionID(Enum):
     HERBLORE_GATHER = 0x300051
 
 
+# Messages to display while gathering. {0} is the resource name.
+GATHERING_MAIN_MESSAGES = {
+    InteractionID.CHOP_TREE: language.MultiLanguageText(
+        en="You swing your axe at the {0}.",
+        es="Empiezas a talar el {0}.",
+    ),
+    InteractionID.MINE_ROCK: language.MultiLanguageText(
+        en="You swing your pickaxe at the {0}.",
+        es="Empiezas a picar la {0}.",
+    ),
+    InteractionID.CATCH_FISH_ROD: language.MultiLanguageText(
+        en="You cast your line into the {0}.",
+        es="Echas tu caña en el {0}.",
+    ),
+}
+
+# Messages to display when the resource is exhausted. {0} is the resource name.
+GATHERING_RESOURCE_EXHAUST_MESSAGES = {
+    InteractionID.CHOP_TREE: language.MultiLanguageText(
+        en="The {0} has been cut down.",
+        es="El {0} ha sido talado.",
+    ),
+    InteractionID.MINE_ROCK: language.MultiLanguageText(
+        en="The {0} has been depleted.",
+        es="La {0} se ha agotado.",
+    ),
+    InteractionID.CATCH_FISH_ROD: language.MultiLanguageText(
+        en="The fish have moved on.",
+        es="Los peces se han ido.",
+    ),
+}
+
+# Messages to display when gaining a resource. {0} is the item name, {1} is
+# the experience gained.
+GATHERING_RESOURCE_GAIN_MESSAGES = {
+    InteractionID.CHOP_TREE: language.MultiLanguageText(
+        en="You get some {0}. ({1} exp)",
+        es="Consigues {0}. ({1} exp)",
+    ),
+    InteractionID.MINE_ROCK: language.MultiLanguageText(
+        en="You mine some {0}. ({1} exp)",
+        es="Consigues {0}. ({1} exp)",
+    ),
+    InteractionID.CATCH_FISH_ROD: language.MultiLanguageText(
+        en="You catch a {0}. ({1} exp)",
+        es="Pescas un {0}. ({1} exp)",
+    ),
+}
+
+# Particle effects to emit from the resource while gathering.
+GATHERING_PARTICLE_EFFECTS = {
+    InteractionID.CHOP_TREE: particles.ParticleEffectID.WOOD_CHIPS,
+    InteractionID.MINE_ROCK: particles.ParticleEffectID.ROCK_DUST,
+}
+
+
 class Interaction:
     # Maps interaction IDs to methods
     interaction_mapping = {}
 
+    # Random number generator for gathering rolls. Seed it with
+    # set_gathering_seed() for reproducible gathering.
+    gathering_rng = random.Random()
+
+    @classmethod
+    def set_gathering_seed(cls, seed):
+        cls.gathering_rng = random.Random(seed)
+
+    @staticmethod
+    def get_gathering_success_chance(skill_level, min_required_level, tool_bonus=0.0):
+        """Returns the chance from 0 to 1 that a gathering attempt yields a
+        resource.
+
+        Args:
+            skill_level: the gatherer's level in the resource's skill.
+            min_required_level: the resource's minimum required level.
+            tool_bonus: added chance from the gatherer's tool.
+        """
+
+        chance = GATHERING_BASE_SUCCESS_CHANCE \
+            + GATHERING_SUCCESS_CHANCE_PER_LEVEL * max(0, skill_level - min_required_level) \
+            + tool_bonus
+        return min(GATHERING_MAX_SUCCESS_CHANCE, max(0.0, chance))
+
+    @staticmethod
+    def roll_gathering_attempt(rng, skill_level, min_required_level, exhaustion_probability, tool_bonus=0.0):
+        """Rolls a single gathering attempt.
+
+        This is the random part of gathering, kept free of game state so
+        that simulations can use it directly.
+
+        Args:
+            rng: random.Random object to roll with.
+            skill_level: the gatherer's level in the resource's skill.
+            min_required_level: the resource's minimum required level.
+            exhaustion_probability: chance from 0 to 1 that the resource is
+                exhausted after yielding a resource.
+            tool_bonus: added success chance from the gatherer's tool.
+
+        Returns:
+            Tuple (gathered, exhausted) of booleans. exhausted can only be
+            True if gathered is True.
+        """
+
+        success_chance = Interaction.get_gathering_success_chance(skill_level, min_required_level, tool_bonus)
+        if rng.random() >= success_chance:
+            return False, False
+        return True, rng.random() < exhaustion_probability
+
     @classmethod
     def default_interaction(cls, interaction_id, game_object, acting_object, target_object, acting_object_loc,
                             target_object_loc):
@@ -111,8 +220,32 @@ class Interaction:
     def gathering_interaction(cls, interaction_id, game_object, acting_object, target_object, acting_object_loc,
                               target_object_loc, main_skilling_text, skill_id, resource_exhaust_text=None,
                               intro_skilling_text=None):
+        """Starts a gathering action for the acting object on the target
+        resource object.
+
+        The gathering itself runs as an action on the game object's action
+        scheduler, so the overworld keeps updating while the acting object
+        gathers. Pressing one of SKILLING_EXIT_KEYS cancels the action.
 
+        Args:
+            interaction_id: InteractionID for the gathering interaction.
+            game_object: the Application object.
+            acting_object: the Entity that is gathering.
+            target_object: the resource object being gathered from.
+            acting_object_loc: tile location of the acting object.
+            target_object_loc: bottom left tile location of the target object.
+            main_skilling_text: text to display while gathering.
+            skill_id: SkillID for the skill that gains experience.
+            resource_exhaust_text: text to display when the resource is
+                exhausted.
+            intro_skilling_text: optional text to display before gathering.
+
+        Returns:
+            The actions.Action for the gathering, or None if gathering
+            did not start.
         """
+
+        ret_action = None
         if (game_object and game_object.overworld_viewing and acting_object and target_object and acting_object_loc
                 and target_object_loc and (interaction_id is not None) and main_skilling_text
                 and (skill_id is not None)):
@@ -121,281 +254,242 @@ class Interaction:
             if acting_object.inventory_full():
                 # Inventory is full.
                 cls.display_inventory_full_message(game_object)
-            elif not Interaction.meets_resource_level(
-                    acting_object,
-                    target_object
-                ):
+            elif not Interaction.meets_resource_level(acting_object, target_object):
                 # Don't have a high enough level.
-                min_required_level = target_object.min_required_level
-                skill_name = skills.get_skill_name(
-                    target_object.related_skill_id,
-                    language.Language.current_language_id
+                reject_message = NOT_HIGH_ENOUGH_LEVEL_MESSAGE_INFO.get_text().format(
+                    target_object.min_required_level,
+                    skills.Skill.get_skill_name(target_object.related_skill_id),
                 )
 
-                reject_message = NOT_HIGH_ENOUGH_LEVEL_MESSAGE_INFO.get(
-                    language.Language.current_language_id,
-                    ""
-                ).format(min_required_level, skill_name)
-
                 game_object.display_overworld_bottom_text(
                     reject_message,
                     auto_advance=False,
-                    advance_delay_ms=viewingdata.DEFAULT_ADVANCE_DELAY_MS,
+                    advance_delay_ms=viewing.ViewingTime.DEFAULT_ADVANCE_DELAY_MS,
                     refresh_after=True,
                     refresh_during=True,
                 )
-            # TODO equipment check
             else:
                 # Display intro skilling text if needed.
                 if intro_skilling_text:
                     game_object.display_overworld_bottom_text(
                         intro_skilling_text,
                         auto_advance=False,
-                        advance_delay_ms=viewingdata.DEFAULT_ADVANCE_DELAY_MS,
+                        advance_delay_ms=viewing.ViewingTime.DEFAULT_ADVANCE_DELAY_MS,
                         refresh_after=True,
                         refresh_during=True,
                     )
 
-                # Display main skilling text. Pause before we start skilling.
+                # Only one skilling action at a time for the acting object.
+                game_object.action_scheduler.cancel_owned_by(acting_object)
+
+                logging.info("Beginning gathering.")
+                pygame.event.clear()
+                ret_action = game_object.action_scheduler.start(
+                    cls._gathering_action(
+                        interaction_id,
+                        game_object,
+                        acting_object,
+                        target_object,
+                        target_object_loc,
+                        main_skilling_text,
+                        skill_id,
+                        resource_exhaust_text=resource_exhaust_text,
+                    ),
+                    name='gathering {0}'.format(interaction_id),
+                    owner=acting_object,
+                    cancel_keys=SKILLING_EXIT_KEYS,
+                )
+        return ret_action
+
+    @classmethod
+    def _gathering_action(cls, interaction_id, game_object, acting_object, target_object, target_object_loc,
+                          main_skilling_text, skill_id, resource_exhaust_text=None):
+        """Generator action for gathering from a resource until the resource
+        is exhausted, the inventory is full, the acting object levels up, or
+        the action is cancelled."""
+
+        # Imported here since the items module depends on this module.
+        from app.items import items
+
+        prev_sequence_id = acting_object.curr_image_sequence_id
+
+        try:
+            # Display main skilling text. Pause before we start skilling.
+            game_object.display_overworld_bottom_text_first_page(
+                main_skilling_text,
+                auto_advance=True,
+                advance_delay_ms=0,
+                refresh_after=False,
+                refresh_during=False,
+            )
+            curr_time_ms = yield actions.Wait(GATHERING_START_DELAY_MS)
+
+            next_gather_time_ms = curr_time_ms + GATHERING_INTERVAL_MS
+            next_image_time_ms = curr_time_ms + GATHERING_IMAGE_INTERVAL_MS
+            skilling = True
+
+            while skilling:
+                # Keep the skilling text on top of the reblitted overworld.
                 game_object.display_overworld_bottom_text_first_page(
                     main_skilling_text,
                     auto_advance=True,
-                    advance_delay_ms=GATHERING_START_DELAY_MS,
+                    advance_delay_ms=0,
                     refresh_after=False,
-                    refresh_during=False
+                    refresh_during=False,
                 )
 
-                logging.info("Beginning gathering.")
+                curr_time_ms = yield actions.NEXT_FRAME
 
-                # Start skilling.
-                skilling = True
-                resource_exhausted = False
-                num_skill_ticks = 0
-                image_id_index = 0
-                pygame.event.clear()
-                prev_sequence = acting_object.curr_image_sequence
+                # TODO set next character image ID for skilling.
+                if curr_time_ms >= next_image_time_ms:
+                    next_image_time_ms = curr_time_ms + GATHERING_IMAGE_INTERVAL_MS
+                    logging.debug("Switch image IDs here.")
 
-                while skilling and not resource_exhausted:
-                    timekeeper.Timekeeper.tick()
+                    effect_id = GATHERING_PARTICLE_EFFECTS.get(interaction_id, None)
+                    if effect_id and game_object.curr_map:
+                        particles.Particles.emit_effect_at_tile(
+                            game_object.curr_map,
+                            effect_id,
+                            target_object_loc,
+                            width_in_tiles=target_object.collision_width,
+                        )
 
-                    num_skill_ticks = num_skill_ticks + 1
+                # Chance to generate a resource after every gathering
+                # interval.
+                if curr_time_ms < next_gather_time_ms:
+                    continue
+                next_gather_time_ms = curr_time_ms + GATHERING_INTERVAL_MS
+
+                # Check if we have generated a resource. TODO tool bonus
+                # from equipment.
+                skill_level = acting_object.get_skill_level(target_object.related_skill_id)
+                gathered, exhausted = cls.roll_gathering_attempt(
+                    cls.gathering_rng,
+                    skill_level,
+                    target_object.min_required_level,
+                    target_object.exhaustion_probability,
+                )
+                if not gathered:
+                    continue
 
-                    # TODO set next character image ID for skilling.
-                    if (num_skill_ticks \
-                            % GATHERING_IMAGE_INTERVAL_NUM_TICKS) == 0:
-                        logging.debug("Switch image IDs here.")
-                        game_object.refresh_and_blit_overworld_viewing(
-                            display_update=False
-                        )
-                    elif (num_skill_ticks \
-                            % timekeeper.REFRESH_INTERVAL_NUM_TICKS) == 0:
-                        # Refresh and reblit overworld.
-                        game_object.refresh_and_blit_overworld_viewing(
-                            display_update=False
+                # We generated a resource.
+                logging.info("Gathered resource!")
+
+                resource_gather_text = None
+                gained_resource = None
+                resource_exp = None
+                resource_exhausted = False
+
+                # Determine which resource we obtained.
+                resource_item_info = target_object.select_resource_item_info(skill_level, rng=cls.gathering_rng)
+                logging.info("Resource item info: %s", resource_item_info)
+
+                if resource_item_info:
+                    gained_resource = items.Item.get_item(resource_item_info[0])
+                    # TODO handle cases of boosted exp?
+                    resource_exp = resource_item_info[1]
+
+                if gained_resource:
+                    gain_message_info = GATHERING_RESOURCE_GAIN_MESSAGES.get(interaction_id, None)
+                    if gain_message_info:
+                        resource_gather_text = gain_message_info.get_text().format(
+                            gained_resource.get_name(),
+                            resource_exp,
                         )
-                    elif (num_skill_ticks \
-                            % timekeeper.OW_REBLIT_INTERVAL_NUM_TICKS) == 0:
-                        game_object.overworld_viewing.blit_self()
 
-                    # This will update display for us.
+                    # Add item to inventory.
+                    acting_object.add_item_to_inventory(gained_resource.item_id)
+
+                    # Check if resource has been exhausted.
+                    if exhausted:
+                        skilling = False
+                        resource_exhausted = True
+                        logging.info("Resource exhausted.")
+
+                        # Set respawn.
+                        game_object.set_object_respawn(target_object, target_object_loc)
+
+                    game_object.refresh_and_blit_overworld_viewing()
+
+                # Display the resource gather message.
+                if resource_gather_text:
                     game_object.display_overworld_bottom_text_first_page(
-                        main_skilling_text,
-                        auto_advance=True,
-                        advance_delay_ms=0,
-                        refresh_after=False,
-                        refresh_during=False,
+                        resource_gather_text,
+                        auto_advance=False,
+                        refresh_after=True,
+                        refresh_during=True,
                     )
 
-                    # Check if user is ending early by pressing a valid key.
-                    exit_key_pressed = False
-                    for events in pygame.event.get():
-                        if events.type == pygame.QUIT:
-                            logging.info("Quitting.")
-                            pygame.quit()
-                            sys.exit(0)
-                        elif events.type == pygame.KEYDOWN:
-                            if events.key in SKILLING_EXIT_KEYS:
-                                logging.info("Quitting gathering early.")
-                                exit_key_pressed = True
-
-                    if exit_key_pressed:
-                        skilling = False
+                # This will display level up message if needed.
+                levels_gained = game_object.gain_experience(acting_object, skill_id, resource_exp)
 
-                    # Chance to generate a resource after every gathering
-                    # interval.
-                    elif (num_skill_ticks \
-                            % GATHERING_INTERVAL_NUM_TICKS) == 0:
-                        # Check if we have generated a resource.
-                        # (for now, just use strict probability. later,
-                        # implement function that determines generation based on
-                        # resource required level and character level and
-                        # character equipment)
-                        #if random.randint(0,4) == 0:
-                        if random.randint(0,1) == 0:
-                            # We generated a resource.
-                            logging.info("Gathered resource!")
-
-                            # Determine which resource we obtained.
-                            resource_gather_text = None
-                            gained_resource = None
-                            resource_exp = None
-
-                            resource_item_info = \
-                                target_object.select_resource_item_info(
-                                    acting_object.get_skill_level(
-                                        target_object.related_skill_id
-                                    )
-                                )
-
-                            logging.info(
-                                "Resource item info: %s",
-                                resource_item_info,
-                            )
-
-                            if resource_item_info:
-                                gained_resource = items.Item.get_item(
-                                    resource_item_info[0]
-                                )
-                                # TODO handle cases of boosted exp?
-                                resource_exp = resource_item_info[1]
-
-                            if gained_resource:
-                                resource_gather_text = \
-                                    interactiondata.GATHERING_RESOURCE_GAIN_MESSAGES.get(
-                                        interaction_id,
-                                        {}
-                                    ).get(
-                                        language.Language.current_language_id,
-                                        ""
-                                    ).format(
-                                        gained_resource.get_name(),
-                                        resource_exp
-                                    )
-
-                                # Add item to inventory.
-                                acting_object.add_item_to_inventory(
-                                    gained_resource.item_id
-                                )
-
-                                # Check if resource has been exhausted.
-                                if random.randint(0, 100) < int(
-                                            100 \
-                                            * target_object.exhaustion_probability
-                                        ):
-                                    # Resource has been exhausted.
-                                    skilling = False
-                                    resource_exhausted = True
-                                    logging.info("Resource exhausted.")
-
-                                    # Set respawn.
-                                    game_object.set_object_respawn(
-                                        target_object,
-                                        target_object_loc,
-                                    )
-
-                                game_object.refresh_and_blit_overworld_viewing()
-
-                            # Display the resource gather message.
-                            if resource_gather_text:
-                                game_object.display_overworld_bottom_text_first_page(
-                                    resource_gather_text,
-                                    auto_advance=False,
-                                    refresh_after=True,
-                                    refresh_during=True,
-                                )
-                            else:
-                                game_object.refresh_and_blit_overworld_viewing()
-
-                            # This will display level up message if needed.
-                            levels_gained = game_object.gain_experience(
-                                acting_object,
-                                skill_id,
-                                resource_exp,
-                            )
-
-                            # Stop skilling if we level up.
-                            if levels_gained and levels_gained > 0:
-                                skilling = False
-
-                            if resource_exhausted:
-                                # Display exhaust message.
-                                game_object.display_overworld_bottom_text_first_page(
-                                    resource_exhaust_text,
-                                    auto_advance=False,
-                                    advance_delay_ms=GATHERING_EXHAUST_DELAY_MS,
-                                    refresh_after=True,
-                                    refresh_during=True,
-                                )
-
-                                #game_object.refresh_and_blit_overworld_viewing()
-
-                            if skilling and acting_object.inventory_full():
-                                # Inventory is full.
-                                skilling = False
-                                cls.display_inventory_full_message()
-                                game_object.refresh_and_blit_overworld_viewing()
-
-        pygame.event.clear()
-
-        acting_object.curr_image_sequence = prev_sequence_id
-
-        # Update overworld and display.
-        game_object.refresh_and_blit_overworld_viewing()
-        pygame.display.update()
-        """
-        logging.info("Place gathering interaction here.")
+                # Stop skilling if we level up.
+                if levels_gained and levels_gained > 0:
+                    skilling = False
+
+                if resource_exhausted and resource_exhaust_text:
+                    # Display exhaust message.
+                    game_object.display_overworld_bottom_text_first_page(
+                        resource_exhaust_text,
+                        auto_advance=False,
+                        advance_delay_ms=GATHERING_EXHAUST_DELAY_MS,
+                        refresh_after=True,
+                        refresh_during=True,
+                    )
+
+                if skilling and acting_object.inventory_full():
+                    # Inventory is full.
+                    skilling = False
+                    cls.display_inventory_full_message(game_object)
+
+                # Don't count time spent on messages towards the next roll.
+                next_gather_time_ms = max(next_gather_time_ms, pygame.time.get_ticks() + GATHERING_INTERVAL_MS)
+        finally:
+            # Runs on completion and on cancellation.
+            pygame.event.clear()
+            acting_object.curr_image_sequence_id = prev_sequence_id
+
+            # Update overworld and display.
+            game_object.refresh_and_blit_overworld_viewing()
+            logging.info("Finished gathering.")
 
     @classmethod
-    def chop_tree_interaction(
-            cls,
-            # interaction_id,
-            game_object,
-            acting_object,
-            target_object,
-            acting_object_loc,
-            target_object_loc,
-    ):
+    def _resource_gathering_interaction(cls, interaction_id, skill_id, game_object, acting_object, target_object,
+                                        acting_object_loc, target_object_loc):
+        """Starts gathering using the standard messages for interaction_id."""
+
+        if game_object and acting_object and target_object and acting_object_loc and target_object_loc:
+            if not target_object.is_resource():
+                # No resource data to gather from.
+                logging.warning("Object {0} has no resource data.".format(target_object.object_id))
+                cls.default_interaction(
+                    interaction_id,
+                    game_object,
+                    acting_object,
+                    target_object,
+                    acting_object_loc,
+                    target_object_loc,
+                )
+                return
 
-        """
-        if game_object and acting_object \
-                and target_object and acting_object_loc and target_object_loc:
             obj_name = target_object.get_name()
-
-            main_skilling_text = interactiondata.GATHERING_MAIN_MESSAGES.get(
-                #interaction_id,
-                interactiondata.CHOP_TREE_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
-
-            resource_exhaust_text = interactiondata.GATHERING_RESOURCE_EXHAUST_MESSAGES.get(
-                #interaction_id,
-                interactiondata.CHOP_TREE_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
+            main_skilling_text = GATHERING_MAIN_MESSAGES[interaction_id].get_text().format(obj_name)
+            resource_exhaust_text = GATHERING_RESOURCE_EXHAUST_MESSAGES[interaction_id].get_text().format(obj_name)
 
             cls.gathering_interaction(
-                #interaction_id,
-                interactiondata.CHOP_TREE_ID,
+                interaction_id,
                 game_object,
                 acting_object,
                 target_object,
                 acting_object_loc,
                 target_object_loc,
                 main_skilling_text,
-                skills.SKILL_ID_WOODCUTTING,
+                skill_id,
                 resource_exhaust_text=resource_exhaust_text,
             )
-        """
-        logging.info("Place chopping interaction here.")
 
     @classmethod
-    def mine_rock_interaction(
+    def chop_tree_interaction(
             cls,
             # interaction_id,
             game_object,
@@ -404,44 +498,35 @@ class Interaction:
             acting_object_loc,
             target_object_loc,
     ):
+        cls._resource_gathering_interaction(
+            InteractionID.CHOP_TREE,
+            skills.SkillID.WOODCUTTING,
+            game_object,
+            acting_object,
+            target_object,
+            acting_object_loc,
+            target_object_loc,
+        )
 
-        """
-        if game_object and acting_object \
-                and target_object and acting_object_loc and target_object_loc:
-            obj_name = target_object.get_name()
-
-            main_skilling_text = interactiondata.GATHERING_MAIN_MESSAGES.get(
-                #interaction_id,
-                interactiondata.MINE_ROCK_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
-
-            resource_exhaust_text = interactiondata.GATHERING_RESOURCE_EXHAUST_MESSAGES.get(
-                #interaction_id,
-                interactiondata.MINE_ROCK_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
-
-            cls.gathering_interaction(
-                #interaction_id,
-                interactiondata.MINE_ROCK_ID,
-                game_object,
-                acting_object,
-                target_object,
-                acting_object_loc,
-                target_object_loc,
-                main_skilling_text,
-                skills.SKILL_ID_MINING,
-                resource_exhaust_text=resource_exhaust_text,
-            )
-        """
-        logging.info("Place mining interaction here.")
+    @classmethod
+    def mine_rock_interaction(
+            cls,
+            # interaction_id,
+            game_object,
+            acting_object,
+            target_object,
+            acting_object_loc,
+            target_object_loc,
+    ):
+        cls._resource_gathering_interaction(
+            InteractionID.MINE_ROCK,
+            skills.SkillID.MINING,
+            game_object,
+            acting_object,
+            target_object,
+            acting_object_loc,
+            target_object_loc,
+        )
 
     @classmethod
     def fishing_rod_interaction(
@@ -453,44 +538,15 @@ class Interaction:
             acting_object_loc,
             target_object_loc,
     ):
-
-        """
-        if game_object and acting_object \
-                and target_object and acting_object_loc and target_object_loc:
-            obj_name = target_object.get_name()
-
-            main_skilling_text = interactiondata.GATHERING_MAIN_MESSAGES.get(
-                #interaction_id,
-                interactiondata.CATCH_FISH_ROD_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
-
-            resource_exhaust_text = interactiondata.GATHERING_RESOURCE_EXHAUST_MESSAGES.get(
-                #interaction_id,
-                interactiondata.CATCH_FISH_ROD_ID,
-                {}
-            ).get(
-                language.Language.current_language_id,
-                ""
-            ).format(obj_name)
-
-            cls.gathering_interaction(
-                interactiondata.CATCH_FISH_ROD_ID,
-                game_object,
-                acting_object,
-                target_object,
-                acting_object_loc,
-                target_object_loc,
-                main_skilling_text,
-                skills.SKILL_ID_FISHING,
-                resource_exhaust_text=resource_exhaust_text,
-            )
-        """
-
-        logging.info("Place fishing rod  interaction here.")
+        cls._resource_gathering_interaction(
+            InteractionID.CATCH_FISH_ROD,
+            skills.SkillID.FISHING,
+            game_object,
+            acting_object,
+            target_object,
+            acting_object_loc,
+            target_object_loc,
+        )
 
     @classmethod
     def fishing_net_interaction(
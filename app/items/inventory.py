@@ -58,6 +58,7 @@ class Inventory(item_listing.ItemListing):
                     item_obj.get_name(),
                     old_quantity - self.get_item_quantity(item_id)
                 ))
+                self.notify_item_changed(item_id)
             else:
                 logging.error("Trying to remove invalid item ID from inventory.".format(item_id))
 
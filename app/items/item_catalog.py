@@ -0,0 +1,324 @@
+"""This module contains the indexed item catalog.
+
+Each item in the catalog gets a position, and sets of items are
+represented as bitmaps (Python ints) where bit N is set if the item at
+position N is in the set. The catalog keeps:
+- a bitmap per item property flag bit (see items.ItemProperties),
+- a bitmap per equipment slot ID,
+- value indexes on base_value_low and base_value_high, which are sorted
+  lists with precomputed bitmaps for each block of the sorted order.
+
+Compound queries, such as all sellable cookable items under a value,
+are then a few bitwise operations on the bitmaps instead of a scan of
+every item.
+"""
+
+import bisect
+import logging
+
+# Item attributes with value indexes.
+VALUE_LOW_FIELD = 'base_value_low'
+VALUE_HIGH_FIELD = 'base_value_high'
+VALUE_FIELDS = (VALUE_LOW_FIELD, VALUE_HIGH_FIELD)
+
+# Number of sorted value index entries per precomputed bitmap block.
+VALUE_INDEX_BLOCK_SIZE = 64
+
+# Maps each byte value to the positions of its set bits.
+_BYTE_BIT_POSITIONS = [tuple(i for i in range(8) if (byte >> i) & 1) for byte in range(256)]
+
+
+def get_bit_positions(bitmap):
+    """Returns list of the positions of the set bits in the bitmap, in
+    increasing order."""
+
+    positions = []
+    if bitmap <= 0:
+        return positions
+
+    byte_data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(byte_data):
+        if byte:
+            base = byte_index * 8
+            positions.extend(base + bit for bit in _BYTE_BIT_POSITIONS[byte])
+    return positions
+
+
+def count_bits(bitmap):
+    """Returns the number of set bits in the bitmap."""
+
+    return bin(bitmap).count('1') if bitmap > 0 else 0
+
+
+class ValueIndex:
+    """Sorted index of an integer item attribute.
+
+    Range queries return a bitmap of item positions. The index keeps a
+    prefix bitmap for every VALUE_INDEX_BLOCK_SIZE entries of the sorted
+    order, so a range bitmap is one XOR of two prefixes plus fewer than
+    two blocks of individual bits.
+    """
+
+    def __init__(self):
+        # Sorted list of (value, position) tuples.
+        self._entries = []
+
+        # Maps positions to their indexed values.
+        self._position_values = {}
+
+        # Values and positions of the sorted entries, and the prefix
+        # bitmaps. Rebuilt on the first query after a change.
+        self._values = []
+        self._positions = []
+        self._prefix_bitmaps = [0]
+        self._dirty = False
+
+    def add(self, value, position):
+        self.remove(position)
+        self._position_values[position] = value
+        bisect.insort(self._entries, (value, position))
+        self._dirty = True
+
+    def remove(self, position):
+        value = self._position_values.pop(position, None)
+        if value is None:
+            return
+        index = bisect.bisect_left(self._entries, (value, position))
+        if index < len(self._entries) and self._entries[index] == (value, position):
+            self._entries.pop(index)
+            self._dirty = True
+
+    def _rebuild(self):
+        self._values = [entry[0] for entry in self._entries]
+        self._positions = [entry[1] for entry in self._entries]
+
+        # prefix_bitmaps[k] holds the first k blocks of the sorted order.
+        self._prefix_bitmaps = [0]
+        curr_bitmap = 0
+        for start in range(0, len(self._positions), VALUE_INDEX_BLOCK_SIZE):
+            for position in self._positions[start:start + VALUE_INDEX_BLOCK_SIZE]:
+                curr_bitmap |= 1 << position
+            self._prefix_bitmaps.append(curr_bitmap)
+        self._dirty = False
+
+    def _get_prefix_bitmap(self, end_index):
+        """Returns bitmap of the first end_index entries of the sorted
+        order."""
+
+        block = end_index // VALUE_INDEX_BLOCK_SIZE
+        bitmap = self._prefix_bitmaps[block]
+        for position in self._positions[block * VALUE_INDEX_BLOCK_SIZE:end_index]:
+            bitmap |= 1 << position
+        return bitmap
+
+    def get_range_bitmap(self, min_value=None, max_value=None):
+        """Returns bitmap of the positions with min_value <= value <=
+        max_value. None leaves that side of the range open."""
+
+        if self._dirty:
+            self._rebuild()
+
+        start_index = 0 if min_value is None else bisect.bisect_left(self._values, min_value)
+        end_index = len(self._values) if max_value is None else bisect.bisect_right(self._values, max_value)
+        if start_index >= end_index:
+            return 0
+        return self._get_prefix_bitmap(end_index) ^ self._get_prefix_bitmap(start_index)
+
+
+class ItemCatalog:
+    """Indexes the items in the item listing for fast queries.
+
+    The user should not generate ItemCatalog objects, as the class is
+    primarily for class methods and class-level indexes. Items are added
+    automatically by Item.add_item_to_listing.
+    """
+
+    # Maps item IDs to positions, and positions to items.
+    _item_positions = {}
+    _items = []
+
+    # Positions that no longer hold an item, for reuse.
+    _free_positions = []
+
+    # Bitmap of all positions holding an item.
+    _all_bitmap = 0
+
+    # Maps each single-bit property flag to the bitmap of items with it.
+    _flag_bitmaps = {}
+
+    # Maps equipment slot IDs to the bitmap of items for the slot.
+    _slot_bitmaps = {}
+
+    _value_indexes = {field: ValueIndex() for field in VALUE_FIELDS}
+
+    @classmethod
+    def add_item(cls, item_obj):
+        """Adds the item to the catalog indexes, replacing any item with
+        the same item ID."""
+
+        if item_obj is None or item_obj.item_id is None:
+            return
+
+        cls.remove_item(item_obj.item_id)
+
+        if cls._free_positions:
+            position = cls._free_positions.pop()
+            cls._items[position] = item_obj
+        else:
+            position = len(cls._items)
+            cls._items.append(item_obj)
+        cls._item_positions[item_obj.item_id] = position
+
+        position_bit = 1 << position
+        cls._all_bitmap |= position_bit
+
+        properties = item_obj.properties or 0
+        while properties:
+            flag = properties & -properties
+            cls._flag_bitmaps[flag] = cls._flag_bitmaps.get(flag, 0) | position_bit
+            properties ^= flag
+
+        slot_id = getattr(item_obj, 'equipment_slot_id', None)
+        cls._slot_bitmaps[slot_id] = cls._slot_bitmaps.get(slot_id, 0) | position_bit
+
+        for field, value_index in cls._value_indexes.items():
+            value_index.add(getattr(item_obj, field, 0) or 0, position)
+
+    @classmethod
+    def remove_item(cls, item_id):
+        """Removes the item with the given ID from the catalog indexes."""
+
+        position = cls._item_positions.pop(item_id, None)
+        if position is None:
+            return
+
+        clear_mask = ~(1 << position)
+        cls._all_bitmap &= clear_mask
+        for flag in cls._flag_bitmaps:
+            cls._flag_bitmaps[flag] &= clear_mask
+        for slot_id in cls._slot_bitmaps:
+            cls._slot_bitmaps[slot_id] &= clear_mask
+        for value_index in cls._value_indexes.values():
+            value_index.remove(position)
+
+        cls._items[position] = None
+        cls._free_positions.append(position)
+
+    @classmethod
+    def clear(cls):
+        cls._item_positions = {}
+        cls._items = []
+        cls._free_positions = []
+        cls._all_bitmap = 0
+        cls._flag_bitmaps = {}
+        cls._slot_bitmaps = {}
+        cls._value_indexes = {field: ValueIndex() for field in VALUE_FIELDS}
+
+    @classmethod
+    def get_num_items(cls):
+        return len(cls._item_positions)
+
+    @classmethod
+    def get_flags_bitmap(cls, all_flags=0, any_flags=0, no_flags=0):
+        """Returns bitmap of the items matching the property flags.
+
+        Args:
+            all_flags: items must have every one of these flags.
+            any_flags: if nonzero, items must have at least one of these
+                flags.
+            no_flags: items must have none of these flags.
+        """
+
+        bitmap = cls._all_bitmap
+        for flag_bitmap in cls._get_flag_bitmaps(all_flags):
+            bitmap &= flag_bitmap
+        if any_flags:
+            any_bitmap = 0
+            for flag_bitmap in cls._get_flag_bitmaps(any_flags):
+                any_bitmap |= flag_bitmap
+            bitmap &= any_bitmap
+        for flag_bitmap in cls._get_flag_bitmaps(no_flags):
+            bitmap &= ~flag_bitmap
+        return bitmap
+
+    @classmethod
+    def _get_flag_bitmaps(cls, flags):
+        while flags:
+            flag = flags & -flags
+            yield cls._flag_bitmaps.get(flag, 0)
+            flags ^= flag
+
+    @classmethod
+    def get_slot_bitmap(cls, *slot_ids):
+        """Returns bitmap of the items for any of the equipment slot IDs."""
+
+        bitmap = 0
+        for slot_id in slot_ids:
+            bitmap |= cls._slot_bitmaps.get(slot_id, 0)
+        return bitmap
+
+    @classmethod
+    def get_value_bitmap(cls, field, min_value=None, max_value=None):
+        """Returns bitmap of the items whose value field is in the inclusive
+        range. field is VALUE_LOW_FIELD or VALUE_HIGH_FIELD."""
+
+        value_index = cls._value_indexes.get(field, None)
+        if not value_index:
+            raise Exception('No value index for field {}'.format(field))
+        return value_index.get_range_bitmap(min_value=min_value, max_value=max_value)
+
+    @classmethod
+    def query_bitmap(cls, all_flags=0, any_flags=0, no_flags=0, equipment_slots=None, value_low_range=None,
+                     value_high_range=None):
+        """Returns bitmap of the items matching all the given conditions.
+
+        Args:
+            all_flags: items must have every one of these property flags.
+            any_flags: if nonzero, items must have at least one of these
+                property flags.
+            no_flags: items must have none of these property flags.
+            equipment_slots: optional iterable of equipment slot IDs that
+                items must be for one of.
+            value_low_range: optional (min, max) inclusive range for
+                base_value_low. Either end can be None.
+            value_high_range: optional (min, max) inclusive range for
+                base_value_high. Either end can be None.
+        """
+
+        bitmap = cls.get_flags_bitmap(all_flags=all_flags, any_flags=any_flags, no_flags=no_flags)
+        if bitmap and equipment_slots is not None:
+            bitmap &= cls.get_slot_bitmap(*equipment_slots)
+        if bitmap and value_low_range:
+            bitmap &= cls.get_value_bitmap(VALUE_LOW_FIELD, *value_low_range)
+        if bitmap and value_high_range:
+            bitmap &= cls.get_value_bitmap(VALUE_HIGH_FIELD, *value_high_range)
+        return bitmap
+
+    @classmethod
+    def get_items_from_bitmap(cls, bitmap):
+        """Returns list of the items in the bitmap, in catalog order."""
+
+        return [cls._items[position] for position in get_bit_positions(bitmap)]
+
+    @classmethod
+    def query(cls, **query_kwargs):
+        """Returns list of the items matching the conditions. Takes the same
+        arguments as query_bitmap."""
+
+        return cls.get_items_from_bitmap(cls.query_bitmap(**query_kwargs))
+
+    @classmethod
+    def query_count(cls, **query_kwargs):
+        """Returns the number of items matching the conditions. Takes the
+        same arguments as query_bitmap."""
+
+        return count_bits(cls.query_bitmap(**query_kwargs))
+
+    @classmethod
+    def log_summary(cls):
+        logging.info(
+            'Item catalog has %d items, %d flag indexes and %d slot indexes.',
+            cls.get_num_items(),
+            len(cls._flag_bitmaps),
+            len(cls._slot_bitmaps),
+        )
@@ -13,6 +13,10 @@ class ItemListing:
         self._item_listing_data = []
         self._max_size = max_size
 
+        # Callables taking (item listing, item ID), called when the
+        # quantity of an item in the listing may have changed.
+        self._change_listeners = []
+
     @property
     def item_listing_data(self):
         """Returns the item listing data."""
@@ -25,10 +29,31 @@ class ItemListing:
 
         return self._max_size
 
+    def add_change_listener(self, listener):
+        """Registers a callable taking (item listing, item ID) to call when
+        the quantity of an item in the listing may have changed."""
+
+        if listener not in self._change_listeners:
+            self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def notify_item_changed(self, item_id):
+        """Notifies the change listeners that the quantity of item_id may
+        have changed. Children must call this when changing quantities."""
+
+        for listener in list(self._change_listeners):
+            listener(self, item_id)
+
     def clear_items(self):
         """Removes all items from listing."""
 
+        removed_item_ids = {item_info[0] for item_info in self._item_listing_data}
         self._item_listing_data = []
+        for item_id in removed_item_ids:
+            self.notify_item_changed(item_id)
 
     def get_listing_dict(self):
         """Returns ItemListing contents as a dict that maps item IDs to
@@ -220,6 +245,7 @@ class ItemListing:
                 item_obj.get_name(),
                 num_to_add,
             ))
+            self.notify_item_changed(item_id)
 
         return success
 
@@ -5,6 +5,7 @@ from enum import Enum
 from app.battle import battle
 from app.equipment import equipment
 from app.interactions import interaction
+from app.items import item_catalog
 from app.viewing import icon, menu_options
 from lang import language
 from util import util
@@ -104,6 +105,7 @@ class Item(icon.ViewingIcon):
     def add_item_to_listing(cls, item_id, item_obj):
         if item_obj and (item_id is not None):
             cls.item_listing[item_id] = item_obj
+            item_catalog.ItemCatalog.add_item(item_obj)
             logging.debug("Added item ID {0} to item listing.".format(item_id))
             return True
         else:
@@ -0,0 +1,305 @@
+"""This module contains the recipe engine for creating items.
+
+A Recipe holds the creation requirements of an item (the item's
+required_creation_item_mapping, required_creation_level_mapping and
+required_creation_quests). A RecipeBook tracks which recipes an entity
+can currently craft from the contents of its item listings.
+
+The RecipeBook keeps a count of unsatisfied requirements for each recipe,
+along with reverse indexes from ingredient item IDs and skill IDs to the
+recipes that use them. It listens for item listing and skill level
+changes, and only re-checks the requirements that involve the changed
+item or skill. The set of craftable items is therefore always up to date
+without re-checking every recipe against the whole inventory.
+"""
+
+import bisect
+import logging
+
+from app.items import items
+
+
+class Recipe:
+    """Creation requirements for an item.
+
+    Attributes:
+        item_id: ID of the item the recipe creates.
+        required_items: dict mapping ingredient item IDs to the quantity
+            needed to create one item.
+        required_levels: dict mapping skill IDs to the minimum level.
+        required_quests: list of quest IDs that must be completed.
+    """
+
+    def __init__(self, item_id, required_items=None, required_levels=None, required_quests=None):
+        self.item_id = item_id
+        self.required_items = dict(required_items) if required_items else {}
+        self.required_levels = dict(required_levels) if required_levels else {}
+        self.required_quests = list(required_quests) if required_quests else []
+
+    def get_num_requirements(self):
+        return len(self.required_items) + len(self.required_levels) + len(self.required_quests)
+
+    @classmethod
+    def from_item(cls, item_obj):
+        """Returns the Recipe for the item, or None if the item has no
+        creation requirements."""
+
+        if item_obj and (item_obj.required_creation_item_mapping or item_obj.required_creation_level_mapping):
+            return Recipe(
+                item_obj.item_id,
+                required_items=item_obj.required_creation_item_mapping,
+                required_levels=item_obj.required_creation_level_mapping,
+                required_quests=item_obj.required_creation_quests,
+            )
+        return None
+
+    @classmethod
+    def get_recipes_from_items(cls):
+        """Returns list of Recipes for every item in the item listing that
+        has creation requirements."""
+
+        ret_recipes = []
+        for item_obj in items.Item.item_listing.values():
+            recipe = cls.from_item(item_obj)
+            if recipe:
+                ret_recipes.append(recipe)
+        return ret_recipes
+
+
+class RecipeBook:
+    """Tracks which recipes an entity can currently craft.
+
+    The book listens to the given item listings and the entity's skill
+    levels. Call detach() when the book is no longer needed so that it
+    stops listening.
+    """
+
+    def __init__(self, entity_obj, item_listings, recipes=None, completed_quests=None):
+        """Creates a RecipeBook for the entity.
+
+        Args:
+            entity_obj: the Entity that crafts.
+            item_listings: list of ItemListing objects whose items can be
+                used as ingredients, such as the inventory and toolbelt.
+            recipes: list of Recipes to track. Defaults to the recipes for
+                every item in the item listing.
+            completed_quests: optional iterable of completed quest IDs.
+        """
+
+        self._entity = entity_obj
+        self._item_listings = list(item_listings)
+        self._completed_quests = set(completed_quests) if completed_quests else set()
+
+        # Maps item IDs to Recipes.
+        self._recipes = {}
+
+        # Maps item IDs of recipes to their number of unsatisfied
+        # requirements.
+        self._num_unsatisfied = {}
+
+        # Item IDs of the recipes with no unsatisfied requirements.
+        self._craftable_item_ids = set()
+
+        # Maps ingredient item IDs to list of (recipe item ID, quantity).
+        self._ingredient_index = {}
+
+        # Maps skill IDs to a tuple of two parallel lists: the sorted
+        # required levels, and the recipe item IDs for those levels.
+        self._skill_index = {}
+
+        # Maps quest IDs to list of recipe item IDs.
+        self._quest_index = {}
+
+        # Last known total quantity of each ingredient, and level of each
+        # skill.
+        self._quantities = {}
+        self._levels = {}
+
+        if recipes is None:
+            recipes = Recipe.get_recipes_from_items()
+        for recipe in recipes:
+            self.add_recipe(recipe)
+
+        for item_listing in self._item_listings:
+            item_listing.add_change_listener(self._on_item_changed)
+        self._entity.add_skill_level_listener(self._on_skill_level_changed)
+
+    def detach(self):
+        """Stops listening for item listing and skill level changes."""
+
+        for item_listing in self._item_listings:
+            item_listing.remove_change_listener(self._on_item_changed)
+        self._entity.remove_skill_level_listener(self._on_skill_level_changed)
+
+    def _get_total_quantity(self, item_id):
+        return sum(item_listing.get_item_quantity(item_id) for item_listing in self._item_listings)
+
+    def _get_level(self, skill_id):
+        return self._entity.get_skill_level(skill_id) or 0
+
+    def _set_unsatisfied(self, recipe_item_id, num_unsatisfied):
+        self._num_unsatisfied[recipe_item_id] = num_unsatisfied
+        if num_unsatisfied == 0:
+            self._craftable_item_ids.add(recipe_item_id)
+        else:
+            self._craftable_item_ids.discard(recipe_item_id)
+
+    def _adjust_unsatisfied(self, recipe_item_id, change):
+        self._set_unsatisfied(recipe_item_id, self._num_unsatisfied[recipe_item_id] + change)
+
+    def add_recipe(self, recipe):
+        """Adds the recipe to the book, replacing any recipe for the same
+        item."""
+
+        if recipe.item_id in self._recipes:
+            self.remove_recipe(recipe.item_id)
+        self._recipes[recipe.item_id] = recipe
+
+        num_unsatisfied = 0
+        for ingredient_id, quantity in recipe.required_items.items():
+            self._ingredient_index.setdefault(ingredient_id, []).append((recipe.item_id, quantity))
+            if ingredient_id not in self._quantities:
+                self._quantities[ingredient_id] = self._get_total_quantity(ingredient_id)
+            if self._quantities[ingredient_id] < quantity:
+                num_unsatisfied += 1
+
+        for skill_id, level in recipe.required_levels.items():
+            required_levels, recipe_item_ids = self._skill_index.setdefault(skill_id, ([], []))
+            index = bisect.bisect_right(required_levels, level)
+            required_levels.insert(index, level)
+            recipe_item_ids.insert(index, recipe.item_id)
+            if skill_id not in self._levels:
+                self._levels[skill_id] = self._get_level(skill_id)
+            if self._levels[skill_id] < level:
+                num_unsatisfied += 1
+
+        for quest_id in recipe.required_quests:
+            self._quest_index.setdefault(quest_id, []).append(recipe.item_id)
+            if quest_id not in self._completed_quests:
+                num_unsatisfied += 1
+
+        self._set_unsatisfied(recipe.item_id, num_unsatisfied)
+
+    def remove_recipe(self, item_id):
+        recipe = self._recipes.pop(item_id, None)
+        if not recipe:
+            return
+
+        for ingredient_id in recipe.required_items:
+            self._ingredient_index[ingredient_id] = [
+                x for x in self._ingredient_index[ingredient_id] if x[0] != item_id
+            ]
+        for skill_id in recipe.required_levels:
+            required_levels, recipe_item_ids = self._skill_index[skill_id]
+            index = recipe_item_ids.index(item_id)
+            required_levels.pop(index)
+            recipe_item_ids.pop(index)
+        for quest_id in recipe.required_quests:
+            self._quest_index[quest_id] = [x for x in self._quest_index[quest_id] if x != item_id]
+
+        self._num_unsatisfied.pop(item_id, None)
+        self._craftable_item_ids.discard(item_id)
+
+    def _on_item_changed(self, item_listing, item_id):
+        """Item listing change listener. Re-checks only the recipes that
+        use the changed item."""
+
+        recipe_entries = self._ingredient_index.get(item_id, None)
+        if not recipe_entries:
+            return
+
+        old_quantity = self._quantities.get(item_id, 0)
+        new_quantity = self._get_total_quantity(item_id)
+        if new_quantity == old_quantity:
+            return
+        self._quantities[item_id] = new_quantity
+
+        for recipe_item_id, required_quantity in recipe_entries:
+            was_satisfied = old_quantity >= required_quantity
+            now_satisfied = new_quantity >= required_quantity
+            if was_satisfied != now_satisfied:
+                self._adjust_unsatisfied(recipe_item_id, -1 if now_satisfied else 1)
+
+    def _on_skill_level_changed(self, entity_obj, skill_id, old_level, new_level):
+        """Skill level change listener. Only the recipes with a required
+        level between the old and new levels change."""
+
+        level_entries = self._skill_index.get(skill_id, None)
+        if not level_entries or not level_entries[0]:
+            return
+        required_levels, recipe_item_ids = level_entries
+
+        old_level = self._levels.get(skill_id, old_level or 0)
+        new_level = new_level or 0
+        self._levels[skill_id] = new_level
+        if new_level == old_level:
+            return
+
+        # Recipes requiring a level in (lower, upper] change satisfaction.
+        lower = min(old_level, new_level)
+        upper = max(old_level, new_level)
+        start_index = bisect.bisect_right(required_levels, lower)
+        end_index = bisect.bisect_right(required_levels, upper)
+        change = -1 if new_level > old_level else 1
+        for recipe_item_id in recipe_item_ids[start_index:end_index]:
+            self._adjust_unsatisfied(recipe_item_id, change)
+
+    def set_quest_completed(self, quest_id, completed=True):
+        """Records whether the quest is completed and updates the recipes
+        that require it."""
+
+        if completed == (quest_id in self._completed_quests):
+            return
+        if completed:
+            self._completed_quests.add(quest_id)
+        else:
+            self._completed_quests.discard(quest_id)
+        for recipe_item_id in self._quest_index.get(quest_id, []):
+            self._adjust_unsatisfied(recipe_item_id, -1 if completed else 1)
+
+    def refresh(self):
+        """Re-checks every recipe from scratch. Only needed if item listings
+        or skill levels changed without notifying the book."""
+
+        for item_id in self._quantities:
+            self._quantities[item_id] = self._get_total_quantity(item_id)
+        for skill_id in self._levels:
+            self._levels[skill_id] = self._get_level(skill_id)
+
+        for recipe in list(self._recipes.values()):
+            self.add_recipe(recipe)
+        logging.debug('Refreshed %d recipes.', len(self._recipes))
+
+    def is_craftable(self, item_id):
+        return item_id in self._craftable_item_ids
+
+    def get_craftable_item_ids(self):
+        """Returns set of item IDs that can currently be crafted."""
+
+        return set(self._craftable_item_ids)
+
+    def get_max_craftable_count(self, item_id):
+        """Returns how many of the item can be crafted with the current
+        ingredients.
+
+        Returns:
+            0 if the item cannot be crafted, or None if it can be crafted
+            and the recipe needs no ingredient items.
+        """
+
+        if item_id not in self._craftable_item_ids:
+            return 0
+
+        recipe = self._recipes[item_id]
+        if not recipe.required_items:
+            return None
+        return min(
+            self._quantities.get(ingredient_id, 0) // quantity
+            for ingredient_id, quantity in recipe.required_items.items()
+        )
+
+    def get_craftable_counts(self):
+        """Returns dict mapping each craftable item ID to its max craftable
+        count (see get_max_craftable_count)."""
+
+        return {item_id: self.get_max_craftable_count(item_id) for item_id in self._craftable_item_ids}
@@ -0,0 +1,447 @@
+"""This module contains connectivity labels for rejecting unreachable moves.
+
+For each map and each tiles.Accessibility transport flag, every tile that
+can be accessed with the flag gets a component label, and two tiles can
+reach each other on the map exactly when they share a label. The labels
+are computed at load time from runs of accessible tiles in each row,
+which is much faster than a flood fill per tile.
+
+The labels are updated incrementally when tiles change:
+- a tile becoming accessible joins the components around it with a
+  union-find merge,
+- a tile becoming blocked only relabels its component when the blocked
+  tile could have split it.
+
+Across maps, components are joined through the maps' adjacent maps and
+connector tiles into a world component graph. The graph treats every
+link as two-way, so it can only overestimate reachability. A False from
+Connectivity.is_reachable() therefore means the destination is certainly
+unreachable, and a path search can be skipped.
+
+This module requires NumPy.
+"""
+
+import collections
+import logging
+
+import numpy as np
+
+from app.maps import directions
+from app.tiles import tiles
+
+NO_COMPONENT = -1
+
+# Transport flags to label.
+TRANSPORT_FLAGS = (
+    tiles.Accessibility.WALKABLE_F,
+    tiles.Accessibility.CANOEABLE_F,
+    tiles.Accessibility.SAILABLE_F,
+    tiles.Accessibility.FLYABLE_F,
+)
+
+# Orthogonal neighbor offsets.
+NEIGHBOR_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# The 8 tiles around a tile in clockwise order, starting north. Even
+# indexes are orthogonal neighbors and odd indexes are corners.
+RING_OFFSETS = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+
+def get_row_runs(row):
+    """Returns (starts, ends) arrays of the runs of True values in the
+    boolean row, where each run covers [start, end)."""
+
+    padded = np.concatenate(([False], row, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    return changes[0::2], changes[1::2]
+
+
+def label_components(passable):
+    """Labels the 4-connected components of the passable tiles.
+
+    Args:
+        passable: boolean array of shape (height, width).
+
+    Returns:
+        Tuple of (int32 label array with NO_COMPONENT for impassable tiles,
+        number of components).
+    """
+
+    height, width = passable.shape
+    labels = np.full((height, width), NO_COMPONENT, dtype=np.int32)
+
+    # Union-find over runs.
+    parent = []
+
+    def find(run_id):
+        while parent[run_id] != run_id:
+            parent[run_id] = parent[parent[run_id]]
+            run_id = parent[run_id]
+        return run_id
+
+    row_runs = []
+    prev_starts, prev_ends, prev_ids = (), (), ()
+    for y in range(height):
+        starts, ends = get_row_runs(passable[y])
+        starts, ends = starts.tolist(), ends.tolist()
+        ids = list(range(len(parent), len(parent) + len(starts)))
+        parent.extend(ids)
+
+        # Union runs that overlap runs in the previous row.
+        prev_index = 0
+        for start, end, run_id in zip(starts, ends, ids):
+            while prev_index < len(prev_starts) and prev_ends[prev_index] <= start:
+                prev_index += 1
+            index = prev_index
+            while index < len(prev_starts) and prev_starts[index] < end:
+                root_a, root_b = find(run_id), find(prev_ids[index])
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+                index += 1
+
+        row_runs.append((starts, ends, ids))
+        prev_starts, prev_ends, prev_ids = starts, ends, ids
+
+    # Number the roots consecutively and fill in the labels.
+    root_labels = {}
+    for y, (starts, ends, ids) in enumerate(row_runs):
+        for start, end, run_id in zip(starts, ends, ids):
+            root = find(run_id)
+            label = root_labels.get(root, None)
+            if label is None:
+                label = len(root_labels)
+                root_labels[root] = label
+            labels[y, start:end] = label
+
+    return labels, len(root_labels)
+
+
+class ComponentLabels:
+    """Component labels of one map for one transport flag.
+
+    Labels can be merged, so get_component() resolves them through a
+    union-find parent list.
+    """
+
+    def __init__(self, passable):
+        self.passable = passable.copy()
+        self.labels, num_components = label_components(self.passable)
+        self._parent = list(range(num_components))
+
+    def _find(self, label):
+        parent = self._parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    def _new_label(self):
+        label = len(self._parent)
+        self._parent.append(label)
+        return label
+
+    def within_bounds(self, tile_loc):
+        return (0 <= tile_loc[0] < self.labels.shape[1]) and (0 <= tile_loc[1] < self.labels.shape[0])
+
+    def get_component(self, tile_loc):
+        """Returns the component ID of the tile, or NO_COMPONENT if the tile
+        is out of bounds or not passable."""
+
+        if not self.within_bounds(tile_loc):
+            return NO_COMPONENT
+        label = int(self.labels[tile_loc[1], tile_loc[0]])
+        if label == NO_COMPONENT:
+            return NO_COMPONENT
+        return self._find(label)
+
+    def get_component_ids(self):
+        """Returns set of the component IDs on the map."""
+
+        return {self._find(label) for label in np.unique(self.labels).tolist() if label != NO_COMPONENT}
+
+    def _get_passable(self, x, y):
+        return (0 <= x < self.passable.shape[1]) and (0 <= y < self.passable.shape[0]) \
+            and bool(self.passable[y, x])
+
+    def set_passable(self, tile_loc, passable):
+        """Updates the labels for the tile becoming passable or blocked.
+        Returns True if any component changed."""
+
+        x, y = tile_loc
+        if bool(self.passable[y, x]) == passable:
+            return False
+        self.passable[y, x] = passable
+
+        if passable:
+            self._open_tile(x, y)
+        else:
+            self._block_tile(x, y)
+        return True
+
+    def _open_tile(self, x, y):
+        roots = {
+            self.get_component((x + dx, y + dy))
+            for dx, dy in NEIGHBOR_OFFSETS
+        }
+        roots.discard(NO_COMPONENT)
+
+        if not roots:
+            self.labels[y, x] = self._new_label()
+            return
+
+        # Merge the neighboring components into the smallest ID.
+        target = min(roots)
+        for root in roots:
+            self._parent[root] = target
+        self.labels[y, x] = target
+
+    def _could_split(self, x, y):
+        """Returns True if blocking the tile could split its component,
+        based on whether its passable neighbors are connected through the
+        tiles around it."""
+
+        ring = [self._get_passable(x + dx, y + dy) for dx, dy in RING_OFFSETS]
+
+        # Count groups of orthogonal neighbors joined around the ring.
+        # Orthogonal neighbors are joined through a passable corner.
+        num_groups = 0
+        for index in range(0, 8, 2):
+            if ring[index] and not (ring[index - 2] and ring[index - 1]):
+                num_groups += 1
+        if num_groups == 0 and all(ring[0::2]):
+            # Every neighbor and corner is passable.
+            num_groups = 1
+        return num_groups > 1
+
+    def _block_tile(self, x, y):
+        old_root = self._find(int(self.labels[y, x]))
+        self.labels[y, x] = NO_COMPONENT
+
+        if not self._could_split(x, y):
+            return
+
+        # Give each region of the old component around the tile its own
+        # ID with a flood fill from the neighbors. Neighbors already in a
+        # refilled region no longer resolve to the old ID.
+        for dx, dy in NEIGHBOR_OFFSETS:
+            start = (x + dx, y + dy)
+            if self.get_component(start) == old_root:
+                self._flood_fill(start, old_root, self._new_label())
+
+    def _flood_fill(self, start, old_root, new_label):
+        """Sets new_label on the tiles connected to start whose component is
+        old_root."""
+
+        labels = self.labels
+        height, width = labels.shape
+
+        def matches(tx, ty):
+            label = int(labels[ty, tx])
+            return label != NO_COMPONENT and label != new_label and self._find(label) == old_root
+
+        queue = collections.deque([start])
+        labels[start[1], start[0]] = new_label
+        while queue:
+            cx, cy = queue.popleft()
+            for dx, dy in NEIGHBOR_OFFSETS:
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < width and 0 <= ny < height and matches(nx, ny):
+                    labels[ny, nx] = new_label
+                    queue.append((nx, ny))
+
+
+class MapConnectivity:
+    """Component labels of a map for every transport flag.
+
+    Tiles are passable for a flag if the map's accessibility grid allows
+    the flag and no placed object blocks the tile.
+    """
+
+    def __init__(self, map_obj):
+        self.map_id = map_obj.map_id
+        self.version = 0
+        accessibility = self._get_accessibility_array(map_obj)
+        blocked = map_obj.get_object_blocked_mask()
+        self._labels = {
+            flag: ComponentLabels(((accessibility & flag) > 0) & ~blocked)
+            for flag in TRANSPORT_FLAGS
+        }
+
+    @staticmethod
+    def _get_accessibility_array(map_obj):
+        if not map_obj.accessibility_grid:
+            return np.zeros((0, 0), dtype=np.int32)
+        return np.array(map_obj.accessibility_grid, dtype=np.int32)
+
+    def get_labels(self, transport_flag):
+        component_labels = self._labels.get(transport_flag, None)
+        if component_labels is None:
+            raise Exception('Unsupported transport flag {0}'.format(transport_flag))
+        return component_labels
+
+    def get_component(self, tile_loc, transport_flag):
+        return self.get_labels(transport_flag).get_component(tile_loc)
+
+    def same_component(self, tile_loc_a, tile_loc_b, transport_flag):
+        """Returns True if the two tiles on the map can reach each other
+        with the transport flag."""
+
+        component = self.get_component(tile_loc_a, transport_flag)
+        return component != NO_COMPONENT and component == self.get_component(tile_loc_b, transport_flag)
+
+    def update_tile(self, map_obj, tile_loc):
+        """Updates the labels for the tile from the map's accessibility grid
+        and objects. Returns True if any component changed."""
+
+        flags = map_obj.get_accessibility_flags_from_pos(tile_loc)
+        blocked = map_obj.is_tile_blocked_by_object(tile_loc)
+        changed = False
+        for flag, component_labels in self._labels.items():
+            if component_labels.set_passable(tile_loc, bool(flags & flag) and not blocked):
+                changed = True
+        if changed:
+            self.version += 1
+        return changed
+
+
+class Connectivity:
+    """Connectivity labels for every map, and the world component graph
+    joining them.
+
+    The user should not generate Connectivity objects, as the class is
+    primarily for class methods and class-level data.
+    """
+
+    # Maps map IDs to MapConnectivity objects.
+    _map_connectivity = {}
+
+    # Maps map objects by map ID, for rebuilding the world graph.
+    _maps = {}
+
+    # Union-find parents of (map ID, transport flag, component ID) world
+    # graph nodes. Rebuilt on the first query after a change.
+    _world_parent = {}
+    _world_dirty = True
+
+    @classmethod
+    def build(cls, map_objs):
+        """Computes the connectivity labels for the maps."""
+
+        for map_obj in map_objs:
+            cls._maps[map_obj.map_id] = map_obj
+            cls._map_connectivity[map_obj.map_id] = MapConnectivity(map_obj)
+        cls._world_dirty = True
+        logging.info('Built connectivity labels for %d maps.', len(cls._map_connectivity))
+
+    @classmethod
+    def clear(cls):
+        cls._map_connectivity = {}
+        cls._maps = {}
+        cls._world_parent = {}
+        cls._world_dirty = True
+
+    @classmethod
+    def get_map_connectivity(cls, map_id):
+        return cls._map_connectivity.get(map_id, None)
+
+    @classmethod
+    def update_tiles(cls, map_obj, tile_locs):
+        """Updates the labels after the given tiles of the map changed
+        accessibility or objects."""
+
+        map_connectivity = cls._map_connectivity.get(map_obj.map_id, None)
+        if not map_connectivity:
+            return
+        for tile_loc in tile_locs:
+            if map_connectivity.update_tile(map_obj, tile_loc):
+                cls._world_dirty = True
+
+    @classmethod
+    def _find_world(cls, node):
+        parent = cls._world_parent
+        root = node
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while node != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    @classmethod
+    def _union_world(cls, node_a, node_b):
+        root_a, root_b = cls._find_world(node_a), cls._find_world(node_b)
+        if root_a != root_b:
+            cls._world_parent[root_a] = root_b
+
+    @classmethod
+    def _get_edge_tiles(cls, map_obj, direction):
+        width, height = map_obj.width_in_tiles, map_obj.height_in_tiles
+        if direction == directions.CardinalDirection.NORTH:
+            return [(x, 0) for x in range(width)]
+        elif direction == directions.CardinalDirection.SOUTH:
+            return [(x, height - 1) for x in range(width)]
+        elif direction == directions.CardinalDirection.EAST:
+            return [(width - 1, y) for y in range(height)]
+        elif direction == directions.CardinalDirection.WEST:
+            return [(0, y) for y in range(height)]
+        return []
+
+    @classmethod
+    def _rebuild_world(cls):
+        cls._world_parent = {}
+        for map_id, map_obj in cls._maps.items():
+            map_connectivity = cls._map_connectivity[map_id]
+            for flag in TRANSPORT_FLAGS:
+                component_labels = map_connectivity.get_labels(flag)
+
+                # Walking off the edge of a map leads to the adjacent map's
+                # destination tile.
+                for direction, adj_info in map_obj.adj_map_dict.items():
+                    dest_connectivity = cls._map_connectivity.get(adj_info[0], None) if adj_info else None
+                    if not dest_connectivity:
+                        continue
+                    dest_component = dest_connectivity.get_component(adj_info[1], flag)
+                    if dest_component == NO_COMPONENT:
+                        continue
+                    edge_components = {
+                        component_labels.get_component(tile_loc)
+                        for tile_loc in cls._get_edge_tiles(map_obj, direction)
+                    }
+                    edge_components.discard(NO_COMPONENT)
+                    for component in edge_components:
+                        cls._union_world((map_id, flag, component), (adj_info[0], flag, dest_component))
+
+                # Connector tiles lead to their destination tile.
+                for tile_loc, connector_info in map_obj.connector_tile_dict.items():
+                    dest_connectivity = cls._map_connectivity.get(connector_info[0], None)
+                    if not dest_connectivity:
+                        continue
+                    component = component_labels.get_component(tile_loc)
+                    dest_component = dest_connectivity.get_component(connector_info[1], flag)
+                    if component != NO_COMPONENT and dest_component != NO_COMPONENT:
+                        cls._union_world((map_id, flag, component), (connector_info[0], flag, dest_component))
+        cls._world_dirty = False
+
+    @classmethod
+    def is_reachable(cls, src_map_id, src_tile_loc, dest_map_id, dest_tile_loc, transport_flag):
+        """Returns False if the destination certainly cannot be reached from
+        the source with the transport flag, and True if it might be.
+
+        Maps without connectivity labels are assumed reachable.
+        """
+
+        src_connectivity = cls._map_connectivity.get(src_map_id, None)
+        dest_connectivity = cls._map_connectivity.get(dest_map_id, None)
+        if not src_connectivity or not dest_connectivity:
+            return True
+
+        src_component = src_connectivity.get_component(src_tile_loc, transport_flag)
+        dest_component = dest_connectivity.get_component(dest_tile_loc, transport_flag)
+        if src_component == NO_COMPONENT or dest_component == NO_COMPONENT:
+            return False
+        if src_map_id == dest_map_id and src_component == dest_component:
+            return True
+
+        if cls._world_dirty:
+            cls._rebuild_world()
+        return cls._find_world((src_map_id, transport_flag, src_component)) \
+            == cls._find_world((dest_map_id, transport_flag, dest_component))
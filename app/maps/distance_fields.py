@@ -0,0 +1,84 @@
+"""This module contains breadth-first distance fields over tile grids.
+
+A distance field holds, for each tile, the number of single-tile moves
+needed to reach it from the nearest source tile, or UNREACHABLE. The
+search expands the whole frontier at once with NumPy index arithmetic,
+so the Python work per field is proportional to the longest distance
+rather than to the number of tiles.
+
+This module requires NumPy.
+"""
+
+import numpy as np
+
+UNREACHABLE = -1
+
+
+def compute_distance_field(passable, source_tiles, max_distance=None):
+    """Computes the distance from the nearest source tile to every tile.
+
+    Args:
+        passable: boolean array of shape (height, width) of tiles that can
+            be moved through.
+        source_tiles: iterable of (x, y) tile locations to start from.
+            Impassable or out of bounds sources are ignored.
+        max_distance: optional distance at which to stop searching.
+
+    Returns:
+        int32 array of shape (height, width) with the distance to each
+        tile, or UNREACHABLE.
+    """
+
+    height, width = passable.shape
+    distances = np.full(height * width, UNREACHABLE, dtype=np.int32)
+    flat_passable = passable.ravel()
+
+    frontier = np.array(
+        [y * width + x for x, y in source_tiles if 0 <= x < width and 0 <= y < height],
+        dtype=np.int64,
+    )
+    if len(frontier):
+        frontier = np.unique(frontier[flat_passable[frontier]])
+    distances[frontier] = 0
+
+    distance = 0
+    while len(frontier) and (max_distance is None or distance < max_distance):
+        distance += 1
+        xs = frontier % width
+
+        # Neighbors in each direction, skipping moves across the map edges.
+        neighbors = np.concatenate((
+            frontier[frontier >= width] - width,
+            frontier[frontier < (height - 1) * width] + width,
+            frontier[xs > 0] - 1,
+            frontier[xs < width - 1] + 1,
+        ))
+        neighbors = neighbors[flat_passable[neighbors] & (distances[neighbors] == UNREACHABLE)]
+        frontier = np.unique(neighbors)
+        distances[frontier] = distance
+
+    return distances.reshape(height, width)
+
+
+def trace_path(distances, start_tile):
+    """Returns list of tile locations from start_tile down the distance
+    field to a source tile, including both ends, or None if start_tile is
+    unreachable."""
+
+    height, width = distances.shape
+    x, y = start_tile
+    if not (0 <= x < width and 0 <= y < height) or distances[y, x] == UNREACHABLE:
+        return None
+
+    path = [(x, y)]
+    distance = int(distances[y, x])
+    while distance > 0:
+        for nx, ny in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+            if 0 <= nx < width and 0 <= ny < height and distances[ny, nx] == distance - 1:
+                x, y = nx, ny
+                break
+        else:
+            raise Exception('Broken distance field at {0}'.format((x, y)))
+        distance -= 1
+        path.append((x, y))
+    return path
@@ -0,0 +1,304 @@
+"""This module contains exploration (fog of war) tracking for maps.
+
+Each map keeps one bit per tile, packed 8 tiles to a byte, that is set
+once the protagonist has come within REVEAL_RADIUS tiles of it. Marking a
+step only touches the bytes around the protagonist, so the cost per step
+does not depend on the size of the map.
+
+The darkening overlay for unexplored tiles is split into square chunks
+of CHUNK_SIZE tiles. Chunk surfaces are cached and only redrawn once
+newly explored tiles fall inside them, and fully explored chunks are not
+blitted at all.
+
+Bitsets are saved as zlib compressed, base64 encoded strings, so large
+and mostly unexplored or mostly explored maps take very little space in
+the save file.
+
+This module requires NumPy.
+"""
+
+import base64
+import logging
+import zlib
+
+import numpy as np
+import pygame
+
+from app.tiles import tiles
+
+# Distance in tiles around the protagonist that is revealed.
+REVEAL_RADIUS = 4
+
+# Width and height in tiles of each overlay chunk.
+CHUNK_SIZE = 16
+
+# Alpha value of the darkening over unexplored tiles.
+UNEXPLORED_ALPHA = 160
+
+# Tile offsets within REVEAL_RADIUS of the center tile.
+_reveal_offsets = np.array(
+    [
+        (offset_x, offset_y)
+        for offset_y in range(-REVEAL_RADIUS, REVEAL_RADIUS + 1)
+        for offset_x in range(-REVEAL_RADIUS, REVEAL_RADIUS + 1)
+        if offset_x * offset_x + offset_y * offset_y <= REVEAL_RADIUS * REVEAL_RADIUS
+    ],
+    dtype=np.int64,
+)
+
+
+def pack_bits(bits):
+    """Returns the zlib compressed, base64 encoded string for the packed
+    bitset bytes."""
+
+    return base64.b64encode(zlib.compress(bits.tobytes(), 9)).decode('ascii')
+
+
+def unpack_bits(packed_str, num_bytes):
+    """Returns the uint8 array of num_bytes packed bitset bytes decoded
+    from pack_bits()."""
+
+    bits = np.frombuffer(zlib.decompress(base64.b64decode(packed_str)), dtype=np.uint8)
+    if len(bits) != num_bytes:
+        raise Exception('Expected {0} exploration bytes, got {1}'.format(num_bytes, len(bits)))
+    return bits.copy()
+
+
+class ExplorationMap:
+    """Explored tiles and the darkening overlay for one map.
+
+    Tile (x, y) is bit (y * width + x) of the bitset, most significant
+    bit first within each byte, matching numpy.packbits.
+    """
+
+    def __init__(self, width, height, bits=None):
+        self.width = width
+        self.height = height
+        num_bytes = (width * height + 7) // 8
+        if bits is None:
+            bits = np.zeros(num_bytes, dtype=np.uint8)
+        elif len(bits) != num_bytes:
+            raise Exception('Invalid exploration bitset length {0}'.format(len(bits)))
+        self.bits = bits
+
+        # Incremented whenever tiles are newly explored.
+        self.version = 0
+
+        # Maps (chunk x, chunk y) to the cached overlay Surface, or None
+        # for fully explored chunks.
+        self._chunk_surfaces = {}
+        self._dirty_chunks = set()
+
+    def is_explored(self, tile_loc):
+        x, y = tile_loc
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        index = y * self.width + x
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def get_explored_mask(self):
+        """Returns boolean array of shape (height, width) that is True for
+        explored tiles."""
+
+        return self.get_explored_rows(0, self.height)
+
+    def get_explored_rows(self, top, num_rows):
+        """Returns boolean array of shape (num_rows, width) for the explored
+        tiles in the rows starting at top, unpacking only those bytes."""
+
+        num_rows = max(0, min(num_rows, self.height - top))
+        start_bit = top * self.width
+        end_bit = start_bit + num_rows * self.width
+        start_byte = start_bit >> 3
+        row_bits = np.unpackbits(self.bits[start_byte:(end_bit + 7) >> 3])
+        offset = start_bit - start_byte * 8
+        return row_bits[offset:offset + num_rows * self.width].reshape(num_rows, self.width).astype(bool)
+
+    def get_num_explored(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def mark_explored(self, tile_locs):
+        """Marks the tiles as explored.
+
+        Args:
+            tile_locs: (N, 2) array or sequence of (x, y) tile locations.
+                Out of bounds tiles are ignored.
+
+        Returns:
+            Number of tiles that were not already explored.
+        """
+
+        tile_locs = np.asarray(tile_locs, dtype=np.int64).reshape(-1, 2)
+        xs, ys = tile_locs[:, 0], tile_locs[:, 1]
+        inside = (xs >= 0) & (ys >= 0) & (xs < self.width) & (ys < self.height)
+        xs, ys = xs[inside], ys[inside]
+
+        indices = ys * self.width + xs
+        byte_indices = indices >> 3
+        masks = (0x80 >> (indices & 7)).astype(np.uint8)
+        new = (self.bits[byte_indices] & masks) == 0
+        if not new.any():
+            return 0
+
+        np.bitwise_or.at(self.bits, byte_indices[new], masks[new])
+        self.version += 1
+        chunk_xs, chunk_ys = xs[new] // CHUNK_SIZE, ys[new] // CHUNK_SIZE
+        self._dirty_chunks.update(zip(chunk_xs.tolist(), chunk_ys.tolist()))
+        return int(new.sum())
+
+    def reveal_around(self, tile_loc):
+        """Marks the tiles within REVEAL_RADIUS of the tile as explored.
+        Returns the number of newly explored tiles."""
+
+        return self.mark_explored(_reveal_offsets + np.asarray(tile_loc, dtype=np.int64))
+
+    def invalidate_overlay(self):
+        self._chunk_surfaces = {}
+        self._dirty_chunks = set()
+
+    def _render_chunk(self, chunk):
+        """Returns the overlay Surface for the chunk, or None if every tile
+        in it is explored."""
+
+        left, top = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+        explored = self.get_explored_rows(top, CHUNK_SIZE)[:, left:left + CHUNK_SIZE]
+        if explored.all():
+            return None
+
+        chunk_height, chunk_width = explored.shape
+        surface = pygame.Surface((chunk_width * tiles.TILE_SIZE, chunk_height * tiles.TILE_SIZE), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, UNEXPLORED_ALPHA))
+
+        # Clear the alpha over explored tiles, one tile per array cell
+        # scaled up to pixels.
+        tile_alpha = np.where(explored, 0, UNEXPLORED_ALPHA).astype(np.uint8)
+        pixel_alpha = np.repeat(np.repeat(tile_alpha, tiles.TILE_SIZE, axis=0), tiles.TILE_SIZE, axis=1)
+        alpha_view = pygame.surfarray.pixels_alpha(surface)
+        alpha_view[:] = pixel_alpha.T
+        del alpha_view
+        return surface
+
+    def get_chunk_surface(self, chunk):
+        if chunk in self._dirty_chunks or chunk not in self._chunk_surfaces:
+            self._chunk_surfaces[chunk] = self._render_chunk(chunk)
+            self._dirty_chunks.discard(chunk)
+        return self._chunk_surfaces[chunk]
+
+    def blit_overlay(self, surface, top_left_position, tile_subset_rect=None):
+        """Blits the darkening over unexplored tiles.
+
+        Args:
+            surface: pygame Surface to blit on.
+            top_left_position: (x, y) pixel position of the map's top left
+                corner on the surface.
+            tile_subset_rect: rect of Tile coordinates (top left x, top left
+                y, width, height) to cover, or None for the whole map.
+        """
+
+        if tile_subset_rect:
+            start_x, start_y, width, height = tile_subset_rect
+        else:
+            start_x, start_y, width, height = 0, 0, self.width, self.height
+        if width <= 0 or height <= 0:
+            return
+
+        chunk_px = CHUNK_SIZE * tiles.TILE_SIZE
+        clip_rect = pygame.Rect(
+            top_left_position[0] + start_x * tiles.TILE_SIZE,
+            top_left_position[1] + start_y * tiles.TILE_SIZE,
+            width * tiles.TILE_SIZE,
+            height * tiles.TILE_SIZE,
+        )
+
+        blit_sequence = []
+        min_chunk_x, min_chunk_y = max(0, start_x) // CHUNK_SIZE, max(0, start_y) // CHUNK_SIZE
+        max_chunk_x = min(self.width - 1, start_x + width - 1) // CHUNK_SIZE
+        max_chunk_y = min(self.height - 1, start_y + height - 1) // CHUNK_SIZE
+        for chunk_y in range(min_chunk_y, max_chunk_y + 1):
+            for chunk_x in range(min_chunk_x, max_chunk_x + 1):
+                chunk_surface = self.get_chunk_surface((chunk_x, chunk_y))
+                if chunk_surface:
+                    blit_sequence.append((
+                        chunk_surface,
+                        (top_left_position[0] + chunk_x * chunk_px, top_left_position[1] + chunk_y * chunk_px),
+                    ))
+
+        if blit_sequence:
+            old_clip = surface.get_clip()
+            surface.set_clip(clip_rect.clip(old_clip))
+            surface.blits(blit_sequence, doreturn=False)
+            surface.set_clip(old_clip)
+
+
+class Exploration:
+    """Exploration state for every map.
+
+    The user should not generate Exploration objects, as the class is
+    primarily for class methods and class-level data.
+    """
+
+    # Maps map IDs to ExplorationMap objects.
+    _exploration_maps = {}
+
+    # Whether to blit the darkening overlay.
+    overlay_enabled = True
+
+    @classmethod
+    def clear(cls):
+        cls._exploration_maps = {}
+
+    @classmethod
+    def get_exploration_map(cls, map_obj):
+        """Returns the ExplorationMap for the map, creating an unexplored
+        one if needed."""
+
+        exploration_map = cls._exploration_maps.get(map_obj.map_id, None)
+        if exploration_map is None \
+                or (exploration_map.width, exploration_map.height) != (map_obj.width_in_tiles,
+                                                                       map_obj.height_in_tiles):
+            exploration_map = ExplorationMap(map_obj.width_in_tiles, map_obj.height_in_tiles)
+            cls._exploration_maps[map_obj.map_id] = exploration_map
+        return exploration_map
+
+    @classmethod
+    def reveal_around(cls, map_obj, tile_loc):
+        return cls.get_exploration_map(map_obj).reveal_around(tile_loc)
+
+    @classmethod
+    def is_explored(cls, map_obj, tile_loc):
+        exploration_map = cls._exploration_maps.get(map_obj.map_id, None)
+        return exploration_map.is_explored(tile_loc) if exploration_map else False
+
+    @classmethod
+    def blit_overlay(cls, map_obj, surface, tile_subset_rect=None):
+        if cls.overlay_enabled:
+            cls.get_exploration_map(map_obj).blit_overlay(
+                surface,
+                map_obj.top_left_position,
+                tile_subset_rect=tile_subset_rect,
+            )
+
+    @classmethod
+    def get_save_data(cls):
+        """Returns list of [map ID, width, height, packed bitset string]
+        lists for every map with explored tiles."""
+
+        return [
+            [map_id, exploration_map.width, exploration_map.height, pack_bits(exploration_map.bits)]
+            for map_id, exploration_map in cls._exploration_maps.items()
+            if exploration_map.bits.any()
+        ]
+
+    @classmethod
+    def load_save_data(cls, save_data):
+        """Replaces the exploration state with the data from
+        get_save_data()."""
+
+        cls.clear()
+        for map_id, width, height, packed_str in save_data or []:
+            try:
+                bits = unpack_bits(packed_str, (width * height + 7) // 8)
+            except Exception as e:
+                logging.error('Invalid exploration data for map {0}: {1}'.format(map_id, e))
+                continue
+            cls._exploration_maps[map_id] = ExplorationMap(width, height, bits=bits)
@@ -0,0 +1,208 @@
+"""This module contains flow fields for moving crowds towards shared targets.
+
+A flow field holds the distance from every tile of a map to a target
+tile, and the direction of the next move towards the target from every
+tile. It is computed once per (map, target tile, transport flag), after
+which any number of agents read their next move in O(1), or all at once
+with get_directions().
+
+Direction codes are CardinalDirection values, with NO_DIRECTION for tiles
+that are the target or cannot reach it, so they can be passed straight
+to EntityStore.move().
+
+FlowFields caches fields and recomputes them lazily. A field is stale
+once its target moves to another tile, or once the map's connectivity
+version changes, which happens when terrain or placed objects in the
+occupancy grid change.
+
+This module requires NumPy.
+"""
+
+import collections
+
+import numpy as np
+
+from app.maps import directions, distance_fields, route_planner
+
+NO_DIRECTION = 0
+
+# Maximum number of cached flow fields.
+MAX_CACHED_FIELDS = 64
+
+# (direction code, x offset, y offset) for each move, in tie-breaking
+# order.
+MOVES = (
+    (directions.CardinalDirection.NORTH.value, 0, -1),
+    (directions.CardinalDirection.EAST.value, 1, 0),
+    (directions.CardinalDirection.SOUTH.value, 0, 1),
+    (directions.CardinalDirection.WEST.value, -1, 0),
+)
+
+# Tile offsets for each direction code, indexed by code.
+DIRECTION_OFFSETS = np.zeros((max(code for code, _, _ in MOVES) + 1, 2), dtype=np.int32)
+for _code, _offset_x, _offset_y in MOVES:
+    DIRECTION_OFFSETS[_code] = (_offset_x, _offset_y)
+
+
+class FlowField:
+    """Distances and next move directions towards a target tile.
+
+    Attributes:
+        map_id: ID of the map.
+        target_tile: (x, y) tile location of the target.
+        transport_flag: tiles.Accessibility flag for the movement.
+        version: map connectivity version the field was computed for.
+        distances: int32 array of shape (height, width) of the number of
+            moves from each tile to the target, or UNREACHABLE.
+        directions: int8 array of shape (height, width) of the direction
+            code for the next move from each tile.
+    """
+
+    def __init__(self, map_id, target_tile, transport_flag, passable, version=0):
+        self.map_id = map_id
+        self.target_tile = target_tile
+        self.transport_flag = transport_flag
+        self.version = version
+        self.distances = distance_fields.compute_distance_field(passable, [target_tile])
+        self.directions = self._compute_directions(self.distances)
+
+    @staticmethod
+    def _compute_directions(distances):
+        """Returns array of the direction code towards the neighbor with the
+        lowest distance from each reachable tile."""
+
+        height, width = distances.shape
+        unreachable = distances == distance_fields.UNREACHABLE
+
+        # Pad with a distance higher than any real one.
+        large = np.iinfo(np.int32).max
+        padded = np.full((height + 2, width + 2), large, dtype=np.int32)
+        padded[1:-1, 1:-1] = np.where(unreachable, large, distances)
+
+        best_distances = np.full((height, width), large, dtype=np.int32)
+        best_codes = np.full((height, width), NO_DIRECTION, dtype=np.int8)
+        for code, offset_x, offset_y in MOVES:
+            neighbor_distances = padded[1 + offset_y:1 + offset_y + height, 1 + offset_x:1 + offset_x + width]
+            better = neighbor_distances < best_distances
+            best_distances[better] = neighbor_distances[better]
+            best_codes[better] = code
+
+        # Only move to a neighbor closer to the target.
+        best_codes[unreachable | (best_distances >= distances)] = NO_DIRECTION
+        return best_codes
+
+    def get_distance(self, tile_loc):
+        x, y = tile_loc
+        height, width = self.distances.shape
+        if 0 <= x < width and 0 <= y < height:
+            return int(self.distances[y, x])
+        return distance_fields.UNREACHABLE
+
+    def get_direction(self, tile_loc):
+        """Returns the direction code for the next move from the tile."""
+
+        x, y = tile_loc
+        height, width = self.directions.shape
+        if 0 <= x < width and 0 <= y < height:
+            return int(self.directions[y, x])
+        return NO_DIRECTION
+
+    def get_next_tile(self, tile_loc):
+        """Returns the tile to move to from the tile, or None if the tile is
+        the target or cannot reach it."""
+
+        code = self.get_direction(tile_loc)
+        if code == NO_DIRECTION:
+            return None
+        offset_x, offset_y = DIRECTION_OFFSETS[code]
+        return (tile_loc[0] + int(offset_x), tile_loc[1] + int(offset_y))
+
+    def get_directions(self, positions):
+        """Returns int8 array of the direction code for the next move from
+        each position in the (N, 2) array of tile locations."""
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        height, width = self.directions.shape
+        xs, ys = positions[:, 0], positions[:, 1]
+        inside = (xs >= 0) & (ys >= 0) & (xs < width) & (ys < height)
+
+        codes = np.full(len(positions), NO_DIRECTION, dtype=np.int8)
+        codes[inside] = self.directions[ys[inside], xs[inside]]
+        return codes
+
+    def get_next_tiles(self, positions):
+        """Returns (N, 2) array of the tile to move to from each position.
+        Positions without a move stay where they are."""
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        return positions + DIRECTION_OFFSETS[self.get_directions(positions)]
+
+
+class FlowFields:
+    """Cache of flow fields for every map.
+
+    The user should not generate FlowFields objects, as the class is
+    primarily for class methods and class-level caches.
+    """
+
+    # LRU cache mapping (map ID, target tile, transport flag) to FlowField
+    # objects.
+    _field_cache = collections.OrderedDict()
+
+    # Maps (map ID, target ID, transport flag) to the FlowField last used
+    # for the moving target.
+    _target_fields = {}
+
+    @classmethod
+    def clear_cache(cls):
+        cls._field_cache = collections.OrderedDict()
+        cls._target_fields = {}
+
+    @classmethod
+    def get_flow_field(cls, map_obj, target_tile, transport_flag):
+        """Returns the flow field towards the target tile on the map,
+        computing it if it is not cached or is stale."""
+
+        target_tile = tuple(target_tile)
+        key = (map_obj.map_id, target_tile, transport_flag)
+        version = route_planner.RoutePlanner.get_map_version(map_obj.map_id)
+
+        field = cls._field_cache.get(key, None)
+        if field is None or field.version != version:
+            field = FlowField(
+                map_obj.map_id,
+                target_tile,
+                transport_flag,
+                route_planner.RoutePlanner.get_passable(map_obj, transport_flag),
+                version=version,
+            )
+            cls._field_cache[key] = field
+        cls._field_cache.move_to_end(key)
+        while len(cls._field_cache) > MAX_CACHED_FIELDS:
+            cls._field_cache.popitem(last=False)
+        return field
+
+    @classmethod
+    def get_target_flow_field(cls, map_obj, target_id, target_tile, transport_flag):
+        """Returns the flow field towards a moving target, such as the
+        protagonist. The field is only recomputed once the target has moved
+        to another tile or the map changed.
+
+        Args:
+            map_obj: Map the target is on.
+            target_id: any hashable ID for the target.
+            target_tile: the target's current (x, y) tile location.
+            transport_flag: tiles.Accessibility flag for the movement.
+        """
+
+        key = (map_obj.map_id, target_id, transport_flag)
+        field = cls._target_fields.get(key, None)
+        version = route_planner.RoutePlanner.get_map_version(map_obj.map_id)
+        if field is None or field.target_tile != tuple(target_tile) or field.version != version:
+            field = cls.get_flow_field(map_obj, target_tile, transport_flag)
+            cls._target_fields[key] = field
+        return field
+
+    @classmethod
+    def remove_target(cls, map_id, target_id, transport_flag):
+        cls._target_fields.pop((map_id, target_id, transport_flag), None)
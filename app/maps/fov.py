@@ -0,0 +1,321 @@
+"""This module contains field of view and line of sight checks for maps.
+
+Tiles that cannot be accessed by any transportation method (such as
+walls and cliffs) are opaque, and every other tile is transparent. Placed
+objects do not block sight.
+
+Field of view uses recursive shadowcasting over the 8 octants around the
+origin, which only visits the tiles that end up visible. Results are
+cached per (map, origin, radius). Terrain changes update the cached
+opacity grids in place and only drop the cached fields of view whose
+radius reaches the changed tiles. compute_fov_batch() answers many
+observers at once, sharing cached and duplicate origins.
+
+has_line_of_sight() walks a single Bresenham line and is much cheaper
+than a full field of view, and PerceptionScheduler spreads line of sight
+checks for large monster populations over several frames with a fixed
+per-frame budget.
+
+This module requires NumPy.
+"""
+
+import collections
+
+import numpy as np
+
+from app.maps import terrain
+from app.tiles import tiles
+
+# Maximum number of cached fields of view.
+MAX_CACHED_FOVS = 1024
+
+# Default number of line of sight checks per PerceptionScheduler update.
+DEFAULT_CHECKS_PER_UPDATE = 200
+
+# Transformations (xx, xy, yx, yy) from octant coordinates to map offsets.
+OCTANT_TRANSFORMS = (
+    (1, 0, 0, 1),
+    (0, 1, 1, 0),
+    (0, -1, 1, 0),
+    (-1, 0, 0, 1),
+    (-1, 0, 0, -1),
+    (0, -1, -1, 0),
+    (0, 1, -1, 0),
+    (1, 0, 0, -1),
+)
+
+
+def get_opacity_grid(map_obj):
+    """Returns nested list of booleans, indexed [y][x], that are True for
+    tiles of the map that block sight."""
+
+    accessibility = np.array(map_obj.accessibility_grid, dtype=np.int32)
+    return (accessibility == tiles.Accessibility.TILE_NOT_ACCESSIBLE_F).tolist()
+
+
+def _cast_light(opaque, width, height, origin_x, origin_y, radius, row, start_slope, end_slope, transform,
+                visible):
+    """Scans one octant from the given row outwards, recursing into the
+    lit gaps between opaque tiles."""
+
+    if start_slope < end_slope:
+        return
+
+    xx, xy, yx, yy = transform
+    radius_sq = radius * radius
+    for distance in range(row, radius + 1):
+        blocked = False
+        new_start_slope = start_slope
+        delta_y = -distance
+        for delta_x in range(-distance, 1):
+            # Slopes of the tile's left and right edges.
+            left_slope = (delta_x - 0.5) / (delta_y + 0.5)
+            right_slope = (delta_x + 0.5) / (delta_y - 0.5)
+            if start_slope < right_slope:
+                continue
+            if end_slope > left_slope:
+                break
+
+            x = origin_x + delta_x * xx + delta_y * xy
+            y = origin_y + delta_x * yx + delta_y * yy
+            in_bounds = 0 <= x < width and 0 <= y < height
+            if in_bounds and delta_x * delta_x + delta_y * delta_y <= radius_sq:
+                visible.add((x, y))
+
+            tile_opaque = (not in_bounds) or opaque[y][x]
+            if blocked:
+                if tile_opaque:
+                    new_start_slope = right_slope
+                else:
+                    blocked = False
+                    start_slope = new_start_slope
+            elif tile_opaque and distance < radius:
+                blocked = True
+                _cast_light(opaque, width, height, origin_x, origin_y, radius, distance + 1, start_slope,
+                            left_slope, transform, visible)
+                new_start_slope = right_slope
+        if blocked:
+            break
+
+
+def compute_fov(opaque, origin, radius):
+    """Computes the tiles visible from the origin.
+
+    Args:
+        opaque: nested list of booleans indexed [y][x], True for tiles that
+            block sight.
+        origin: (x, y) tile location of the observer.
+        radius: maximum sight distance in tiles.
+
+    Returns:
+        frozenset of visible (x, y) tile locations, including the origin.
+        Opaque tiles bordering visible space are visible.
+    """
+
+    height = len(opaque)
+    width = len(opaque[0]) if height else 0
+    origin_x, origin_y = origin
+    if not (0 <= origin_x < width and 0 <= origin_y < height):
+        return frozenset()
+
+    visible = {(origin_x, origin_y)}
+    for transform in OCTANT_TRANSFORMS:
+        _cast_light(opaque, width, height, origin_x, origin_y, radius, 1, 1.0, 0.0, transform, visible)
+    return frozenset(visible)
+
+
+def get_line(start, end):
+    """Returns list of the tile locations on the Bresenham line from start
+    to end, including both."""
+
+    x, y = start
+    end_x, end_y = end
+    delta_x, delta_y = abs(end_x - x), -abs(end_y - y)
+    step_x = 1 if x < end_x else -1
+    step_y = 1 if y < end_y else -1
+    error = delta_x + delta_y
+
+    line = [(x, y)]
+    while (x, y) != (end_x, end_y):
+        double_error = 2 * error
+        if double_error >= delta_y:
+            error += delta_y
+            x += step_x
+        if double_error <= delta_x:
+            error += delta_x
+            y += step_y
+        line.append((x, y))
+    return line
+
+
+class FieldOfView:
+    """Cached fields of view and line of sight checks for every map.
+
+    The user should not generate FieldOfView objects, as the class is
+    primarily for class methods and class-level caches.
+    """
+
+    # Maps map IDs to opacity grids.
+    _opacity_grids = {}
+
+    # LRU cache mapping (map ID, origin, radius) to visible tile
+    # frozensets.
+    _fov_cache = collections.OrderedDict()
+
+    @classmethod
+    def clear_cache(cls):
+        cls._opacity_grids = {}
+        cls._fov_cache = collections.OrderedDict()
+
+    @classmethod
+    def get_opacity(cls, map_obj):
+        opaque = cls._opacity_grids.get(map_obj.map_id, None)
+        if opaque is None:
+            opaque = get_opacity_grid(map_obj)
+            cls._opacity_grids[map_obj.map_id] = opaque
+        return opaque
+
+    @classmethod
+    def get_fov(cls, map_obj, origin, radius):
+        """Returns frozenset of the tile locations visible from the origin
+        within the radius."""
+
+        origin = tuple(origin)
+        key = (map_obj.map_id, origin, radius)
+        visible = cls._fov_cache.get(key, None)
+        if visible is not None:
+            cls._fov_cache.move_to_end(key)
+            return visible
+
+        visible = compute_fov(cls.get_opacity(map_obj), origin, radius)
+        cls._fov_cache[key] = visible
+        while len(cls._fov_cache) > MAX_CACHED_FOVS:
+            cls._fov_cache.popitem(last=False)
+        return visible
+
+    @classmethod
+    def handle_terrain_change(cls, map_obj, change):
+        """Updates the map's opacity grid for the changed tiles, and drops
+        the cached fields of view that could reach them."""
+
+        opaque = cls._opacity_grids.get(map_obj.map_id, None)
+        if opaque is not None:
+            for (x, y), flags in zip(change.tile_locs.tolist(), change.new_flags.tolist()):
+                opaque[y][x] = flags == tiles.Accessibility.TILE_NOT_ACCESSIBLE_F
+
+        min_x, min_y, width, height = change.rect
+        max_x, max_y = min_x + width - 1, min_y + height - 1
+        stale_keys = [
+            key for key in cls._fov_cache
+            if key[0] == map_obj.map_id
+            and min_x - key[2] <= key[1][0] <= max_x + key[2]
+            and min_y - key[2] <= key[1][1] <= max_y + key[2]
+        ]
+        for key in stale_keys:
+            del cls._fov_cache[key]
+
+    @classmethod
+    def compute_fov_batch(cls, map_obj, origins, radius):
+        """Returns dict mapping each distinct origin to the frozenset of
+        tiles visible from it. Observers sharing an origin share one
+        computation, and cached origins are not recomputed."""
+
+        return {origin: cls.get_fov(map_obj, origin, radius) for origin in set(map(tuple, origins))}
+
+    @classmethod
+    def has_line_of_sight(cls, map_obj, start, end, max_distance=None):
+        """Returns True if no opaque tile lies strictly between the start
+        and end tiles, and end is within max_distance of start."""
+
+        if max_distance is not None \
+                and (end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2 > max_distance * max_distance:
+            return False
+
+        opaque = cls.get_opacity(map_obj)
+        height = len(opaque)
+        width = len(opaque[0]) if height else 0
+        for x, y in get_line(start, end)[1:-1]:
+            if not (0 <= x < width and 0 <= y < height) or opaque[y][x]:
+                return False
+        return True
+
+    @classmethod
+    def get_observers_with_sight(cls, map_obj, observers, observer_positions, target, radius):
+        """Returns list of the observers that can see the target tile.
+
+        Observers outside the radius are rejected with one vectorized
+        distance test before any line of sight checks.
+
+        Args:
+            map_obj: Map the observers are on.
+            observers: list of observer objects or IDs.
+            observer_positions: sequence or (N, 2) array of the observers'
+                tile locations, in the same order.
+            target: (x, y) tile location to check.
+            radius: maximum sight distance in tiles.
+        """
+
+        if not len(observers):
+            return []
+        positions = np.asarray(observer_positions, dtype=np.int64).reshape(-1, 2)
+        distances_sq = ((positions - np.asarray(target, dtype=np.int64)) ** 2).sum(axis=1)
+        candidates = np.flatnonzero(distances_sq <= radius * radius)
+        return [
+            observers[index] for index in candidates.tolist()
+            if cls.has_line_of_sight(map_obj, tuple(positions[index].tolist()), target)
+        ]
+
+
+class PerceptionScheduler:
+    """Spreads perception checks for many observers over several updates.
+
+    Each update checks at most checks_per_update observers, continuing from
+    where the previous update stopped, so the cost per frame stays fixed
+    regardless of the population size. Results from the last check of each
+    observer are kept until it is checked again.
+    """
+
+    def __init__(self, checks_per_update=DEFAULT_CHECKS_PER_UPDATE):
+        self.checks_per_update = checks_per_update
+
+        # Maps observers to (tile location, sight radius) tuples.
+        self._observers = collections.OrderedDict()
+
+        # Maps observers to whether they saw the target at their last
+        # check.
+        self._can_see = {}
+
+    def add_observer(self, observer, tile_loc, radius):
+        self._observers[observer] = (tuple(tile_loc), radius)
+
+    def remove_observer(self, observer):
+        self._observers.pop(observer, None)
+        self._can_see.pop(observer, None)
+
+    def can_see(self, observer):
+        return self._can_see.get(observer, False)
+
+    def get_observers_seeing_target(self):
+        return [observer for observer, seen in self._can_see.items() if seen]
+
+    def update(self, map_obj, target):
+        """Checks the next batch of observers against the target tile.
+
+        Returns:
+            List of the observers in the batch that can now see the target.
+        """
+
+        newly_seeing = []
+        for _ in range(min(self.checks_per_update, len(self._observers))):
+            # Rotate the checked observer to the back of the queue.
+            observer, (tile_loc, radius) = self._observers.popitem(last=False)
+            self._observers[observer] = (tile_loc, radius)
+
+            seen = FieldOfView.has_line_of_sight(map_obj, tile_loc, target, max_distance=radius)
+            if seen and not self._can_see.get(observer, False):
+                newly_seeing.append(observer)
+            self._can_see[observer] = seen
+        return newly_seeing
+
+
+terrain.Terrain.subscribe(FieldOfView.handle_terrain_change)
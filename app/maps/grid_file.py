@@ -0,0 +1,312 @@
+"""This module contains the binary multi-layer grid file format for maps.
+
+A grid file holds one or more named layers of per-tile values (such as
+accessibility flags, region IDs, encounter zones or elevation) for a
+map of width by height tiles. Each layer is split into blocks of
+rows_per_block rows that are stored and compressed independently, so a
+single row block can be read without decoding the rest of the grid.
+
+Layout, all little-endian:
+
+    Header: magic b'MGRD', format version (uint16), number of layers
+        (uint16), width (uint32), height (uint32), rows per block
+        (uint32).
+    Layer table, one entry per layer: name (LAYER_NAME_SIZE bytes of
+        UTF-8, zero padded), NumPy dtype string (DTYPE_SIZE bytes, zero
+        padded), compression (uint8), padding (3 bytes), offset of the
+        layer's block table (uint64).
+    Block tables, one per layer: (offset, stored size) pairs (uint64,
+        uint64) for each row block.
+    Block data.
+
+Blocks are stored raw, zlib compressed, or run-length encoded (a uint32
+run count, then the run lengths as uint32 and the run values in the
+layer dtype). GridFile memory maps the file, so opening it only parses
+the header and tables, and raw blocks are read without copying. The
+most recently decoded compressed blocks of each layer are kept, so
+repeated lookups around the same tiles do not decode them again.
+
+This module requires NumPy.
+"""
+
+import collections
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'MGRD'
+FORMAT_VERSION = 1
+
+DEFAULT_ROWS_PER_BLOCK = 16
+
+# Maximum number of decoded compressed blocks kept per layer.
+MAX_CACHED_BLOCKS_PER_LAYER = 8
+
+LAYER_NAME_SIZE = 32
+DTYPE_SIZE = 8
+
+# Block compression methods.
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_RLE = 2
+
+# Standard layer names.
+ACCESSIBILITY_LAYER = 'accessibility'
+REGION_LAYER = 'region'
+ENCOUNTER_ZONE_LAYER = 'encounter_zone'
+ELEVATION_LAYER = 'elevation'
+
+_HEADER = struct.Struct('<4sHHIII')
+_LAYER_ENTRY = struct.Struct('<{0}s{1}sB3xQ'.format(LAYER_NAME_SIZE, DTYPE_SIZE))
+_BLOCK_ENTRY = struct.Struct('<QQ')
+_RUN_COUNT = struct.Struct('<I')
+
+
+def rle_encode(values):
+    """Returns the run-length encoded bytes for the 1-dimensional array."""
+
+    if not len(values):
+        return _RUN_COUNT.pack(0)
+    run_starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    run_lengths = np.diff(np.concatenate((run_starts, [len(values)])))
+    return _RUN_COUNT.pack(len(run_starts)) + run_lengths.astype('<u4').tobytes() + values[run_starts].tobytes()
+
+
+def rle_decode(data, dtype):
+    """Returns the 1-dimensional array of the dtype decoded from
+    rle_encode() bytes."""
+
+    num_runs = _RUN_COUNT.unpack_from(data, 0)[0]
+    lengths_end = _RUN_COUNT.size + num_runs * 4
+    run_lengths = np.frombuffer(data, dtype='<u4', count=num_runs, offset=_RUN_COUNT.size)
+    run_values = np.frombuffer(data, dtype=dtype, count=num_runs, offset=lengths_end)
+    return np.repeat(run_values, run_lengths)
+
+
+def _encode_block(block, compression):
+    raw = np.ascontiguousarray(block).tobytes()
+    if compression == COMPRESSION_NONE:
+        return raw
+    elif compression == COMPRESSION_ZLIB:
+        return zlib.compress(raw)
+    elif compression == COMPRESSION_RLE:
+        return rle_encode(np.ascontiguousarray(block).ravel())
+    raise Exception('Unknown grid block compression {0}'.format(compression))
+
+
+def write_grid_file(path, layers, rows_per_block=DEFAULT_ROWS_PER_BLOCK, compression=COMPRESSION_ZLIB):
+    """Writes the layers to a grid file.
+
+    Args:
+        path: path of the file to write.
+        layers: dict mapping layer names to 2-dimensional arrays of shape
+            (height, width). Every layer must have the same shape.
+        rows_per_block: number of rows in each stored block.
+        compression: compression for every block, or dict mapping layer
+            names to their compression.
+    """
+
+    if not layers:
+        raise Exception('Grid file needs at least one layer')
+    arrays = [(name, np.asarray(layer)) for name, layer in layers.items()]
+    height, width = arrays[0][1].shape
+    for name, array in arrays:
+        if array.shape != (height, width):
+            raise Exception('Layer {0} has shape {1}, expected {2}'.format(name, array.shape, (height, width)))
+    num_blocks = (height + rows_per_block - 1) // rows_per_block
+
+    # Encode blocks first to know where each one goes.
+    encoded_layers = []
+    for name, array in arrays:
+        layer_compression = compression.get(name, COMPRESSION_ZLIB) if isinstance(compression, dict) \
+            else compression
+        array = array.astype(array.dtype.newbyteorder('<'))
+        blocks = [
+            _encode_block(array[start:start + rows_per_block], layer_compression)
+            for start in range(0, height, rows_per_block)
+        ]
+        encoded_layers.append((name, array.dtype.str, layer_compression, blocks))
+
+    table_offset = _HEADER.size + len(arrays) * _LAYER_ENTRY.size
+    data_offset = table_offset + len(arrays) * num_blocks * _BLOCK_ENTRY.size
+
+    with open(path, 'wb') as grid_file:
+        grid_file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(arrays), width, height, rows_per_block))
+        for index, (name, dtype_str, layer_compression, _) in enumerate(encoded_layers):
+            encoded_name = name.encode('utf-8')
+            if len(encoded_name) > LAYER_NAME_SIZE:
+                raise Exception('Layer name {0} is too long'.format(name))
+            grid_file.write(_LAYER_ENTRY.pack(
+                encoded_name,
+                dtype_str.encode('ascii'),
+                layer_compression,
+                table_offset + index * num_blocks * _BLOCK_ENTRY.size,
+            ))
+
+        offset = data_offset
+        for _, _, _, blocks in encoded_layers:
+            for block in blocks:
+                grid_file.write(_BLOCK_ENTRY.pack(offset, len(block)))
+                offset += len(block)
+
+        for _, _, _, blocks in encoded_layers:
+            for block in blocks:
+                grid_file.write(block)
+
+
+class GridFile:
+    """Memory mapped, read-only grid file.
+
+    Attributes:
+        width: width of every layer in tiles.
+        height: height of every layer in tiles.
+        rows_per_block: number of rows in each stored block.
+        num_blocks: number of row blocks in each layer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            self._file.close()
+            raise Exception('Could not map grid file {0}'.format(path))
+
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise Exception('Grid file {0} is too short'.format(path))
+        magic, version, num_layers, self.width, self.height, self.rows_per_block = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception('{0} is not a grid file'.format(path))
+        if version > FORMAT_VERSION:
+            self.close()
+            raise Exception('Unsupported grid file version {0} in {1}'.format(version, path))
+        self.num_blocks = (self.height + self.rows_per_block - 1) // self.rows_per_block
+
+        # Maps layer names to (dtype, compression, block table offset)
+        # tuples, in file order.
+        self._layers = {}
+        for index in range(num_layers):
+            name, dtype_str, compression, block_table_offset = _LAYER_ENTRY.unpack_from(
+                self._mmap,
+                _HEADER.size + index * _LAYER_ENTRY.size,
+            )
+            self._layers[name.rstrip(b'\0').decode('utf-8')] = (
+                np.dtype(dtype_str.rstrip(b'\0').decode('ascii')),
+                compression,
+                block_table_offset,
+            )
+
+        # Maps layer names to LRU caches mapping block indices to decoded,
+        # read-only block arrays.
+        self._block_cache = {layer_name: collections.OrderedDict() for layer_name in self._layers}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._block_cache = {}
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views of uncompressed blocks are still alive, so the
+                # mapping is released once they are garbage collected.
+                pass
+            self._mmap = None
+        self._file.close()
+
+    def get_layer_names(self):
+        return list(self._layers)
+
+    def has_layer(self, layer_name):
+        return layer_name in self._layers
+
+    def get_layer_dtype(self, layer_name):
+        return self._get_layer_info(layer_name)[0]
+
+    def _get_layer_info(self, layer_name):
+        layer_info = self._layers.get(layer_name, None)
+        if layer_info is None:
+            raise Exception('No layer {0} in grid file {1}'.format(layer_name, self.path))
+        return layer_info
+
+    def get_row_block(self, layer_name, block_index):
+        """Returns the read-only array of shape (rows, width) for the row
+        block, decoding only that block unless it is cached. Uncompressed
+        blocks are views of the mapped file."""
+
+        if not (0 <= block_index < self.num_blocks):
+            raise Exception('Invalid row block {0} for grid file {1}'.format(block_index, self.path))
+        dtype, compression, block_table_offset = self._get_layer_info(layer_name)
+
+        block_cache = self._block_cache[layer_name]
+        cached_block = block_cache.get(block_index, None)
+        if cached_block is not None:
+            block_cache.move_to_end(block_index)
+            return cached_block
+
+        offset, size = _BLOCK_ENTRY.unpack_from(self._mmap, block_table_offset + block_index * _BLOCK_ENTRY.size)
+        num_rows = min(self.rows_per_block, self.height - block_index * self.rows_per_block)
+
+        if compression == COMPRESSION_NONE:
+            values = np.frombuffer(self._mmap, dtype=dtype, count=num_rows * self.width, offset=offset)
+        elif compression == COMPRESSION_ZLIB:
+            values = np.frombuffer(zlib.decompress(self._mmap[offset:offset + size]), dtype=dtype)
+        elif compression == COMPRESSION_RLE:
+            values = rle_decode(self._mmap[offset:offset + size], dtype)
+        else:
+            raise Exception('Unknown grid block compression {0} in {1}'.format(compression, self.path))
+
+        if len(values) != num_rows * self.width:
+            raise Exception('Corrupt row block {0} of layer {1} in {2}'.format(block_index, layer_name, self.path))
+        block = values.reshape(num_rows, self.width)
+
+        if compression != COMPRESSION_NONE:
+            # Raw blocks are views of the mapped file and cheap to make
+            # again, so only decoded blocks are cached.
+            block.flags.writeable = False
+            block_cache[block_index] = block
+            while len(block_cache) > MAX_CACHED_BLOCKS_PER_LAYER:
+                block_cache.popitem(last=False)
+        return block
+
+    def get_rows(self, layer_name, start_row, end_row):
+        """Returns array of the layer's rows from start_row up to but not
+        including end_row, decoding only the blocks holding them."""
+
+        start_row, end_row = max(0, start_row), min(self.height, end_row)
+        if start_row >= end_row:
+            return np.zeros((0, self.width), dtype=self.get_layer_dtype(layer_name))
+
+        first_block = start_row // self.rows_per_block
+        last_block = (end_row - 1) // self.rows_per_block
+        rows = np.concatenate([
+            self.get_row_block(layer_name, block_index) for block_index in range(first_block, last_block + 1)
+        ])
+        offset = first_block * self.rows_per_block
+        return rows[start_row - offset:end_row - offset]
+
+    def get_row(self, layer_name, row):
+        return self.get_rows(layer_name, row, row + 1)[0]
+
+    def get_value(self, layer_name, tile_loc):
+        x, y = tile_loc
+        if not (0 <= y < self.height):
+            raise Exception('Invalid row {0} for grid file {1}'.format(y, self.path))
+        block = self.get_row_block(layer_name, y // self.rows_per_block)
+        return block[y % self.rows_per_block, x].item()
+
+    def read_layer(self, layer_name):
+        """Returns a writable array of shape (height, width) of the whole
+        layer."""
+
+        return np.array(self.get_rows(layer_name, 0, self.height))
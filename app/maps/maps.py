@@ -3,9 +3,9 @@ import logging
 import os
 import pygame
 
-from app.maps import directions
-from app.overworld_obj import entity, interactive_obj
-from app.viewing import viewing
+from app.maps import connectivity, directions, exploration, grid_file, occupancy, spatial_hash, tileset
+from app.overworld_obj import entity, entity_store, interactive_obj
+from app.viewing import lighting, particles, viewing
 from app.tiles import tiles
 from util import util
 
@@ -37,8 +37,11 @@ class Map:
     #
     # top_left represents the (x,y) pixel coordinate on the display screen where the
     # top left corner of the map should start.
+    #
+    # tile_renderer is an optional tileset.TileMapRenderer that draws the map
+    # from tile index layers, in which case image_path is not used.
     def __init__(self, map_id, image_path, width_px, height_px, accessibility_grid, connector_tile_dict=None,
-                 adj_map_dict=None, top_left=(0, 0), music_file=''):
+                 adj_map_dict=None, top_left=(0, 0), music_file='', tile_renderer=None):
         self.height_in_tiles = 0
         self.width_in_tiles = 0
         self.height_in_px = height_px
@@ -59,6 +62,7 @@ class Map:
 
         # Maps tile location tuples to
         # the tile ID for the new tile at the location.
+        # Changed through terrain.Terrain.apply_changes().
         self.changed_tile_mapping = {}
 
         # Dict that maps tile location tuple
@@ -76,15 +80,14 @@ class Map:
         # make up the object's collision rect
         self.bottom_left_tile_obj_mapping = {}
 
-        # dict that maps a tile coordinate tuple to the bottom left
-        # tile coordinate tuple of the object whose collision rect occupies
-        # that tile. If no object occupies the tile, then the dict
-        # should not have an entry for that tile location.
-        # TODO - collision set, not just collision rect
-        self.occupied_tile_to_bottom_left = {}
+        # Maps bottom left tile coordinate tuples to the
+        # interactive_obj.ObjectInstance placed there.
+        self.object_instances = {}
 
-        # (x,y) tuple representing location of protagonist.
+        # (x,y) tuple representing location of protagonist, and its
+        # occupancy handle.
         self._protagonist_location = None
+        self._protagonist_handle = occupancy.NO_HANDLE
 
         # maps Tile grid location (x,y) tuple to a
         # [interactive obj, remaining ticks to respawn] list
@@ -92,10 +95,18 @@ class Map:
         # respawn. For delayed respawns only
         self.pending_respawns = {}
 
-        # Set up image
-        self._rendered_map_image = pygame.image.load(image_path).convert_alpha()
-        if not self._rendered_map_image:
-            raise Exception('Failed to load map image')
+        # Optional grid_file.GridFile with extra per-tile layers, such as
+        # regions and encounter zones.
+        self.grid_file = None
+
+        # Set up image, unless the map is drawn from tiles.
+        self.tile_renderer = tile_renderer
+        self.image_path = None if tile_renderer else image_path
+        self._rendered_map_image = None
+        if not tile_renderer:
+            self._rendered_map_image = pygame.image.load(image_path).convert_alpha()
+            if not self._rendered_map_image:
+                raise Exception('Failed to load map image')
 
         if accessibility_grid:
             grid_width = 0
@@ -142,6 +153,16 @@ class Map:
                 for x, y in adj_map_dict.items():
                     self.adj_map_dict[x] = y
 
+        # Object handle for each tile, for collision checks.
+        self.occupancy = occupancy.OccupancyGrid(self.width_in_tiles, self.height_in_tiles)
+
+        # Bottom left tile locations of the protagonist, placed objects and
+        # NPCs, for proximity queries.
+        self.spatial_hash = spatial_hash.SpatialHash()
+
+        # NPCs and monsters on the map.
+        self.entity_store = entity_store.EntityStore(spatial_hash=self.spatial_hash)
+
     """
     # interactive_obj_dict must be a dict that maps a tuple of integers
     # (representing the X and Y tile coordinates of the map, NOT
@@ -209,11 +230,17 @@ class Map:
                 if self._protagonist_location:
                     # Clear old tile location
                     self.bottom_left_tile_obj_mapping.pop(self._protagonist_location, None)
-                    self.occupied_tile_to_bottom_left.pop(self._protagonist_location, None)
+                    self.occupancy.remove(self._protagonist_handle)
 
                 # Mark new location as occupied
                 self.bottom_left_tile_obj_mapping[new_location] = [entity.EntityID.PROTAGONIST, {new_location}]
-                self.occupied_tile_to_bottom_left[new_location] = new_location
+                self._protagonist_handle = self.occupancy.place(
+                    entity.EntityID.PROTAGONIST,
+                    occupancy.get_footprint(),
+                    new_location,
+                )
+                self.spatial_hash.move(entity.EntityID.PROTAGONIST, new_location)
+                exploration.Exploration.reveal_around(self, new_location)
 
                 logging.debug('Moving main character from {0} to {1}'.format(
                     self._protagonist_location,
@@ -234,18 +261,35 @@ class Map:
         if self:
             self.adj_map_dict.pop(direction, None)
 
+    """
+
     # get (Map ID, destination tile coordinate) tuple for the map
     # that is adjacent to this map in the given direction.
     # None if no such neighboring map exists
     def get_adjacent_map_info(self, direction):
         return self.adj_map_dict.get(direction, None)
-    """
+
+    # get (Map ID, destination tile coordinate) tuple for the connector
+    # tile at the given tile location. None if the tile is not a connector.
+    def get_connector_info(self, tile_loc):
+        return self.connector_tile_dict.get(tile_loc, None)
 
     # Returns bottom left tile location tuple of the bottom left
     # tile associated with the object occupying the given tile location tuple,
     # None if the provided tile location tuple is not occupied.
     def get_bottom_left_tile_of_occupied_tile(self, tile_loc):
-        return self.occupied_tile_to_bottom_left.get(tile_loc, None)
+        return self.occupancy.get_bottom_left_of_tile(tile_loc)
+
+    # Returns set of music file paths for the maps adjacent to this map,
+    # excluding this map's own music. Used to preload music before the
+    # protagonist changes maps.
+    def get_adjacent_music_files(self):
+        music_files = set()
+        for adj_info in self.adj_map_dict.values():
+            adj_map = Map.map_listing.get(adj_info[0], None) if adj_info else None
+            if adj_map and adj_map.music_file and adj_map.music_file != self.music_file:
+                music_files.add(adj_map.music_file)
+        return music_files
 
     """
     # Sets an interactive object corresponding to obj_id
@@ -438,13 +482,84 @@ class Map:
         return ret_tile
     """
 
+    # Places an instance of the object template with the given object ID
+    # so that its bottom left tile is at the given tile location.
+    # Returns the new interactive_obj.ObjectInstance, or None if the
+    # template does not exist or the object does not fit at the location.
+    def place_object(self, object_id, bottom_left_tile_loc):
+        template = interactive_obj.ObjectTemplate.get_template(object_id)
+        if not template:
+            logging.warning('Could not find object template with ID {0}'.format(object_id))
+            return None
+
+        footprint = occupancy.get_footprint(template.collision_width, template.collision_height)
+        handle = self.occupancy.place(object_id, footprint, bottom_left_tile_loc)
+        if handle == occupancy.NO_HANDLE:
+            logging.warning('Cannot place object {0} at {1}'.format(object_id, bottom_left_tile_loc))
+            return None
+
+        instance = interactive_obj.ObjectInstance(template, bottom_left_tile_loc)
+        self.object_instances[bottom_left_tile_loc] = instance
+        self.spatial_hash.insert(instance, bottom_left_tile_loc)
+        connectivity.Connectivity.update_tiles(self, footprint.get_tile_set(bottom_left_tile_loc))
+        if template.light_radius:
+            lighting.Lighting.set_light(
+                self.map_id,
+                instance,
+                (bottom_left_tile_loc[0] + template.collision_width // 2,
+                 bottom_left_tile_loc[1] - template.collision_height // 2),
+                template.light_radius,
+            )
+        return instance
+
+    # Returns boolean array of whether the object template with the given
+    # object ID can be placed at each of the candidate bottom left tile
+    # locations.
+    def get_valid_placements(self, object_id, bottom_left_tile_locs):
+        template = interactive_obj.ObjectTemplate.get_template(object_id)
+        if not template:
+            raise Exception('No object template with ID {0}'.format(object_id))
+        footprint = occupancy.get_footprint(template.collision_width, template.collision_height)
+        return self.occupancy.can_place_many(footprint, bottom_left_tile_locs)
+
+    # Removes the placed object occupying the given tile location.
+    # Returns the removed interactive_obj.ObjectInstance, or None if no
+    # placed object occupies the tile.
+    def remove_object(self, tile_loc):
+        handle = self.occupancy.get_handle(tile_loc)
+        if handle == occupancy.NO_HANDLE:
+            return None
+
+        instance = self.object_instances.pop(self.occupancy.get_bottom_left(handle), None)
+        if instance:
+            footprint = self.occupancy.get_object_footprint(handle)
+            self.occupancy.remove(handle)
+            self.spatial_hash.remove(instance)
+            lighting.Lighting.remove_light(self.map_id, instance)
+            connectivity.Connectivity.update_tiles(self, footprint.get_tile_set(instance.bottom_left_tile_loc))
+        return instance
+
+    # Returns True if the tile is occupied by a placed object, as opposed
+    # to being free or occupied by a moving entity such as the protagonist.
+    def is_tile_blocked_by_object(self, tile_loc):
+        handle = self.occupancy.get_handle(tile_loc)
+        return (handle != occupancy.NO_HANDLE) and (handle != self._protagonist_handle)
+
+    # Returns boolean array of shape (height, width) that is True for
+    # tiles occupied by placed objects.
+    def get_object_blocked_mask(self):
+        cells = self.occupancy.cells
+        return (cells != occupancy.NO_HANDLE) & (cells != self._protagonist_handle)
+
     def get_object_occupying_tile(self, tile_position):
         occupying_object = None
         if tile_position and self.location_within_bounds(tile_position):
             # Check if the tile is part of an object's collision space.
             bottom_left_tile_pos = self.get_bottom_left_tile_of_occupied_tile(tile_position)
 
-            if bottom_left_tile_pos:
+            if bottom_left_tile_pos in self.object_instances:
+                occupying_object = self.object_instances[bottom_left_tile_pos]
+            elif bottom_left_tile_pos:
                 # Get ID of object occupying the space.
                 obj_id = self.bottom_left_tile_obj_mapping.get(bottom_left_tile_pos, [None])[0]
 
@@ -533,10 +648,7 @@ class Map:
 
     def tile_occupied(self, tile_loc):
         if tile_loc:
-            if self.get_bottom_left_tile_of_occupied_tile(tile_loc):
-                return True
-            if self.bottom_left_tile_obj_mapping.get(tile_loc, None):
-                return True
+            return self.occupancy.is_occupied(tile_loc)
         return False
 
     # returns True if the tile position to check is within current map
@@ -552,6 +664,30 @@ class Map:
             return self.accessibility_grid[tile_pos[1]][tile_pos[0]]
         return tiles.Accessibility.TILE_NOT_ACCESSIBLE_F
 
+    # Returns the value of the named grid file layer at the tile location,
+    # or default if the map has no such layer.
+    def get_grid_value(self, layer_name, tile_loc, default=0):
+        if self.grid_file and self.grid_file.has_layer(layer_name) and self.location_within_bounds(tile_loc):
+            return self.grid_file.get_value(layer_name, tile_loc)
+        return default
+
+    # Returns boolean array of shape (height, width) of the tiles that
+    # entities moving with the transport flag can move onto. Tiles taken by
+    # placed objects or the protagonist are not passable.
+    def get_entity_passable_mask(self, transport_flag=tiles.Accessibility.WALKABLE_F):
+        map_connectivity = connectivity.Connectivity.get_map_connectivity(self.map_id) \
+            or connectivity.MapConnectivity(self)
+        return map_connectivity.get_labels(transport_flag).passable & self.occupancy.get_free_mask()
+
+    # Advances the map's entities by elapsed_ms milliseconds, moving them
+    # with the transport flag. Returns array of the handles of the entities
+    # that moved onto a new tile, or an empty list if the map has no
+    # entities.
+    def update_entities(self, elapsed_ms, transport_flag=tiles.Accessibility.WALKABLE_F):
+        if not len(self.entity_store):
+            return []
+        return self.entity_store.update(elapsed_ms, self.get_entity_passable_mask(transport_flag))
+
     def can_access_tile(self, dest_tile_pos, access_method):
         accessibility_flags = self.get_accessibility_flags_from_pos(dest_tile_pos)
         return access_method & accessibility_flags > 0
@@ -562,7 +698,11 @@ class Map:
     # section of the map base image to blit, rather than blitting the whole map.
     # Setting to None will blit the whole map
     def blit_base_image(self, surface, tile_subset_rect=None):
-        if surface and self._rendered_map_image and self.top_left_position:
+        if surface and self.tile_renderer and self.top_left_position:
+            if tile_subset_rect and len(tile_subset_rect) != 4:
+                raise Exception('Invalid tile subset rect length: {}'.format(len(tile_subset_rect)))
+            self.tile_renderer.blit_onto_surface(surface, self.top_left_position, tile_subset_rect=tile_subset_rect)
+        elif surface and self._rendered_map_image and self.top_left_position:
             if tile_subset_rect:
                 if len(tile_subset_rect) != 4:
                     raise Exception('Invalid tile subset rect length: {}'.format(len(tile_subset_rect)))
@@ -630,6 +770,17 @@ class Map:
                         # Check if this tile is a bottom left tile for an
                         # interactive object.
                         # TODO - adjust if object is moving?
+                        instance = self.object_instances.get(tile_loc, None)
+                        if instance:
+                            instance.blit_onto_surface(
+                                surface,
+                                bottom_left_pixel=(
+                                    self.top_left_position[0] + (tile_loc[0] * tiles.TILE_SIZE),
+                                    self.top_left_position[1] + ((tile_loc[1] + 1) * tiles.TILE_SIZE)
+                                ),
+                                blit_time_ms=blit_time_ms,
+                            )
+
                         obj_info = self.bottom_left_tile_obj_mapping.get(tile_loc, [])
                         if obj_info:
                             obj_to_blit = interactive_obj.InteractiveObject.get_interactive_object(obj_info[0])
@@ -664,11 +815,15 @@ class Map:
         if self and surface and self.top_left_position:
             self.blit_base_image(surface, tile_subset_rect=tile_subset_rect)
             self.blit_interactive_objects(surface, tile_subset_rect=tile_subset_rect, blit_time_ms=blit_time_ms)
+            particles.Particles.blit_onto_surface(self, surface)
+            lighting.Lighting.blit_overlay(self, surface, tile_subset_rect=tile_subset_rect)
+            exploration.Exploration.blit_overlay(self, surface, tile_subset_rect=tile_subset_rect)
 
     # scroll map in the indicated direction for the indicated distance
     # also pass in surface object to blit on and update
+    # if blit is False, only moves the map top left position.
     # does NOT update the main display - caller will have to do that
-    def scroll(self, surface, scroll_direction, distance, tile_subset_rect=None):
+    def scroll(self, surface, scroll_direction, distance, tile_subset_rect=None, blit=True):
         if self and surface and distance > 0:
             new_pixel_location = None
             curr_top_left = self.top_left_position
@@ -691,7 +846,8 @@ class Map:
             if new_pixel_location:
                 # Update map top left and blit map.
                 self.top_left_position = new_pixel_location
-                self.blit_onto_surface(surface, tile_subset_rect=tile_subset_rect)
+                if blit:
+                    self.blit_onto_surface(surface, tile_subset_rect=tile_subset_rect)
 
     """
     def execute_spawn_action(self, tile_loc, obj_id):
@@ -798,24 +954,63 @@ class Map:
         if not map_id:
             raise Exception('No map ID provided from {}'.format(map_yaml_path))
 
-        image_file = map_data.get('image_file', None)
-        if not image_file:
-            raise Exception('No map image file provided from {}'.format(map_yaml_path))
-        image_path = os.path.join(cls.get_map_images_dir_path(), image_file)
-        if not os.path.isfile(image_path):
-            raise Exception('Map image file {} not found.'.format(image_path))
-        image_width = map_data.get('image_width_px', None)
-        image_height = map_data.get('image_height_px', None)
-        if not image_width:
-            raise Exception('No map image width provided from {}'.format(map_yaml_path))
-        if not image_height:
-            raise Exception('No map image height provided from {}'.format(map_yaml_path))
-
+        image_path = None
+        tile_renderer = None
+        tileset_id = map_data.get('tileset', None)
+        if tileset_id:
+            # Tile-based map, with tile_layers as encoded uint16 layers of
+            # width_in_tiles by height_in_tiles indices, bottom layer first.
+            map_tileset = tileset.Tileset.get_tileset(tileset_id)
+            if not map_tileset:
+                raise Exception('Unknown tileset {0} in {1}'.format(tileset_id, map_yaml_path))
+            width_in_tiles = map_data.get('width_in_tiles', None)
+            height_in_tiles = map_data.get('height_in_tiles', None)
+            if not width_in_tiles or not height_in_tiles:
+                raise Exception('No tile dimensions provided from {}'.format(map_yaml_path))
+            layer_strs = map_data.get('tile_layers', None)
+            if not layer_strs:
+                raise Exception('No tile_layers field provided from {}'.format(map_yaml_path))
+            tile_renderer = tileset.TileMapRenderer(
+                map_tileset,
+                [tileset.decode_layer(layer_str, width_in_tiles, height_in_tiles) for layer_str in layer_strs],
+            )
+            image_width = width_in_tiles * tiles.TILE_SIZE
+            image_height = height_in_tiles * tiles.TILE_SIZE
+        else:
+            image_file = map_data.get('image_file', None)
+            if not image_file:
+                raise Exception('No map image file provided from {}'.format(map_yaml_path))
+            image_path = os.path.join(cls.get_map_images_dir_path(), image_file)
+            if not os.path.isfile(image_path):
+                raise Exception('Map image file {} not found.'.format(image_path))
+            image_width = map_data.get('image_width_px', None)
+            image_height = map_data.get('image_height_px', None)
+            if not image_width:
+                raise Exception('No map image width provided from {}'.format(map_yaml_path))
+            if not image_height:
+                raise Exception('No map image height provided from {}'.format(map_yaml_path))
+
+        # Binary grid file with the accessibility layer and any other
+        # per-tile layers, mapped rather than parsed.
+        map_grid_file = None
+        grid_file_name = map_data.get('grid_file', None)
+        if grid_file_name:
+            grid_file_path = os.path.join(util.get_grids_path(), grid_file_name)
+            if not os.path.isfile(grid_file_path):
+                raise Exception('Map grid file {} not found.'.format(grid_file_path))
+            map_grid_file = grid_file.GridFile(grid_file_path)
+
+        # Tile-based maps derive their accessibility grid from the tileset
+        # unless one is given.
         accessibility_grid_str = map_data.get('accessibility_grid', None)
-        if not accessibility_grid_str:
+        if map_grid_file and map_grid_file.has_layer(grid_file.ACCESSIBILITY_LAYER):
+            accessibility_grid = map_grid_file.read_layer(grid_file.ACCESSIBILITY_LAYER).tolist()
+        elif accessibility_grid_str:
+            accessibility_grid = cls.convert_grid_str_to_nested_int_list(accessibility_grid_str)
+        elif tile_renderer:
+            accessibility_grid = tile_renderer.get_accessibility_grid()
+        else:
             raise Exception('No accessibility_grid field provided from {}'.format(map_yaml_path))
-
-        accessibility_grid = cls.convert_grid_str_to_nested_int_list(accessibility_grid_str)
         if not accessibility_grid:
             raise Exception('Could not parse accessibility grid from {}'.format(map_yaml_path))
 
@@ -825,9 +1020,28 @@ class Map:
             if not os.path.isfile(music_file):
                 raise Exception('Map music file {} not found.'.format(music_file))
 
-        # TODO connector tile dict
-
-        # TODO adjacent map dict
+        # Connector tiles are listed as {tile: [x, y], dest_map: map ID,
+        # dest_tile: [x, y]} entries.
+        connector_tile_dict = {}
+        for connector_data in map_data.get('connector_tiles', None) or []:
+            try:
+                connector_tile_dict[tuple(connector_data['tile'])] = (
+                    connector_data['dest_map'],
+                    tuple(connector_data['dest_tile']),
+                )
+            except (KeyError, TypeError):
+                raise Exception('Invalid connector tile {0} in {1}'.format(connector_data, map_yaml_path))
+
+        # Adjacent maps map direction names to [map ID, [x, y]] lists.
+        adj_map_dict = {}
+        for direction_name, adj_data in (map_data.get('adjacent_maps', None) or {}).items():
+            try:
+                adj_map_dict[directions.CardinalDirection[direction_name.upper()]] = (
+                    adj_data[0],
+                    tuple(adj_data[1]),
+                )
+            except (KeyError, IndexError, TypeError):
+                raise Exception('Invalid adjacent map {0} in {1}'.format(direction_name, map_yaml_path))
 
         logging.debug('Creating map with ID {0}, image path {1}, image width {2}, image height {3}'.format(
             map_id,
@@ -842,8 +1056,12 @@ class Map:
             image_width,
             image_height,
             accessibility_grid,
+            connector_tile_dict=connector_tile_dict,
+            adj_map_dict=adj_map_dict,
             music_file=music_file,
+            tile_renderer=tile_renderer,
         )
+        ret_map.grid_file = map_grid_file
 
         # TODO - init interactive overworld_obj
 
@@ -861,8 +1079,10 @@ class Map:
     def build_maps(cls):
         logging.info('Building maps')
         try:
+            tileset.Tileset.build_tilesets()
             for map_yaml in glob.glob(os.path.join(util.get_yaml_path(), 'maps', '*.yml')):
                 if not Map.map_factory(map_yaml):
                     raise Exception('Failed to build map for {}'.format(map_yaml))
+            connectivity.Connectivity.build(Map.map_listing.values())
         except Exception as e:
             raise Exception('Failed to build maps: {}', e)
@@ -0,0 +1,220 @@
+"""This module contains the dense occupancy grid for maps.
+
+Each map cell holds the handle of the object occupying it, or NO_HANDLE.
+Objects are placed with a Footprint, the precomputed tile offsets of a
+collision rectangle relative to its bottom left tile. Footprints are
+shared by every object with the same collision dimensions, so placing,
+moving and removing an object only touches its own cells, and checking a
+cell is a single array lookup.
+
+can_place_many() tests a footprint at many candidate locations at once,
+which keeps spawning and movement checks cheap on crowded maps.
+"""
+
+import logging
+
+import numpy as np
+
+NO_HANDLE = -1
+
+
+class Footprint:
+    """Tile offsets of a collision rectangle from its bottom left tile.
+
+    The user should use get_footprint() rather than creating Footprint
+    objects, so that footprints are shared.
+    """
+
+    __slots__ = ('width', 'height', 'offsets_x', 'offsets_y', 'offsets')
+
+    # Maps (width, height) tuples to Footprints.
+    _footprint_listing = {}
+
+    def __init__(self, width, height):
+        if width < 1 or height < 1:
+            raise Exception('Invalid footprint dimensions {0}x{1}'.format(width, height))
+
+        self.width = width
+        self.height = height
+
+        # Rows extend upwards from the bottom left tile.
+        offsets_y, offsets_x = np.mgrid[-(height - 1):1, 0:width]
+        self.offsets_x = offsets_x.ravel().astype(np.int32)
+        self.offsets_y = offsets_y.ravel().astype(np.int32)
+        self.offsets = tuple(zip(self.offsets_x.tolist(), self.offsets_y.tolist()))
+
+    def get_tile_set(self, bottom_left_tile_loc):
+        x, y = bottom_left_tile_loc
+        return {(x + offset_x, y + offset_y) for offset_x, offset_y in self.offsets}
+
+
+def get_footprint(collision_width=1, collision_height=1):
+    """Returns the shared Footprint for the collision dimensions."""
+
+    key = (collision_width, collision_height)
+    footprint = Footprint._footprint_listing.get(key, None)
+    if footprint is None:
+        footprint = Footprint(collision_width, collision_height)
+        Footprint._footprint_listing[key] = footprint
+    return footprint
+
+
+class OccupancyGrid:
+    """Array of object handles for each tile of a map.
+
+    Handles are small integers assigned on placement and reused after
+    removal. The grid also remembers the object ID, bottom left tile and
+    footprint for each handle.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = np.full((height, width), NO_HANDLE, dtype=np.int32)
+
+        # Per-handle records, indexed by handle. Free handles hold None.
+        self._object_ids = []
+        self._bottom_left_locs = []
+        self._footprints = []
+        self._free_handles = []
+
+    def __len__(self):
+        return len(self._object_ids) - len(self._free_handles)
+
+    def clear(self):
+        self.cells.fill(NO_HANDLE)
+        self._object_ids = []
+        self._bottom_left_locs = []
+        self._footprints = []
+        self._free_handles = []
+
+    def within_bounds(self, tile_loc):
+        return (0 <= tile_loc[0] < self.width) and (0 <= tile_loc[1] < self.height)
+
+    def get_handle(self, tile_loc):
+        """Returns handle of the object occupying the tile, or NO_HANDLE if
+        the tile is free or out of bounds."""
+
+        x, y = tile_loc
+        if (0 <= x < self.width) and (0 <= y < self.height):
+            return int(self.cells[y, x])
+        return NO_HANDLE
+
+    def is_occupied(self, tile_loc):
+        return self.get_handle(tile_loc) != NO_HANDLE
+
+    def get_object_id(self, handle):
+        return self._object_ids[handle]
+
+    def get_bottom_left(self, handle):
+        return self._bottom_left_locs[handle]
+
+    def get_object_footprint(self, handle):
+        return self._footprints[handle]
+
+    def get_bottom_left_of_tile(self, tile_loc):
+        """Returns bottom left tile of the object occupying the tile, or
+        None if the tile is free."""
+
+        handle = self.get_handle(tile_loc)
+        if handle == NO_HANDLE:
+            return None
+        return self._bottom_left_locs[handle]
+
+    def can_place(self, footprint, bottom_left_tile_loc, ignore_handle=NO_HANDLE):
+        """Returns True if every tile of the footprint at the location is
+        within bounds and free. Tiles occupied by ignore_handle count as
+        free, for checking an object's own move."""
+
+        xs = footprint.offsets_x + bottom_left_tile_loc[0]
+        ys = footprint.offsets_y + bottom_left_tile_loc[1]
+        if xs.min() < 0 or ys.min() < 0 or xs.max() >= self.width or ys.max() >= self.height:
+            return False
+        cells = self.cells[ys, xs]
+        return bool(np.all((cells == NO_HANDLE) | (cells == ignore_handle)))
+
+    def can_place_many(self, footprint, bottom_left_tile_locs, ignore_handle=NO_HANDLE):
+        """Returns boolean array of whether the footprint can be placed at
+        each of the candidate bottom left tile locations.
+
+        Args:
+            footprint: Footprint to test.
+            bottom_left_tile_locs: sequence or (N, 2) array of (x, y) tile
+                locations.
+            ignore_handle: handle whose tiles count as free.
+        """
+
+        locs = np.asarray(bottom_left_tile_locs, dtype=np.int32).reshape(-1, 2)
+        xs = locs[:, 0, None] + footprint.offsets_x
+        ys = locs[:, 1, None] + footprint.offsets_y
+        valid = np.all((xs >= 0) & (ys >= 0) & (xs < self.width) & (ys < self.height), axis=1)
+
+        # Clip so out of bounds candidates can still be indexed.
+        cells = self.cells[np.clip(ys, 0, self.height - 1), np.clip(xs, 0, self.width - 1)]
+        free = np.all((cells == NO_HANDLE) | (cells == ignore_handle), axis=1)
+        return valid & free
+
+    def _stamp(self, footprint, bottom_left_tile_loc, handle):
+        xs = footprint.offsets_x + bottom_left_tile_loc[0]
+        ys = footprint.offsets_y + bottom_left_tile_loc[1]
+        self.cells[ys, xs] = handle
+
+    def place(self, object_id, footprint, bottom_left_tile_loc):
+        """Places the object with its bottom left tile at the location.
+
+        Returns:
+            Handle for the placed object, or NO_HANDLE if the footprint does
+            not fit at the location.
+        """
+
+        if not self.can_place(footprint, bottom_left_tile_loc):
+            return NO_HANDLE
+
+        if self._free_handles:
+            handle = self._free_handles.pop()
+            self._object_ids[handle] = object_id
+            self._bottom_left_locs[handle] = bottom_left_tile_loc
+            self._footprints[handle] = footprint
+        else:
+            handle = len(self._object_ids)
+            self._object_ids.append(object_id)
+            self._bottom_left_locs.append(bottom_left_tile_loc)
+            self._footprints.append(footprint)
+
+        self._stamp(footprint, bottom_left_tile_loc, handle)
+        return handle
+
+    def remove(self, handle):
+        """Clears the object's tiles and frees its handle. Returns the
+        removed object's ID, or None if the handle is not in use."""
+
+        if handle == NO_HANDLE or handle >= len(self._object_ids) or self._footprints[handle] is None:
+            return None
+
+        object_id = self._object_ids[handle]
+        self._stamp(self._footprints[handle], self._bottom_left_locs[handle], NO_HANDLE)
+        self._object_ids[handle] = None
+        self._bottom_left_locs[handle] = None
+        self._footprints[handle] = None
+        self._free_handles.append(handle)
+        return object_id
+
+    def move(self, handle, new_bottom_left_tile_loc):
+        """Moves the object to the new location if its footprint fits there.
+        Returns True upon success, False otherwise."""
+
+        footprint = self._footprints[handle]
+        if not self.can_place(footprint, new_bottom_left_tile_loc, ignore_handle=handle):
+            logging.debug('Cannot move handle %d to %s', handle, new_bottom_left_tile_loc)
+            return False
+
+        self._stamp(footprint, self._bottom_left_locs[handle], NO_HANDLE)
+        self._stamp(footprint, new_bottom_left_tile_loc, handle)
+        self._bottom_left_locs[handle] = new_bottom_left_tile_loc
+        return True
+
+    def get_free_mask(self):
+        """Returns boolean array of shape (height, width) that is True for
+        free tiles."""
+
+        return self.cells == NO_HANDLE
@@ -0,0 +1,289 @@
+"""This module contains the hierarchical route planner for cross-map travel.
+
+Maps link together through their adjacent maps (walking off a map edge)
+and connector tiles. The planner builds a portal graph per transport flag
+whose nodes are the tiles where travel enters a map, and whose edges are
+the map exits reachable from each entry, weighted by cached distance
+fields. A route request searches this small graph, and only then traces
+tile paths on the maps the route actually crosses.
+
+Unreachable requests are rejected up front by the connectivity labels.
+Distance fields and portal graphs are cached and invalidated when a map's
+connectivity labels change.
+
+This module requires NumPy.
+"""
+
+import collections
+import heapq
+import itertools
+import logging
+
+import numpy as np
+
+from app.maps import connectivity, directions, distance_fields, maps
+
+# Maximum number of cached distance fields.
+MAX_CACHED_FIELDS = 512
+
+# Exit kinds.
+EDGE_EXIT = 'edge'
+CONNECTOR_EXIT = 'connector'
+
+# Portal graph search node for the destination tile.
+GOAL_NODE = 'goal'
+
+
+class RouteLeg:
+    """Part of a route on a single map.
+
+    Attributes:
+        map_id: ID of the map.
+        tiles: list of (x, y) tile locations to move through, starting at
+            the tile where the leg begins.
+        exit_kind: EDGE_EXIT if the leg ends by walking off the map edge,
+            CONNECTOR_EXIT if it ends on a connector tile, or None for the
+            final leg.
+    """
+
+    def __init__(self, map_id, tiles, exit_kind=None):
+        self.map_id = map_id
+        self.tiles = tiles
+        self.exit_kind = exit_kind
+
+
+class Route:
+    """Planned route across one or more maps.
+
+    Attributes:
+        legs: list of RouteLeg objects in travel order.
+        num_moves: total number of single-tile moves, counting each walk
+            across a map edge as one move.
+    """
+
+    def __init__(self, legs, num_moves):
+        self.legs = legs
+        self.num_moves = num_moves
+
+    def get_map_ids(self):
+        return [leg.map_id for leg in self.legs]
+
+
+class RoutePlanner:
+    """Plans routes between tiles on any maps.
+
+    The user should not generate RoutePlanner objects, as the class is
+    primarily for class methods and class-level caches.
+    """
+
+    # LRU cache mapping (map ID, transport flag, source tile) to a
+    # (connectivity version, distance field) tuple.
+    _field_cache = collections.OrderedDict()
+
+    # Maps transport flags to (map versions, portal graph) tuples. The
+    # portal graph maps entry nodes (map ID, tile) to lists of
+    # (cost, next entry node, exit kind, exit tile) tuples.
+    _portal_graphs = {}
+
+    @classmethod
+    def clear_cache(cls):
+        cls._field_cache = collections.OrderedDict()
+        cls._portal_graphs = {}
+
+    @staticmethod
+    def get_map_version(map_id):
+        map_connectivity = connectivity.Connectivity.get_map_connectivity(map_id)
+        return map_connectivity.version if map_connectivity else 0
+
+    @staticmethod
+    def get_passable(map_obj, transport_flag):
+        """Returns boolean array of the tiles of the map that can be moved
+        through with the transport flag."""
+
+        map_connectivity = connectivity.Connectivity.get_map_connectivity(map_obj.map_id)
+        if map_connectivity:
+            return map_connectivity.get_labels(transport_flag).passable
+
+        accessibility = np.array(map_obj.accessibility_grid, dtype=np.int32)
+        return ((accessibility & transport_flag) > 0) & ~map_obj.get_object_blocked_mask()
+
+    @classmethod
+    def get_distance_field(cls, map_obj, transport_flag, source_tile):
+        """Returns the cached distance field from the source tile on the
+        map."""
+
+        key = (map_obj.map_id, transport_flag, source_tile)
+        version = cls.get_map_version(map_obj.map_id)
+        cached = cls._field_cache.get(key, None)
+        if cached and cached[0] == version:
+            cls._field_cache.move_to_end(key)
+            return cached[1]
+
+        field = distance_fields.compute_distance_field(cls.get_passable(map_obj, transport_flag), [source_tile])
+        cls._field_cache[key] = (version, field)
+        cls._field_cache.move_to_end(key)
+        while len(cls._field_cache) > MAX_CACHED_FIELDS:
+            cls._field_cache.popitem(last=False)
+        return field
+
+    @staticmethod
+    def _get_edge_tiles(map_obj, direction):
+        width, height = map_obj.width_in_tiles, map_obj.height_in_tiles
+        if direction == directions.CardinalDirection.NORTH:
+            return (np.arange(width), np.zeros(width, dtype=np.int64))
+        elif direction == directions.CardinalDirection.SOUTH:
+            return (np.arange(width), np.full(width, height - 1))
+        elif direction == directions.CardinalDirection.EAST:
+            return (np.full(height, width - 1), np.arange(height))
+        elif direction == directions.CardinalDirection.WEST:
+            return (np.zeros(height, dtype=np.int64), np.arange(height))
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def _get_exits(cls, map_obj, field):
+        """Returns list of (cost, next entry node, exit kind, exit tile)
+        tuples for the map exits reachable in the distance field."""
+
+        exits = []
+        for direction, adj_info in map_obj.adj_map_dict.items():
+            if not adj_info or adj_info[0] not in maps.Map.map_listing:
+                continue
+            xs, ys = cls._get_edge_tiles(map_obj, direction)
+            edge_distances = field[ys, xs]
+            reachable = np.flatnonzero(edge_distances != distance_fields.UNREACHABLE)
+            if not len(reachable):
+                continue
+            index = reachable[np.argmin(edge_distances[reachable])]
+            exit_tile = (int(xs[index]), int(ys[index]))
+
+            # Walking off the edge takes one more move.
+            exits.append((int(edge_distances[index]) + 1, (adj_info[0], adj_info[1]), EDGE_EXIT, exit_tile))
+
+        for tile_loc, connector_info in map_obj.connector_tile_dict.items():
+            if connector_info[0] not in maps.Map.map_listing:
+                continue
+            distance = int(field[tile_loc[1], tile_loc[0]])
+            if distance != distance_fields.UNREACHABLE:
+                exits.append((distance, (connector_info[0], connector_info[1]), CONNECTOR_EXIT, tile_loc))
+        return exits
+
+    @classmethod
+    def _get_entry_tiles(cls):
+        """Returns dict mapping map IDs to the set of tiles where travel
+        from other maps enters the map."""
+
+        entry_tiles = collections.defaultdict(set)
+        for map_obj in maps.Map.map_listing.values():
+            for adj_info in map_obj.adj_map_dict.values():
+                if adj_info:
+                    entry_tiles[adj_info[0]].add(adj_info[1])
+            for connector_info in map_obj.connector_tile_dict.values():
+                entry_tiles[connector_info[0]].add(connector_info[1])
+        return entry_tiles
+
+    @classmethod
+    def get_portal_graph(cls, transport_flag):
+        """Returns the portal graph for the transport flag, rebuilding it if
+        any map's connectivity changed."""
+
+        versions = {map_id: cls.get_map_version(map_id) for map_id in maps.Map.map_listing}
+        cached = cls._portal_graphs.get(transport_flag, None)
+        if cached and cached[0] == versions:
+            return cached[1]
+
+        graph = {}
+        for map_id, tiles in cls._get_entry_tiles().items():
+            map_obj = maps.Map.map_listing.get(map_id, None)
+            if not map_obj:
+                continue
+            for tile in tiles:
+                field = cls.get_distance_field(map_obj, transport_flag, tile)
+                graph[(map_id, tile)] = cls._get_exits(map_obj, field)
+
+        cls._portal_graphs[transport_flag] = (versions, graph)
+        logging.debug('Built portal graph with %d entries for flag %s.', len(graph), transport_flag)
+        return graph
+
+    @classmethod
+    def plan_route(cls, src_map_id, src_tile, dest_map_id, dest_tile, transport_flag):
+        """Plans the shortest route between the tiles.
+
+        Args:
+            src_map_id: ID of the starting map.
+            src_tile: (x, y) starting tile location.
+            dest_map_id: ID of the destination map.
+            dest_tile: (x, y) destination tile location.
+            transport_flag: tiles.Accessibility flag for the transportation
+                method.
+
+        Returns:
+            Route object, or None if the destination cannot be reached.
+        """
+
+        src_tile, dest_tile = tuple(src_tile), tuple(dest_tile)
+        src_map = maps.Map.map_listing.get(src_map_id, None)
+        dest_map = maps.Map.map_listing.get(dest_map_id, None)
+        if not src_map or not dest_map:
+            return None
+        if not connectivity.Connectivity.is_reachable(src_map_id, src_tile, dest_map_id, dest_tile, transport_flag):
+            return None
+
+        graph = cls.get_portal_graph(transport_flag)
+        src_field = cls.get_distance_field(src_map, transport_flag, src_tile)
+
+        # Distances to the destination from every tile of its map.
+        dest_field = cls.get_distance_field(dest_map, transport_flag, dest_tile)
+
+        src_node = (src_map_id, src_tile)
+        best_costs = {src_node: 0}
+        previous = {}
+        counter = itertools.count()
+        heap = [(0, next(counter), src_node)]
+
+        while heap:
+            cost, _, node = heapq.heappop(heap)
+            if node == GOAL_NODE:
+                break
+            if cost > best_costs.get(node, cost):
+                continue
+
+            map_id, tile = node
+            if node == src_node:
+                edges = cls._get_exits(src_map, src_field)
+            else:
+                edges = graph.get(node, [])
+
+            if map_id == dest_map_id:
+                # The destination itself, as a final edge.
+                distance = int(dest_field[tile[1], tile[0]])
+                if distance != distance_fields.UNREACHABLE:
+                    edges = edges + [(distance, GOAL_NODE, None, dest_tile)]
+
+            for edge_cost, next_node, exit_kind, exit_tile in edges:
+                next_cost = cost + edge_cost
+                if next_cost < best_costs.get(next_node, next_cost + 1):
+                    best_costs[next_node] = next_cost
+                    previous[next_node] = (node, exit_kind, exit_tile)
+                    heapq.heappush(heap, (next_cost, next(counter), next_node))
+
+        if GOAL_NODE not in best_costs:
+            return None
+
+        # Walk back through the portal nodes, then refine each leg.
+        hops = []
+        node = GOAL_NODE
+        while node != src_node:
+            prev_node, exit_kind, exit_tile = previous[node]
+            hops.append((prev_node, exit_kind, exit_tile))
+            node = prev_node
+        hops.reverse()
+
+        legs = []
+        for (map_id, start_tile), exit_kind, exit_tile in hops:
+            map_obj = maps.Map.map_listing[map_id]
+            field = cls.get_distance_field(map_obj, transport_flag, start_tile)
+            tiles = distance_fields.trace_path(field, exit_tile)
+            tiles.reverse()
+            legs.append(RouteLeg(map_id, tiles, exit_kind=exit_kind))
+
+        return Route(legs, best_costs[GOAL_NODE])
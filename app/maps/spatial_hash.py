@@ -0,0 +1,238 @@
+"""This module contains the spatial hash for proximity queries on a map.
+
+Entries (entities, placed objects, sound sources) are bucketed into
+square cells of DEFAULT_CELL_SIZE tiles. Moving an entry only touches
+the buckets when it crosses into another cell. Radius, rect and nearest
+neighbor queries only visit the cells that overlap the query area, so
+their cost depends on the number of nearby entries rather than the
+number of entries on the map.
+
+Distances are Euclidean distances between tile locations.
+"""
+
+import heapq
+import math
+
+DEFAULT_CELL_SIZE = 8
+
+
+class SpatialHash:
+    """Uniform grid of buckets over tile locations.
+
+    Entries can be any hashable object.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        if cell_size < 1:
+            raise Exception('Invalid spatial hash cell size {0}'.format(cell_size))
+        self.cell_size = cell_size
+
+        # Maps cell coordinate tuples to sets of entries.
+        self._cells = {}
+
+        # Maps entries to their tile locations.
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, entry):
+        return entry in self._positions
+
+    def _get_cell(self, tile_loc):
+        return (tile_loc[0] // self.cell_size, tile_loc[1] // self.cell_size)
+
+    def clear(self):
+        self._cells = {}
+        self._positions = {}
+
+    def get_position(self, entry):
+        return self._positions.get(entry, None)
+
+    def insert(self, entry, tile_loc):
+        """Adds the entry at the tile location, or moves it there if it is
+        already in the hash."""
+
+        if entry in self._positions:
+            self.move(entry, tile_loc)
+            return
+        tile_loc = tuple(tile_loc)
+        self._positions[entry] = tile_loc
+        self._cells.setdefault(self._get_cell(tile_loc), set()).add(entry)
+
+    def remove(self, entry):
+        """Removes the entry. Returns True if the entry was in the hash."""
+
+        tile_loc = self._positions.pop(entry, None)
+        if tile_loc is None:
+            return False
+
+        cell = self._get_cell(tile_loc)
+        bucket = self._cells[cell]
+        bucket.discard(entry)
+        if not bucket:
+            del self._cells[cell]
+        return True
+
+    def move(self, entry, tile_loc):
+        """Updates the entry's tile location."""
+
+        old_tile_loc = self._positions.get(entry, None)
+        if old_tile_loc is None:
+            self.insert(entry, tile_loc)
+            return
+
+        tile_loc = tuple(tile_loc)
+        self._positions[entry] = tile_loc
+        old_cell = self._get_cell(old_tile_loc)
+        new_cell = self._get_cell(tile_loc)
+        if old_cell != new_cell:
+            bucket = self._cells[old_cell]
+            bucket.discard(entry)
+            if not bucket:
+                del self._cells[old_cell]
+            self._cells.setdefault(new_cell, set()).add(entry)
+
+    def _iter_cells_in_rect(self, min_x, min_y, max_x, max_y):
+        """Yields buckets of the cells overlapping the inclusive tile
+        bounds."""
+
+        min_cell_x, min_cell_y = self._get_cell((min_x, min_y))
+        max_cell_x, max_cell_y = self._get_cell((max_x, max_y))
+
+        # Visit whichever is smaller: the cells in range, or all occupied
+        # cells.
+        num_cells = (max_cell_x - min_cell_x + 1) * (max_cell_y - min_cell_y + 1)
+        if num_cells > len(self._cells):
+            for (cell_x, cell_y), bucket in self._cells.items():
+                if min_cell_x <= cell_x <= max_cell_x and min_cell_y <= cell_y <= max_cell_y:
+                    yield bucket
+            return
+
+        for cell_y in range(min_cell_y, max_cell_y + 1):
+            for cell_x in range(min_cell_x, max_cell_x + 1):
+                bucket = self._cells.get((cell_x, cell_y), None)
+                if bucket:
+                    yield bucket
+
+    def query_rect(self, tile_rect):
+        """Returns list of entries within the tile rect (top left x, top
+        left y, width, height)."""
+
+        min_x, min_y = tile_rect[0], tile_rect[1]
+        max_x, max_y = min_x + tile_rect[2] - 1, min_y + tile_rect[3] - 1
+        if max_x < min_x or max_y < min_y:
+            return []
+
+        ret_entries = []
+        positions = self._positions
+        for bucket in self._iter_cells_in_rect(min_x, min_y, max_x, max_y):
+            for entry in bucket:
+                x, y = positions[entry]
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    ret_entries.append(entry)
+        return ret_entries
+
+    def query_radius(self, center_tile, radius, with_distances=False):
+        """Returns list of entries within the radius of the center tile.
+
+        Args:
+            center_tile: (x, y) tile location.
+            radius: maximum distance in tiles, inclusive.
+            with_distances: if True, returns list of (distance, entry)
+                tuples sorted by distance instead.
+        """
+
+        center_x, center_y = center_tile
+        reach = int(math.floor(radius))
+        radius_sq = radius * radius
+
+        ret_entries = []
+        positions = self._positions
+        for bucket in self._iter_cells_in_rect(center_x - reach, center_y - reach, center_x + reach,
+                                               center_y + reach):
+            for entry in bucket:
+                x, y = positions[entry]
+                distance_sq = (x - center_x) ** 2 + (y - center_y) ** 2
+                if distance_sq <= radius_sq:
+                    ret_entries.append((distance_sq, entry) if with_distances else entry)
+
+        if with_distances:
+            ret_entries.sort(key=lambda item: item[0])
+            return [(math.sqrt(distance_sq), entry) for distance_sq, entry in ret_entries]
+        return ret_entries
+
+    def query_nearest(self, center_tile, k=1, max_radius=None, predicate=None):
+        """Returns list of up to k (distance, entry) tuples for the entries
+        nearest the center tile, sorted by distance.
+
+        Args:
+            center_tile: (x, y) tile location.
+            k: maximum number of entries to return.
+            max_radius: optional maximum distance in tiles.
+            predicate: optional callable taking an entry, which returns
+                True for entries to consider.
+        """
+
+        if k <= 0 or not self._positions:
+            return []
+
+        center_x, center_y = center_tile
+        center_cell_x, center_cell_y = self._get_cell(center_tile)
+        positions = self._positions
+        max_distance_sq = max_radius * max_radius if max_radius is not None else None
+
+        # Max heap of the best k candidates, as (-distance_sq, tiebreak,
+        # entry).
+        best = []
+        counter = 0
+
+        # Expand rings of cells until no cell in the next ring can beat the
+        # current kth best, or every occupied cell has been visited.
+        num_cells_seen = 0
+        ring = 0
+        while num_cells_seen < len(self._cells):
+            # Closest any tile in this ring can be to the center.
+            ring_min_distance = max(0, (ring - 1) * self.cell_size + 1)
+            ring_min_distance_sq = ring_min_distance * ring_min_distance
+            if max_distance_sq is not None and ring_min_distance_sq > max_distance_sq:
+                break
+            if len(best) >= k and ring_min_distance_sq > -best[0][0]:
+                break
+
+            for cell in self._get_ring_cells(center_cell_x, center_cell_y, ring):
+                bucket = self._cells.get(cell, None)
+                if not bucket:
+                    continue
+                num_cells_seen += 1
+                for entry in bucket:
+                    if predicate and not predicate(entry):
+                        continue
+                    x, y = positions[entry]
+                    distance_sq = (x - center_x) ** 2 + (y - center_y) ** 2
+                    if max_distance_sq is not None and distance_sq > max_distance_sq:
+                        continue
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance_sq, counter, entry))
+                    elif distance_sq < -best[0][0]:
+                        heapq.heapreplace(best, (-distance_sq, counter, entry))
+            ring += 1
+
+        best.sort(key=lambda item: (-item[0], item[1]))
+        return [(math.sqrt(-neg_distance_sq), entry) for neg_distance_sq, _, entry in best]
+
+    @staticmethod
+    def _get_ring_cells(center_cell_x, center_cell_y, ring):
+        """Yields cell coordinates at Chebyshev distance ring from the
+        center cell."""
+
+        if ring == 0:
+            yield (center_cell_x, center_cell_y)
+            return
+        for cell_x in range(center_cell_x - ring, center_cell_x + ring + 1):
+            yield (cell_x, center_cell_y - ring)
+            yield (cell_x, center_cell_y + ring)
+        for cell_y in range(center_cell_y - ring + 1, center_cell_y + ring):
+            yield (center_cell_x - ring, cell_y)
+            yield (center_cell_x + ring, cell_y)
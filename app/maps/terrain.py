@@ -0,0 +1,286 @@
+"""This module contains the terrain mutation API and its change feed.
+
+Runtime terrain changes (bridges built with construction, cut paths and
+so on) go through Terrain.apply_changes(), which validates a batch of
+tile changes before touching the map, applies them all at once, and
+bumps the map's terrain version a single time per batch.
+
+Each applied batch produces one TerrainChange record with the bounding
+rect of the changed tiles and their old and new accessibility flags.
+Records are pushed to subscribers, such as render chunk caches and
+field of view caches, which only invalidate the affected region, and are
+kept in a short per-map log for consumers that poll by version instead.
+Connectivity labels are updated tile by tile for every batch.
+
+Terrain also keeps the changes from the maps' original terrain, which
+are what the save file stores.
+
+This module requires NumPy.
+"""
+
+import collections
+import logging
+import numbers
+
+import numpy as np
+
+from app.maps import connectivity
+
+# Number of recent change records kept per map.
+CHANGE_LOG_SIZE = 256
+
+
+class TerrainChange:
+    """Record of one applied batch of terrain changes.
+
+    Attributes:
+        map_id: ID of the changed map.
+        version: terrain version of the map after the batch.
+        rect: (top left x, top left y, width, height) tile rect bounding
+            the changed tiles.
+        tile_locs: int32 array of shape (N, 2) of the changed (x, y) tile
+            locations.
+        old_flags: int32 array of the accessibility flags before the
+            change, for each tile.
+        new_flags: int32 array of the accessibility flags after the
+            change, for each tile.
+        tile_ids: list of the new tile IDs for each tile, with None for
+            tiles that kept their tile.
+    """
+
+    __slots__ = ('map_id', 'version', 'rect', 'tile_locs', 'old_flags', 'new_flags', 'tile_ids')
+
+    def __init__(self, map_id, version, tile_locs, old_flags, new_flags, tile_ids):
+        self.map_id = map_id
+        self.version = version
+        self.tile_locs = np.asarray(tile_locs, dtype=np.int32).reshape(-1, 2)
+        self.old_flags = np.asarray(old_flags, dtype=np.int32)
+        self.new_flags = np.asarray(new_flags, dtype=np.int32)
+        self.tile_ids = tile_ids
+
+        min_x, min_y = self.tile_locs.min(axis=0).tolist()
+        max_x, max_y = self.tile_locs.max(axis=0).tolist()
+        self.rect = (min_x, min_y, max_x - min_x + 1, max_y - min_y + 1)
+
+    def get_tile_set(self):
+        return set(map(tuple, self.tile_locs.tolist()))
+
+    def get_changed_access_mask(self, transport_flag):
+        """Returns boolean array that is True for the tiles whose access
+        with the transport flag changed."""
+
+        return ((self.old_flags & transport_flag) > 0) != ((self.new_flags & transport_flag) > 0)
+
+
+class TerrainBatch:
+    """Collects terrain changes for a map and applies them together when
+    the with block exits without an exception.
+
+    Attributes:
+        change: the TerrainChange record once applied, or None if the batch
+            changed nothing.
+    """
+
+    def __init__(self, map_obj):
+        self.map_obj = map_obj
+        self.changes = []
+        self.change = None
+
+    def set_tile(self, tile_loc, flags, tile_id=None):
+        self.changes.append((tile_loc, flags, tile_id))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.change = Terrain.apply_changes(self.map_obj, self.changes)
+
+
+class Terrain:
+    """Terrain versions, change feed and save deltas for every map.
+
+    The user should not generate Terrain objects, as the class is
+    primarily for class methods and class-level data.
+    """
+
+    # Maps map IDs to terrain versions.
+    _versions = {}
+
+    # Maps map IDs to deques of recent TerrainChange records.
+    _change_logs = {}
+
+    # Callables taking (map object, TerrainChange), called after every
+    # applied batch.
+    _subscribers = []
+
+    # Maps map IDs to dicts mapping tile locations to [original flags,
+    # flags, tile ID, original tile ID] lists for the tiles changed since
+    # the map loaded. Original tile IDs are only known for tile-based
+    # maps.
+    _tile_deltas = {}
+
+    @classmethod
+    def clear(cls):
+        """Clears versions, logs and deltas. Subscribers stay
+        subscribed."""
+
+        cls._versions = {}
+        cls._change_logs = {}
+        cls._tile_deltas = {}
+
+    @classmethod
+    def subscribe(cls, callback):
+        if callback not in cls._subscribers:
+            cls._subscribers.append(callback)
+
+    @classmethod
+    def unsubscribe(cls, callback):
+        if callback in cls._subscribers:
+            cls._subscribers.remove(callback)
+
+    @classmethod
+    def get_version(cls, map_id):
+        return cls._versions.get(map_id, 0)
+
+    @classmethod
+    def get_changes_since(cls, map_id, version):
+        """Returns list of the TerrainChange records for the map after the
+        given version, oldest first, or None if some of them are no longer
+        in the log and the caller has to rebuild from scratch."""
+
+        if version >= cls.get_version(map_id):
+            return []
+        change_log = cls._change_logs.get(map_id, None)
+        if not change_log or change_log[0].version > version + 1:
+            return None
+        return [change for change in change_log if change.version > version]
+
+    @classmethod
+    def batch(cls, map_obj):
+        """Returns a TerrainBatch for use in a with block."""
+
+        return TerrainBatch(map_obj)
+
+    @classmethod
+    def apply_changes(cls, map_obj, changes):
+        """Applies a batch of tile changes to the map.
+
+        Every change is checked before any is applied, so an invalid change
+        leaves the map untouched. Later changes to the same tile replace
+        earlier ones, and changes that keep the tile as it is are dropped.
+
+        Args:
+            map_obj: Map to change.
+            changes: iterable of (tile location, accessibility flags) or
+                (tile location, accessibility flags, tile ID) tuples. A tile
+                ID of None keeps the tile's current tile.
+
+        Returns:
+            The published TerrainChange, or None if nothing changed.
+        """
+
+        pending = {}
+        for change in changes:
+            tile_loc = tuple(change[0])
+            flags = change[1]
+            tile_id = change[2] if len(change) > 2 else None
+            if not map_obj.location_within_bounds(tile_loc):
+                raise Exception('Terrain change at {0} is outside map {1}'.format(tile_loc, map_obj.map_id))
+            if not isinstance(flags, numbers.Integral) or flags < 0:
+                raise Exception('Invalid accessibility flags {0} at {1}'.format(flags, tile_loc))
+            if tile_id is not None:
+                tile_id = int(tile_id)
+            pending[tile_loc] = (int(flags), tile_id)
+
+        tile_locs, old_flags, new_flags, tile_ids = [], [], [], []
+        for tile_loc, (flags, tile_id) in pending.items():
+            curr_flags = map_obj.accessibility_grid[tile_loc[1]][tile_loc[0]]
+            if tile_id is not None and map_obj.changed_tile_mapping.get(tile_loc, None) == tile_id:
+                tile_id = None
+            if curr_flags == flags and tile_id is None:
+                continue
+            tile_locs.append(tile_loc)
+            old_flags.append(curr_flags)
+            new_flags.append(flags)
+            tile_ids.append(tile_id)
+        if not tile_locs:
+            return None
+
+        map_id = map_obj.map_id
+        map_deltas = cls._tile_deltas.setdefault(map_id, {})
+        for tile_loc, curr_flags, flags, tile_id in zip(tile_locs, old_flags, new_flags, tile_ids):
+            x, y = tile_loc
+            top_layer = map_obj.tile_renderer.layers[-1] if map_obj.tile_renderer else None
+            delta = map_deltas.setdefault(
+                tile_loc,
+                [curr_flags, flags, None, int(top_layer[y, x]) if top_layer is not None else None],
+            )
+            delta[1] = flags
+
+            map_obj.accessibility_grid[y][x] = flags
+            if tile_id is not None:
+                map_obj.changed_tile_mapping[tile_loc] = tile_id
+                if top_layer is not None:
+                    map_obj.tile_renderer.set_tile(len(map_obj.tile_renderer.layers) - 1, tile_loc, tile_id)
+            if tile_id is not None:
+                delta[2] = tile_id
+
+        version = cls.get_version(map_id) + 1
+        cls._versions[map_id] = version
+        record = TerrainChange(map_id, version, tile_locs, old_flags, new_flags, tile_ids)
+        cls._change_logs.setdefault(map_id, collections.deque(maxlen=CHANGE_LOG_SIZE)).append(record)
+
+        connectivity.Connectivity.update_tiles(map_obj, tile_locs)
+        for callback in list(cls._subscribers):
+            try:
+                callback(map_obj, record)
+            except Exception:
+                logging.exception('Terrain change subscriber %s failed.', callback)
+
+        logging.debug('Applied %d terrain changes to map %s, version %d.', len(tile_locs), map_id, version)
+        return record
+
+    @classmethod
+    def get_save_data(cls):
+        """Returns list of [map ID, [[x, y, flags, tile ID], ...]] lists of
+        the tiles changed from the maps' original terrain."""
+
+        save_data = []
+        for map_id, map_deltas in cls._tile_deltas.items():
+            tile_data = [
+                [tile_loc[0], tile_loc[1], flags, tile_id]
+                for tile_loc, (original_flags, flags, tile_id, _) in map_deltas.items()
+                if flags != original_flags or tile_id is not None
+            ]
+            if tile_data:
+                save_data.append([map_id, tile_data])
+        return save_data
+
+    @classmethod
+    def load_save_data(cls, save_data, map_listing):
+        """Reverts the maps to their original terrain, then applies the
+        changes from get_save_data().
+
+        Args:
+            save_data: data from get_save_data().
+            map_listing: dict mapping map IDs to Map objects.
+        """
+
+        for map_id, map_deltas in list(cls._tile_deltas.items()):
+            map_obj = map_listing.get(map_id, None)
+            if map_obj:
+                cls.apply_changes(map_obj, [
+                    (tile_loc, original_flags, original_tile_id)
+                    for tile_loc, (original_flags, _, _, original_tile_id) in map_deltas.items()
+                ])
+                for tile_loc in map_deltas:
+                    map_obj.changed_tile_mapping.pop(tile_loc, None)
+        cls._tile_deltas = {}
+
+        for map_id, tile_data in save_data or []:
+            map_obj = map_listing.get(map_id, None)
+            if not map_obj:
+                logging.error('Terrain changes for unknown map {0}'.format(map_id))
+                continue
+            cls.apply_changes(map_obj, [((x, y), flags, tile_id) for x, y, flags, tile_id in tile_data])
@@ -0,0 +1,260 @@
+"""This module contains tilesets and tile-index map layers.
+
+Instead of one pre-rendered image per map, a tileset-based map stores a
+shared tileset atlas image plus one or more layers of tile indices into
+the atlas, as uint16 arrays drawn bottom to top. Layers are saved in the
+map YAML as zlib compressed, base64 encoded little-endian uint16 data, so
+a large map takes a few kilobytes instead of a multi-megabyte image.
+
+Each tileset can also give a default accessibility for every tile
+index, from which the map's accessibility grid is derived: the topmost
+non-empty layer at each tile decides, so a bridge layer over water is
+walkable.
+
+TileMapRenderer builds square chunk surfaces from the tile indices on
+demand with Surface.blits, and keeps only recently used chunks.
+
+This module requires NumPy.
+"""
+
+import base64
+import collections
+import glob
+import logging
+import os
+import zlib
+
+import numpy as np
+import pygame
+
+from app.tiles import tiles
+from util import util
+
+# Tile index for empty (transparent) cells of a layer.
+EMPTY_TILE = 0xFFFF
+
+# Width and height in tiles of each rendered chunk.
+CHUNK_SIZE = 16
+
+# Maximum number of cached chunk surfaces per renderer.
+MAX_CACHED_CHUNKS = 48
+
+
+def encode_layer(layer):
+    """Returns the zlib compressed, base64 encoded string for the uint16
+    tile index layer."""
+
+    return base64.b64encode(zlib.compress(layer.astype('<u2').tobytes(), 9)).decode('ascii')
+
+
+def decode_layer(layer_str, width, height):
+    """Returns the uint16 array of shape (height, width) decoded from
+    encode_layer()."""
+
+    layer = np.frombuffer(zlib.decompress(base64.b64decode(layer_str)), dtype='<u2')
+    if len(layer) != width * height:
+        raise Exception('Expected {0} tile indices in layer, got {1}'.format(width * height, len(layer)))
+    return layer.astype(np.uint16).reshape(height, width)
+
+
+class Tileset:
+    """Atlas image of square tiles, indexed left to right, top to bottom.
+
+    Attributes:
+        tileset_id: ID of the tileset.
+        image: pygame Surface of the atlas.
+        num_tiles: number of tiles in the atlas.
+        accessibility: int32 array of the default accessibility flags for
+            each tile index.
+    """
+
+    # Maps tileset IDs to Tileset objects.
+    tileset_listing = {}
+
+    def __init__(self, tileset_id, image, accessibility=None):
+        self.tileset_id = tileset_id
+        self.image = image
+        self._columns = image.get_width() // tiles.TILE_SIZE
+        self.num_tiles = self._columns * (image.get_height() // tiles.TILE_SIZE)
+        if not self.num_tiles:
+            raise Exception('Tileset {0} image is smaller than a tile'.format(tileset_id))
+
+        self.accessibility = np.full(self.num_tiles, tiles.Accessibility.TILE_NOT_ACCESSIBLE_F, dtype=np.int32)
+        if accessibility is not None:
+            accessibility = np.asarray(accessibility, dtype=np.int32)[:self.num_tiles]
+            self.accessibility[:len(accessibility)] = accessibility
+
+        # Atlas area for each tile index.
+        self.tile_areas = [
+            pygame.Rect(
+                (index % self._columns) * tiles.TILE_SIZE,
+                (index // self._columns) * tiles.TILE_SIZE,
+                tiles.TILE_SIZE,
+                tiles.TILE_SIZE,
+            )
+            for index in range(self.num_tiles)
+        ]
+
+    def derive_accessibility(self, layers):
+        """Returns int32 array of shape (height, width) of accessibility
+        flags for the tile index layers, taken from the topmost non-empty
+        layer at each tile."""
+
+        accessibility = np.full(layers[0].shape, tiles.Accessibility.TILE_NOT_ACCESSIBLE_F, dtype=np.int32)
+        for layer in layers:
+            valid = layer < self.num_tiles
+            accessibility[valid] = self.accessibility[layer[valid]]
+        return accessibility
+
+    @staticmethod
+    def get_tileset_images_dir_path():
+        return os.path.join(util.get_images_path(), 'tilesets')
+
+    @classmethod
+    def get_tileset(cls, tileset_id):
+        return cls.tileset_listing.get(tileset_id, None)
+
+    # Builds tileset based on given tileset yaml file, and adds it to the
+    # class tileset_listing variable.
+    @classmethod
+    def tileset_factory(cls, tileset_yaml_path):
+        stripped = util.strip_yaml(tileset_yaml_path)
+        if not stripped or not stripped[0]:
+            raise Exception('No tileset data provided in {}'.format(tileset_yaml_path))
+        tileset_data = stripped[0]
+
+        tileset_id = tileset_data.get('id', None)
+        if not tileset_id:
+            raise Exception('No tileset ID provided from {}'.format(tileset_yaml_path))
+
+        image_file = tileset_data.get('image_file', None)
+        if not image_file:
+            raise Exception('No tileset image file provided from {}'.format(tileset_yaml_path))
+        image_path = os.path.join(cls.get_tileset_images_dir_path(), image_file)
+        if not os.path.isfile(image_path):
+            raise Exception('Tileset image file {} not found.'.format(image_path))
+
+        # One hex digit of accessibility flags per tile index, in atlas
+        # order. Line breaks are ignored.
+        accessibility = None
+        accessibility_str = tileset_data.get('tile_accessibility', None)
+        if accessibility_str:
+            accessibility = [int(c, 16) for c in ''.join(accessibility_str.split())]
+
+        ret_tileset = Tileset(tileset_id, pygame.image.load(image_path).convert_alpha(), accessibility=accessibility)
+        cls.tileset_listing[tileset_id] = ret_tileset
+        return ret_tileset
+
+    @classmethod
+    def build_tilesets(cls):
+        logging.info('Building tilesets')
+        for tileset_yaml in glob.glob(os.path.join(util.get_yaml_path(), 'tilesets', '*.yml')):
+            if not cls.tileset_factory(tileset_yaml):
+                raise Exception('Failed to build tileset for {}'.format(tileset_yaml))
+
+
+class TileMapRenderer:
+    """Draws a map from tile index layers, one cached chunk at a time."""
+
+    def __init__(self, tileset, layers):
+        if not layers:
+            raise Exception('Tile map needs at least one layer')
+        shape = layers[0].shape
+        for layer in layers:
+            if layer.shape != shape:
+                raise Exception('Tile layers must have the same dimensions')
+
+        self.tileset = tileset
+        self.layers = [np.asarray(layer, dtype=np.uint16) for layer in layers]
+        self.height_in_tiles, self.width_in_tiles = shape
+
+        # LRU cache mapping (chunk x, chunk y) to chunk Surfaces.
+        self._chunk_cache = collections.OrderedDict()
+
+    def get_accessibility_grid(self):
+        """Returns nested list of the accessibility flags derived from the
+        tileset, indexed [y][x]."""
+
+        return self.tileset.derive_accessibility(self.layers).tolist()
+
+    def set_tile(self, layer_index, tile_loc, tile_index):
+        """Changes a single tile and drops the cached chunk holding it."""
+
+        x, y = tile_loc
+        self.layers[layer_index][y, x] = tile_index
+        self._chunk_cache.pop((x // CHUNK_SIZE, y // CHUNK_SIZE), None)
+
+    def invalidate_tiles(self, tile_locs):
+        """Drops the cached chunks holding any of the tile locations."""
+
+        for x, y in tile_locs:
+            self._chunk_cache.pop((x // CHUNK_SIZE, y // CHUNK_SIZE), None)
+
+    def clear_cache(self):
+        self._chunk_cache = collections.OrderedDict()
+
+    def _render_chunk(self, chunk):
+        left, top = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+        width = min(CHUNK_SIZE, self.width_in_tiles - left)
+        height = min(CHUNK_SIZE, self.height_in_tiles - top)
+        surface = pygame.Surface((width * tiles.TILE_SIZE, height * tiles.TILE_SIZE), pygame.SRCALPHA)
+
+        atlas = self.tileset.image
+        tile_areas = self.tileset.tile_areas
+        num_tiles = self.tileset.num_tiles
+        for layer in self.layers:
+            indices = layer[top:top + height, left:left + width]
+            ys, xs = np.nonzero(indices < num_tiles)
+            surface.blits(
+                [
+                    (atlas, (x * tiles.TILE_SIZE, y * tiles.TILE_SIZE), tile_areas[index])
+                    for x, y, index in zip(xs.tolist(), ys.tolist(), indices[ys, xs].tolist())
+                ],
+                doreturn=False,
+            )
+        return surface
+
+    def get_chunk_surface(self, chunk):
+        surface = self._chunk_cache.get(chunk, None)
+        if surface is None:
+            surface = self._render_chunk(chunk)
+            self._chunk_cache[chunk] = surface
+            while len(self._chunk_cache) > MAX_CACHED_CHUNKS:
+                self._chunk_cache.popitem(last=False)
+        else:
+            self._chunk_cache.move_to_end(chunk)
+        return surface
+
+    def blit_onto_surface(self, surface, top_left_position, tile_subset_rect=None):
+        """Blits the chunks overlapping the tile subset rect (top left x,
+        top left y, width, height), or the whole map if None."""
+
+        if tile_subset_rect:
+            start_x, start_y, width, height = tile_subset_rect
+        else:
+            start_x, start_y, width, height = 0, 0, self.width_in_tiles, self.height_in_tiles
+        if width <= 0 or height <= 0:
+            return
+
+        chunk_px = CHUNK_SIZE * tiles.TILE_SIZE
+        min_chunk_x, min_chunk_y = max(0, start_x) // CHUNK_SIZE, max(0, start_y) // CHUNK_SIZE
+        max_chunk_x = min(self.width_in_tiles - 1, start_x + width - 1) // CHUNK_SIZE
+        max_chunk_y = min(self.height_in_tiles - 1, start_y + height - 1) // CHUNK_SIZE
+        blit_sequence = [
+            (
+                self.get_chunk_surface((chunk_x, chunk_y)),
+                (top_left_position[0] + chunk_x * chunk_px, top_left_position[1] + chunk_y * chunk_px),
+            )
+            for chunk_y in range(min_chunk_y, max_chunk_y + 1)
+            for chunk_x in range(min_chunk_x, max_chunk_x + 1)
+        ]
+
+        old_clip = surface.get_clip()
+        surface.set_clip(pygame.Rect(
+            top_left_position[0] + start_x * tiles.TILE_SIZE,
+            top_left_position[1] + start_y * tiles.TILE_SIZE,
+            width * tiles.TILE_SIZE,
+            height * tiles.TILE_SIZE,
+        ).clip(old_clip))
+        surface.blits(blit_sequence, doreturn=False)
+        surface.set_clip(old_clip)
@@ -1,6 +1,7 @@
 import pygame
 import logging
 from enum import Enum
+from app.equipment import equipment
 from app.images import image_ids
 from app.maps import directions
 from app.overworld_obj import interactive_obj
@@ -9,6 +10,9 @@ from app.skills import skills
 
 MAX_RUN_ENERGY = 100.0
 
+# Run energy recovery rate in points per minute.
+DEFAULT_RUN_REGEN_PER_MIN = 30
+
 
 class EntityType(Enum):
     CHARACTER = 0x1
@@ -106,11 +110,17 @@ class Entity(interactive_obj.InteractiveObject):
         self.facing_direction = directions.CardinalDirection.SOUTH
         self.curr_image_sequence_id = image_ids.ImageSequenceID.FACE_SOUTH
 
+        # Equipped items and their stat totals.
+        self.equipment = equipment.EquipmentLoadout()
+
         # Set up skills. self.skill_info_mapping maps skill IDs to
         # a length-3 list
         # [skill level, current experience, experience to next level]
         self.skill_info_mapping = {}
 
+        # Callables to call when a skill level changes.
+        self._skill_level_listeners = []
+
         if skill_levels:
             for skill_id in skills.Skill.SKILL_ID_NAME_MAPPING:
                 # See if caller passed in a custom level for the skill.
@@ -161,6 +171,13 @@ class Entity(interactive_obj.InteractiveObject):
                 self.run_energy - (2 * distance)
             )
 
+    @property
+    def equipment_dict(self):
+        """Returns dict mapping equipment slot IDs to [equipped item ID, item
+        object, quantity of item] lists."""
+
+        return self.equipment.get_equipment_dict()
+
     def get_skill_level(self, skill_id):
         """Returns the entity's skill level for the given skill ID."""
 
@@ -201,6 +218,30 @@ class Entity(interactive_obj.InteractiveObject):
 
         return ret_exp
 
+    def add_skill_level_listener(self, listener):
+        """Registers a callable taking (entity, skill ID, old level, new
+        level) to call when one of the entity's skill levels changes."""
+
+        if listener not in self._skill_level_listeners:
+            self._skill_level_listeners.append(listener)
+
+    def remove_skill_level_listener(self, listener):
+        if listener in self._skill_level_listeners:
+            self._skill_level_listeners.remove(listener)
+
+    def notify_skill_level_changed(self, skill_id, old_level, new_level):
+        for listener in list(self._skill_level_listeners):
+            listener(self, skill_id, old_level, new_level)
+
+    def set_skill_info(self, skill_id, level, exp, exp_to_next_level):
+        """Sets the entity's level, experience and remaining experience for
+        the skill, such as when loading a saved game."""
+
+        old_level = self.get_skill_level(skill_id)
+        self.skill_info_mapping[skill_id] = [level, exp, exp_to_next_level]
+        if old_level != level:
+            self.notify_skill_level_changed(skill_id, old_level, level)
+
     # Returns the number of levels gained when adding exp to skill_id.
     def gain_experience(self, skill_id, exp):
         """Adds experience to the entity for the given skill and returns the
@@ -216,7 +257,7 @@ class Entity(interactive_obj.InteractiveObject):
                 old_level = skill_info[0]
                 old_exp = skill_info[1]
 
-                new_exp = old_exp + exp
+                new_exp = min(old_exp + exp, skills.Skill.MAX_EXP)
                 new_level = skills.Skill.get_level_from_experience(new_exp)
                 new_exp_to_next_level = skills.Skill.get_experience_to_next_level(new_level, new_exp)
 
@@ -243,6 +284,8 @@ class Entity(interactive_obj.InteractiveObject):
                     self.skill_info_mapping[skill_id] = skill_info
 
                     levels_gained = max(0, new_level - old_level)
+                    if levels_gained:
+                        self.notify_skill_level_changed(skill_id, old_level, new_level)
 
         return levels_gained
 
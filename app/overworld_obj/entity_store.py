@@ -0,0 +1,439 @@
+"""This module contains an array-backed store for large entity populations.
+
+Entity objects each carry their own dicts and are refreshed one by one,
+which is fine for the protagonist but does not scale to a map with
+thousands of NPCs and monsters. The EntityStore keeps the per-entity
+state as parallel NumPy component arrays indexed by handle:
+- tile position, facing direction and movement state,
+- animation phase,
+- run state and run energy,
+- skill levels.
+
+Immutable data such as names and images stay on a shared Entity template,
+referenced by each handle's template ID. Systems such as update() then
+advance every entity with a few vectorized passes per tick instead of a
+Python call per entity.
+
+Movement is checked one tile step at a time against a passable mask of
+the map, so entities stop at walls, the map edge, placed objects and
+other entities instead of moving through them. A store can keep a map's
+spatial hash up to date with the entities' positions, using
+(store, handle) tuples as the hash entries.
+
+This module requires NumPy.
+"""
+
+import logging
+
+import numpy as np
+
+from app.images import image_ids
+from app.maps import directions
+from app.overworld_obj import entity
+from app.skills import skills
+from app.viewing import viewing
+
+DEFAULT_CAPACITY = 256
+
+# Time to move a single tile, matching the overworld scroll times.
+WALK_TILE_TIME_MS = viewing.ViewingTime.WALK_SINGLE_TILE_SCROLL_TIME_MS
+RUN_TILE_TIME_MS = viewing.ViewingTime.RUN_SINGLE_TILE_SCROLL_TIME_MS
+
+# Run energy used per tile ran, as in Entity.decrement_run_energy.
+RUN_ENERGY_PER_TILE = 2.0
+
+# Facing direction codes stored in the facing array.
+NO_DIRECTION = 0
+FACING_CODES = {direction: direction.value for direction in directions.CardinalDirection}
+CODE_DIRECTIONS = {code: direction for direction, code in FACING_CODES.items()}
+
+# Tile offsets for each facing code, indexed by code.
+DIRECTION_OFFSETS = np.zeros((max(FACING_CODES.values()) + 1, 2), dtype=np.int32)
+DIRECTION_OFFSETS[FACING_CODES[directions.CardinalDirection.NORTH]] = (0, -1)
+DIRECTION_OFFSETS[FACING_CODES[directions.CardinalDirection.EAST]] = (1, 0)
+DIRECTION_OFFSETS[FACING_CODES[directions.CardinalDirection.SOUTH]] = (0, 1)
+DIRECTION_OFFSETS[FACING_CODES[directions.CardinalDirection.WEST]] = (-1, 0)
+
+# Image sequence IDs for standing and walking, indexed by facing code.
+FACE_SEQUENCE_IDS = [image_ids.ImageSequenceID.DEFAULT] * len(DIRECTION_OFFSETS)
+WALK_SEQUENCE_IDS = [image_ids.ImageSequenceID.DEFAULT] * len(DIRECTION_OFFSETS)
+for _direction, _code in FACING_CODES.items():
+    FACE_SEQUENCE_IDS[_code] = image_ids.get_direction_sequence_id(_direction)
+WALK_SEQUENCE_IDS[FACING_CODES[directions.CardinalDirection.NORTH]] = image_ids.ImageSequenceID.WALK_NORTH
+WALK_SEQUENCE_IDS[FACING_CODES[directions.CardinalDirection.EAST]] = image_ids.ImageSequenceID.WALK_EAST
+WALK_SEQUENCE_IDS[FACING_CODES[directions.CardinalDirection.SOUTH]] = image_ids.ImageSequenceID.WALK_SOUTH
+WALK_SEQUENCE_IDS[FACING_CODES[directions.CardinalDirection.WEST]] = image_ids.ImageSequenceID.WALK_WEST
+
+# Maps skill IDs to their column in the skill level array.
+SKILL_COLUMNS = {skill_id: index for index, skill_id in enumerate(skills.Skill.SKILL_ID_LIST)}
+
+
+class EntityStore:
+    """Array-backed component store for entities on a map.
+
+    Entities are referred to by integer handles, which are reused after
+    the entity is removed. Component arrays grow as needed.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, run_regen_per_min=entity.DEFAULT_RUN_REGEN_PER_MIN,
+                 spatial_hash=None):
+        self.run_regen_per_min = run_regen_per_min
+
+        # Optional spatial_hash.SpatialHash kept up to date with the
+        # entities' positions.
+        self.spatial_hash = spatial_hash
+
+        self._capacity = 0
+        self._free_handles = []
+        self._next_handle = 0
+
+        # Maps template IDs to the template Entity objects.
+        self._templates = {}
+
+        self.alive = np.zeros(0, dtype=bool)
+        self.template_ids = np.zeros(0, dtype=object)
+        self.positions = np.zeros((0, 2), dtype=np.int32)
+        self.facing = np.zeros(0, dtype=np.int8)
+
+        # Tiles to move in the facing direction, and milliseconds spent
+        # on the current tile move.
+        self.pending_steps = np.zeros(0, dtype=np.int32)
+        self.move_progress_ms = np.zeros(0, dtype=np.int32)
+
+        self.animation_ms = np.zeros(0, dtype=np.int32)
+        self.run_on = np.zeros(0, dtype=bool)
+        self.run_energy = np.zeros(0, dtype=np.float32)
+        self.skill_levels = np.zeros((0, len(SKILL_COLUMNS)), dtype=np.int16)
+
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        if capacity <= self._capacity:
+            return
+
+        def resize(array, fill=0):
+            new_array = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            new_array[:self._capacity] = array
+            return new_array
+
+        self.alive = resize(self.alive, fill=False)
+        self.template_ids = resize(self.template_ids, fill=None)
+        self.positions = resize(self.positions)
+        self.facing = resize(self.facing, fill=FACING_CODES[directions.CardinalDirection.SOUTH])
+        self.pending_steps = resize(self.pending_steps)
+        self.move_progress_ms = resize(self.move_progress_ms)
+        self.animation_ms = resize(self.animation_ms)
+        self.run_on = resize(self.run_on, fill=False)
+        self.run_energy = resize(self.run_energy, fill=entity.MAX_RUN_ENERGY)
+        self.skill_levels = resize(self.skill_levels, fill=skills.Skill.DEFAULT_LEVEL)
+        self._capacity = capacity
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def add_template(self, template_id, template_entity):
+        """Registers the Entity holding the images and other immutable data
+        shared by every entity created with template_id."""
+
+        self._templates[template_id] = template_entity
+
+    def get_template(self, handle):
+        return self._templates.get(self.template_ids[handle], None)
+
+    def create(self, template_id, tile_position, facing_direction=directions.CardinalDirection.SOUTH,
+               skill_levels=None):
+        """Adds an entity to the store and returns its handle.
+
+        Args:
+            template_id: ID of the template Entity for the entity.
+            tile_position: (x, y) tile coordinates of the entity.
+            facing_direction: CardinalDirection the entity faces.
+            skill_levels: optional dict mapping skill IDs to levels. Other
+                skills get the default level.
+        """
+
+        if self._free_handles:
+            handle = self._free_handles.pop()
+        else:
+            if self._next_handle >= self._capacity:
+                self._grow(max(DEFAULT_CAPACITY, self._capacity * 2))
+            handle = self._next_handle
+            self._next_handle += 1
+
+        self.alive[handle] = True
+        self.template_ids[handle] = template_id
+        self.positions[handle] = tile_position
+        self.facing[handle] = FACING_CODES[facing_direction]
+        self.pending_steps[handle] = 0
+        self.move_progress_ms[handle] = 0
+        self.animation_ms[handle] = 0
+        self.run_on[handle] = False
+        self.run_energy[handle] = entity.MAX_RUN_ENERGY
+        self.skill_levels[handle] = skills.Skill.DEFAULT_LEVEL
+        if skill_levels:
+            for skill_id, level in skill_levels.items():
+                self.skill_levels[handle, SKILL_COLUMNS[skill_id]] = level
+        if self.spatial_hash is not None:
+            self.spatial_hash.insert(self.get_spatial_entry(handle), tuple(tile_position))
+        return handle
+
+    def add_entity(self, entity_obj, tile_position):
+        """Adds an entity to the store with the state of the given Entity,
+        which also becomes its template. Returns the new handle."""
+
+        self.add_template(entity_obj.object_id, entity_obj)
+        skill_levels = {
+            skill_id: skill_info[0] for skill_id, skill_info in entity_obj.skill_info_mapping.items()
+        }
+        handle = self.create(
+            entity_obj.object_id,
+            tile_position,
+            facing_direction=entity_obj.facing_direction,
+            skill_levels=skill_levels,
+        )
+        self.run_on[handle] = entity_obj.run_on
+        self.run_energy[handle] = entity_obj.run_energy
+        return handle
+
+    def remove(self, handle):
+        if not self.alive[handle]:
+            return
+        if self.spatial_hash is not None:
+            self.spatial_hash.remove(self.get_spatial_entry(handle))
+        self.alive[handle] = False
+        self.template_ids[handle] = None
+        self.pending_steps[handle] = 0
+        self._free_handles.append(handle)
+
+    def clear(self):
+        if self.spatial_hash is not None:
+            for handle in self.get_handles().tolist():
+                self.spatial_hash.remove(self.get_spatial_entry(handle))
+        self.alive[:] = False
+        self.template_ids[:] = None
+        self.pending_steps[:] = 0
+        self._free_handles = []
+        self._next_handle = 0
+
+    def get_handles(self):
+        """Returns array of the handles of every entity in the store."""
+
+        return np.flatnonzero(self.alive)
+
+    def get_spatial_entry(self, handle):
+        """Returns the spatial hash entry for the entity handle."""
+
+        return (self, int(handle))
+
+    def get_facing_direction(self, handle):
+        return CODE_DIRECTIONS.get(int(self.facing[handle]), None)
+
+    def get_skill_level(self, handle, skill_id):
+        return int(self.skill_levels[handle, SKILL_COLUMNS[skill_id]])
+
+    def set_skill_level(self, handle, skill_id, level):
+        self.skill_levels[handle, SKILL_COLUMNS[skill_id]] = level
+
+    def get_handles_with_skill_level(self, skill_id, min_level):
+        """Returns array of handles of the entities with at least min_level
+        in the skill."""
+
+        return np.flatnonzero(self.alive & (self.skill_levels[:, SKILL_COLUMNS[skill_id]] >= min_level))
+
+    def get_handles_in_rect(self, tile_rect):
+        """Returns array of handles of the entities within the tile rect
+        (top left x, top left y, width, height)."""
+
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        inside = self.alive \
+            & (x >= tile_rect[0]) & (x < tile_rect[0] + tile_rect[2]) \
+            & (y >= tile_rect[1]) & (y < tile_rect[1] + tile_rect[3])
+        return np.flatnonzero(inside)
+
+    def move(self, handles, direction_codes, num_steps=1, run=False):
+        """Starts moving the entities num_steps tiles in the given
+        directions.
+
+        Args:
+            handles: array of entity handles.
+            direction_codes: facing code, or array of facing codes, for
+                each entity to move towards.
+            num_steps: number of tiles to move, or array with a number of
+                tiles for each entity.
+            run: whether the entities run instead of walking. Entities
+                without run energy walk.
+        """
+
+        handles = np.asarray(handles)
+        self.facing[handles] = direction_codes
+        self.pending_steps[handles] = num_steps
+        self.run_on[handles] = run
+
+    def stop(self, handles):
+        """Stops the entities once they finish their current tile move."""
+
+        handles = np.asarray(handles)
+        self.pending_steps[handles] = np.minimum(self.pending_steps[handles], 1)
+
+    def update(self, elapsed_ms, passable):
+        """Advances every entity by elapsed_ms milliseconds.
+
+        Entities move one tile step at a time, and stop when the next tile
+        is outside the map, not passable, or taken by another entity.
+
+        Args:
+            elapsed_ms: milliseconds to advance by.
+            passable: boolean array of shape (height, width) of the map
+                tiles that entities can move onto.
+
+        Returns:
+            Array of handles of the entities that moved onto a new tile.
+        """
+
+        if elapsed_ms <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        moving = self.alive & (self.pending_steps > 0)
+        self._update_animation(elapsed_ms, moving)
+        moved_handles = self._update_movement(elapsed_ms, moving, passable)
+        self._update_run_energy(elapsed_ms, moving)
+
+        if self.spatial_hash is not None:
+            for handle, position in zip(moved_handles.tolist(), self.positions[moved_handles].tolist()):
+                self.spatial_hash.move(self.get_spatial_entry(handle), tuple(position))
+        return moved_handles
+
+    def _update_animation(self, elapsed_ms, moving):
+        # Standing entities restart their walk cycle when they next move.
+        self.animation_ms[moving] += elapsed_ms
+        self.animation_ms[~moving] = 0
+
+    def _update_movement(self, elapsed_ms, moving, passable):
+        running = moving & self.run_on & (self.run_energy > 0)
+        tile_time_ms = np.where(running, RUN_TILE_TIME_MS, WALK_TILE_TIME_MS)
+
+        progress = np.where(moving, self.move_progress_ms + elapsed_ms, 0)
+        steps_due = np.minimum(progress // tile_time_ms, self.pending_steps)
+        self.move_progress_ms = np.where(steps_due < self.pending_steps, progress % tile_time_ms, 0).astype(np.int32)
+        if not np.any(steps_due):
+            return np.zeros(0, dtype=np.int64)
+
+        tiles_moved, blocked, waiting = self._step(steps_due, passable)
+        self.pending_steps -= tiles_moved
+
+        # Entities blocked by the map stop on the last tile they reached.
+        # Entities waiting for another entity to move out of the way try
+        # again on the next update, without catching up on the tiles they
+        # missed.
+        self.pending_steps[blocked] = 0
+        self.move_progress_ms[blocked] = 0
+        self.move_progress_ms[waiting] = tile_time_ms[waiting] - 1
+
+        ran = running & (tiles_moved > 0)
+        self.run_energy[ran] = np.maximum(0.0, self.run_energy[ran] - RUN_ENERGY_PER_TILE * tiles_moved[ran])
+        return np.flatnonzero(tiles_moved)
+
+    def _step(self, steps_due, passable):
+        """Moves the entities up to steps_due tiles in their facing
+        directions, one tile at a time.
+
+        Returns:
+            Tuple of (int32 array of the tiles moved by each handle, boolean
+            array of the handles stopped by a tile outside the map or not
+            passable, boolean array of the handles stopped by a tile taken
+            by another entity).
+        """
+
+        height, width = passable.shape
+        tiles_moved = np.zeros(self._capacity, dtype=np.int32)
+        blocked = np.zeros(self._capacity, dtype=bool)
+        waiting = np.zeros(self._capacity, dtype=bool)
+
+        # Tiles taken by entities, so that entities do not move into each
+        # other.
+        occupied = np.zeros((height, width), dtype=bool)
+        positions = self.positions[self.alive]
+        on_map = (positions[:, 0] >= 0) & (positions[:, 0] < width) \
+            & (positions[:, 1] >= 0) & (positions[:, 1] < height)
+        occupied[positions[on_map, 1], positions[on_map, 0]] = True
+
+        for step in range(int(steps_due.max())):
+            stepping = np.flatnonzero((steps_due > step) & ~blocked & ~waiting)
+            if not len(stepping):
+                break
+
+            targets = self.positions[stepping] + DIRECTION_OFFSETS[self.facing[stepping]]
+            x, y = targets[:, 0], targets[:, 1]
+            enterable = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            enterable[enterable] = passable[y[enterable], x[enterable]]
+            free = enterable.copy()
+            free[free] = ~occupied[y[free], x[free]]
+
+            # Only one of the entities stepping onto the same tile moves.
+            free_indices = np.flatnonzero(free)
+            _, first_indices = np.unique(y[free_indices] * width + x[free_indices], return_index=True)
+            can_step = np.zeros(len(stepping), dtype=bool)
+            can_step[free_indices[first_indices]] = True
+
+            stepped = stepping[can_step]
+            old_positions = self.positions[stepped]
+            on_map = (old_positions[:, 0] >= 0) & (old_positions[:, 0] < width) \
+                & (old_positions[:, 1] >= 0) & (old_positions[:, 1] < height)
+            occupied[old_positions[on_map, 1], old_positions[on_map, 0]] = False
+            occupied[y[can_step], x[can_step]] = True
+            self.positions[stepped] = targets[can_step]
+            tiles_moved[stepped] += 1
+            blocked[stepping[~enterable]] = True
+            waiting[stepping[enterable & ~can_step]] = True
+
+        return tiles_moved, blocked, waiting
+
+    def _update_run_energy(self, elapsed_ms, moving):
+        # Entities regenerate run energy unless they are running.
+        resting = self.alive & ~(moving & self.run_on)
+        regen = np.float32(self.run_regen_per_min * elapsed_ms / 60000)
+        self.run_energy[resting] = np.minimum(entity.MAX_RUN_ENERGY, self.run_energy[resting] + regen)
+
+    def get_image_sequence_ids(self, handles):
+        """Returns list of the image sequence ID to blit for each entity."""
+
+        handles = np.asarray(handles)
+        moving = self.pending_steps[handles] > 0
+        return [
+            WALK_SEQUENCE_IDS[code] if is_moving else FACE_SEQUENCE_IDS[code]
+            for code, is_moving in zip(self.facing[handles].tolist(), moving.tolist())
+        ]
+
+    def blit_entities(self, surface, tile_rect, top_left_pixel, tile_size):
+        """Blits the entities within the tile rect onto the surface.
+
+        Args:
+            surface: pygame Surface to blit onto.
+            tile_rect: (top left x, top left y, width, height) tile rect of
+                the area shown on the surface.
+            top_left_pixel: pixel position on the surface of the tile rect's
+                top left corner.
+            tile_size: size of a tile in pixels.
+        """
+
+        handles = self.get_handles_in_rect(tile_rect)
+        if not len(handles):
+            return
+
+        # Draw from back to front.
+        handles = handles[np.argsort(self.positions[handles, 1], kind='stable')]
+        pixel_x = (self.positions[handles, 0] - tile_rect[0]) * tile_size + top_left_pixel[0]
+        pixel_y = (self.positions[handles, 1] - tile_rect[1] + 1) * tile_size + top_left_pixel[1]
+        sequence_ids = self.get_image_sequence_ids(handles)
+
+        for handle, x, y, sequence_id in zip(handles.tolist(), pixel_x.tolist(), pixel_y.tolist(), sequence_ids):
+            template = self._templates.get(self.template_ids[handle], None)
+            if template is None:
+                logging.warning('No template for entity handle %d', handle)
+                continue
+            template.blit_onto_surface(
+                surface,
+                image_sequence_id=sequence_id,
+                bottom_left_pixel=(x, y),
+                blit_time_ms=int(self.animation_ms[handle]),
+            )
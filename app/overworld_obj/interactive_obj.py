@@ -1,9 +1,119 @@
 import pygame
 import logging
+import random
 
 from app.images import image_ids
 from lang import language
 
+# Maps image file paths to loaded Surfaces, shared by every object that
+# uses the image.
+_image_cache = {}
+
+
+def load_image(image_path):
+    """Returns the Surface for the image file, loading it only the first
+    time the path is requested."""
+
+    loaded_image = _image_cache.get(image_path, None)
+    if loaded_image is None:
+        loaded_image = pygame.image.load(image_path).convert_alpha()
+        _image_cache[image_path] = loaded_image
+    return loaded_image
+
+
+def clear_image_cache():
+    _image_cache.clear()
+
+
+def load_image_sequences(image_info_dict):
+    """Loads the images for an object.
+
+    Args:
+        image_info_dict: dict mapping image sequence IDs to either an image
+            file path, or a length-2 list of [list of image file paths,
+            image sequence duration in milliseconds].
+
+    Returns:
+        Tuple of (dict mapping image sequence IDs to lists of Surfaces,
+        dict mapping image sequence IDs to sequence durations, dict mapping
+        image sequence IDs to the duration of each image).
+    """
+
+    image_sequence_dict = {}
+    sequence_duration_dict = {}
+    individual_duration_dict = {}
+
+    if image_info_dict:
+        for image_sequence_id, image_sequence_info in image_info_dict.items():
+            if isinstance(image_sequence_info, str):
+                loaded_image = load_image(image_sequence_info)
+                if loaded_image:
+                    image_sequence_dict[image_sequence_id] = [loaded_image]
+            elif isinstance(image_sequence_info, list):
+                image_path_list = image_sequence_info[0]
+                image_sequence_duration = image_sequence_info[1]
+
+                sequence_duration_dict[image_sequence_id] = image_sequence_duration
+                image_list = [image for image in map(load_image, image_path_list) if image]
+
+                if image_list:
+                    image_sequence_dict[image_sequence_id] = image_list
+                    if image_sequence_duration:
+                        individual_duration_dict[image_sequence_id] = image_sequence_duration // len(image_list)
+
+    return image_sequence_dict, sequence_duration_dict, individual_duration_dict
+
+
+def get_sequence_image(image_sequence_dict, individual_duration_dict, image_sequence_id, blit_time_ms=None,
+                       adhoc_animation_index=None):
+    """Returns the Surface to blit for the image sequence at the given time,
+    or None if there is no such image sequence.
+
+    If adhoc_animation_index is not None, the image at that index of the
+    sequence is returned instead.
+    """
+
+    image_list = image_sequence_dict.get(image_sequence_id, None)
+    if not image_list:
+        return None
+
+    if adhoc_animation_index is not None:
+        return image_list[adhoc_animation_index % len(image_list)]
+
+    individual_image_duration = individual_duration_dict.get(image_sequence_id, None)
+    if not individual_image_duration or not blit_time_ms:
+        return image_list[0]
+    return image_list[(blit_time_ms // individual_image_duration) % len(image_list)]
+
+
+def blit_image(surface, image, bottom_left_pixel=None, top_left_pixel=None):
+    """Blits the image onto the surface with either its bottom left or top
+    left corner at the given pixel. bottom_left_pixel takes precedence."""
+
+    if not image:
+        return
+
+    top_left = None
+    if bottom_left_pixel:
+        # get top left pixel based on bottom left pixel
+        top_left = (bottom_left_pixel[0], bottom_left_pixel[1] - image.get_height())
+    elif top_left_pixel:
+        top_left = top_left_pixel
+
+    if top_left:
+        surface.blit(image, top_left)
+
+
+def get_collision_offsets(collision_width, collision_height):
+    """Returns tuple of (x, y) tile offsets from an object's bottom left
+    tile that make up its collision rectangle."""
+
+    return tuple(
+        (x, -y)
+        for y in range(collision_height)
+        for x in range(collision_width)
+    )
+
 
 class InteractiveObject(pygame.sprite.Sprite):
     # maps interactive obj ID to interactive obj
@@ -23,7 +133,6 @@ class InteractiveObject(pygame.sprite.Sprite):
         self.collision_height = collision_height
         self.replacement_object_id = replacement_object_id
         self.respawn_time_s = respawn_time_s
-        self.has_image = False
 
         # Set interaction ID.
         self.interaction_id = interaction_id
@@ -31,43 +140,23 @@ class InteractiveObject(pygame.sprite.Sprite):
         # get examine info
         self.examine_info = examine_info if examine_info else language.MultiLanguageText()
 
-        # Load images.
-        self.image_sequence_dict = {}
-        self._image_sequence_duration_dict = {}
-        self._individual_image_duration_dict = {}
+        # Load images. Surfaces are shared with other objects using the
+        # same image files.
         self.in_adhoc_animation = False
         self.adhoc_animation_index = 0
-
-        if image_info_dict:
-            for image_sequence_id, image_sequence_info in image_info_dict.items():
-                image_list = []
-
-                if isinstance(image_sequence_info, str):
-                    loaded_image = pygame.image.load(image_sequence_info).convert_alpha()
-                    if loaded_image:
-                        self.image_sequence_dict[image_sequence_id] = [loaded_image]
-                elif isinstance(image_sequence_info, list):
-                    image_path_list = image_sequence_info[0]
-                    image_sequence_duration = image_sequence_info[1]
-
-                    self._image_sequence_duration_dict[image_sequence_id] = image_sequence_duration
-                    for image_path in image_path_list:
-                        loaded_image = pygame.image.load(image_path).convert_alpha()
-                        if loaded_image:
-                            image_list.append(loaded_image)
-
-                    if image_list:
-                        self.image_sequence_dict[image_sequence_id] = image_list
-                        if image_sequence_duration:
-                            self._individual_image_duration_dict[image_sequence_id] = \
-                                image_sequence_duration // len(image_list)
-            self.has_image = True
+        self.image_sequence_dict, self._image_sequence_duration_dict, self._individual_image_duration_dict = \
+            load_image_sequences(image_info_dict)
+        self.has_image = bool(image_info_dict)
 
         self.curr_image_sequence_id = image_ids.ImageSequenceID.OBJ_SPRITE
 
     def get_name(self):
         return self.name_info.get_text()
 
+    def is_resource(self):
+        # Resource data is only kept on object templates.
+        return False
+
     # blits the interactive object sprite image corresponding to image_sequence_id
     # onto the designated surface. Can specify either top_left_pixel or
     # bottom_left_pixel as the reference point for blitting the image.
@@ -79,41 +168,20 @@ class InteractiveObject(pygame.sprite.Sprite):
     def blit_onto_surface(self, surface, image_sequence_id=None, bottom_left_pixel=None, top_left_pixel=None,
                           blit_time_ms=None):
         if self and surface and self.has_image and (bottom_left_pixel or top_left_pixel):
-            image_to_blit = None
-            top_left = None
-
             if image_sequence_id:
                 id_to_use = image_sequence_id
             else:
                 id_to_use = self.curr_image_sequence_id
-            image_list = self.image_sequence_dict.get(id_to_use, [])
-
-            if self.in_adhoc_animation:
-                image_to_blit = image_list[self.adhoc_animation_index % len(image_list)]
-            else:
-                individual_image_duration = self._individual_image_duration_dict.get(id_to_use, None)
 
-                # Get image to blit.
-                if image_list:
-                    if not individual_image_duration:
-                        image_to_blit = image_list[0]
-                    elif not blit_time_ms:
-                        image_to_blit = image_list[0]
-                    else:
-                        image_to_blit = image_list[(blit_time_ms // individual_image_duration) % len(image_list)]
-
-            if image_to_blit:
-                if bottom_left_pixel:
-                    # get image dimensions
-                    width, height = image_to_blit.get_size()
-
-                    # get top left pixel based on bottom left pixel
-                    top_left = (bottom_left_pixel[0], bottom_left_pixel[1] - height)
-                elif top_left_pixel:
-                    top_left = top_left_pixel
+            image_to_blit = get_sequence_image(
+                self.image_sequence_dict,
+                self._individual_image_duration_dict,
+                id_to_use,
+                blit_time_ms=blit_time_ms,
+                adhoc_animation_index=self.adhoc_animation_index if self.in_adhoc_animation else None,
+            )
 
-                if top_left:
-                    surface.blit(image_to_blit, top_left)
+            blit_image(surface, image_to_blit, bottom_left_pixel=bottom_left_pixel, top_left_pixel=top_left_pixel)
 
     """
     @classmethod
@@ -221,20 +289,14 @@ class InteractiveObject(pygame.sprite.Sprite):
     # object's collision rectangle given the object's bottom left tile
     # location
     def get_collision_tile_set(self, bottom_left_tile_loc):
-        collision_set = set()
+        if not bottom_left_tile_loc:
+            return set()
 
-        if self and bottom_left_tile_loc:
-            collision_rect = self.get_collision_tile_rect(bottom_left_tile_loc)
-
-            if collision_rect:
-                start_x = collision_rect[0]
-                start_y = collision_rect[1]
-                collision_set.add((start_x, start_y))
-                for y in range(collision_rect[3]):
-                    for x in range(collision_rect[2]):
-                        collision_set.add((start_x + x, start_y + y))
-        logging.debug("Collision set: {0}".format(collision_set))
-        return collision_set
+        x, y = bottom_left_tile_loc
+        return {
+            (x + offset_x, y + offset_y)
+            for offset_x, offset_y in get_collision_offsets(self.collision_width, self.collision_height)
+        }
 
     """
     @classmethod
@@ -270,4 +332,234 @@ class InteractiveObject(pygame.sprite.Sprite):
         for obj_id in objdata.MISC_OBJECT_DATA:
             if not cls.misc_interactive_object_factory(obj_id):
                 logger.error("Could not construct misc object with ID {0}".format(obj_id))
-    """
\ No newline at end of file
+    """
+
+
+class ObjectTemplate:
+    """Immutable data shared by every placement of an object type.
+
+    Templates hold the images, names, examine text, collision footprint and
+    interaction ID for an object type. Each placement on a map is an
+    ObjectInstance that refers to its template, so memory scales with the
+    number of object types rather than the number of placements.
+
+    Resource objects (trees, rocks, fishing spots) also hold the skill used
+    to gather from them, the minimum level, the chance of being exhausted
+    by each gathered resource, and the resource items they can yield as
+    (item ID, experience, minimum level, weight) tuples. Objects without a
+    related skill ID are not resources.
+    """
+
+    __slots__ = (
+        'object_type',
+        'object_id',
+        'name_info',
+        'examine_info',
+        'collision_width',
+        'collision_height',
+        'collision_offsets',
+        'interaction_id',
+        'replacement_object_id',
+        'respawn_time_s',
+        'light_radius',
+        'related_skill_id',
+        'min_required_level',
+        'exhaustion_probability',
+        'resource_items',
+        'image_sequence_dict',
+        'image_sequence_duration_dict',
+        'individual_image_duration_dict',
+    )
+
+    # Maps object IDs to object templates.
+    _template_listing = {}
+
+    def __init__(self, object_type, object_id, name_info, image_info_dict=None, collision_width=1, collision_height=1,
+                 examine_info=None, interaction_id=None, replacement_object_id=None, respawn_time_s=0,
+                 light_radius=0, related_skill_id=None, min_required_level=1, exhaustion_probability=0.0,
+                 resource_items=()):
+        self.object_type = object_type
+        self.object_id = object_id
+        self.name_info = name_info
+        self.examine_info = examine_info if examine_info else language.MultiLanguageText()
+        self.collision_width = collision_width
+        self.collision_height = collision_height
+        self.collision_offsets = get_collision_offsets(collision_width, collision_height)
+        self.interaction_id = interaction_id
+        self.replacement_object_id = replacement_object_id
+        self.respawn_time_s = respawn_time_s
+        self.light_radius = light_radius
+        self.related_skill_id = related_skill_id
+        self.min_required_level = min_required_level
+        self.exhaustion_probability = exhaustion_probability
+        self.resource_items = tuple(tuple(resource_item) for resource_item in resource_items)
+        self.image_sequence_dict, self.image_sequence_duration_dict, self.individual_image_duration_dict = \
+            load_image_sequences(image_info_dict)
+
+    def get_name(self):
+        return self.name_info.get_text()
+
+    def get_examine_info(self):
+        ret_str = "?????"
+        if self.examine_info:
+            info = self.examine_info.get_text()
+            if info:
+                ret_str = info
+        elif self.name_info:
+            ret_str = self.get_name()
+        return ret_str
+
+    def is_resource(self):
+        return self.related_skill_id is not None
+
+    def select_resource_item_info(self, skill_level, rng=None):
+        """Returns (item ID, experience) tuple for a resource gathered at
+        the skill level, chosen by weight among the resource items the level
+        allows, or None if there are none.
+
+        Args:
+            skill_level: the gathering entity's level in the related skill.
+            rng: random.Random to draw from, or None for the module's.
+        """
+
+        allowed_items = [
+            resource_item for resource_item in self.resource_items
+            if resource_item[2] <= skill_level
+        ]
+        if not allowed_items:
+            return None
+
+        resource_item = (rng or random).choices(
+            allowed_items,
+            weights=[resource_item[3] for resource_item in allowed_items],
+        )[0]
+        return resource_item[0], resource_item[1]
+
+    def get_collision_tile_set(self, bottom_left_tile_loc):
+        """Returns set of tile coordinate tuples that make up the collision
+        rectangle for a placement at the bottom left tile location."""
+
+        x, y = bottom_left_tile_loc
+        return {(x + offset_x, y + offset_y) for offset_x, offset_y in self.collision_offsets}
+
+    @classmethod
+    def get_template(cls, object_id):
+        return cls._template_listing.get(object_id, None)
+
+    @classmethod
+    def add_template_to_listing(cls, template):
+        """Adds/updates the template listing for the template's object ID.
+        Returns True upon success, False otherwise."""
+
+        if template and (template.object_id is not None):
+            cls._template_listing[template.object_id] = template
+            logging.debug("Added object ID {0} to object template listing.".format(template.object_id))
+            return True
+        return False
+
+
+class ObjectInstance:
+    """A placement of an ObjectTemplate on a map.
+
+    Instances only hold their position and mutable state, and delegate
+    everything else to their template.
+    """
+
+    __slots__ = (
+        'template',
+        'bottom_left_tile_loc',
+        'curr_image_sequence_id',
+        'in_adhoc_animation',
+        'adhoc_animation_index',
+    )
+
+    def __init__(self, template, bottom_left_tile_loc, image_sequence_id=image_ids.ImageSequenceID.OBJ_SPRITE):
+        self.template = template
+        self.bottom_left_tile_loc = bottom_left_tile_loc
+        self.curr_image_sequence_id = image_sequence_id
+        self.in_adhoc_animation = False
+        self.adhoc_animation_index = 0
+
+    @property
+    def object_id(self):
+        return self.template.object_id
+
+    @property
+    def object_type(self):
+        return self.template.object_type
+
+    @property
+    def interaction_id(self):
+        return self.template.interaction_id
+
+    @property
+    def replacement_object_id(self):
+        return self.template.replacement_object_id
+
+    @property
+    def respawn_time_s(self):
+        return self.template.respawn_time_s
+
+    @property
+    def light_radius(self):
+        return self.template.light_radius
+
+    @property
+    def collision_width(self):
+        return self.template.collision_width
+
+    @property
+    def collision_height(self):
+        return self.template.collision_height
+
+    @property
+    def related_skill_id(self):
+        return self.template.related_skill_id
+
+    @property
+    def min_required_level(self):
+        return self.template.min_required_level
+
+    @property
+    def exhaustion_probability(self):
+        return self.template.exhaustion_probability
+
+    def is_resource(self):
+        return self.template.is_resource()
+
+    def select_resource_item_info(self, skill_level, rng=None):
+        return self.template.select_resource_item_info(skill_level, rng=rng)
+
+    def get_name(self):
+        return self.template.get_name()
+
+    def get_examine_info(self):
+        return self.template.get_examine_info()
+
+    def get_collision_tile_set(self, bottom_left_tile_loc=None):
+        return self.template.get_collision_tile_set(bottom_left_tile_loc or self.bottom_left_tile_loc)
+
+    def set_template(self, template):
+        """Replaces the instance's template, such as when a resource is
+        depleted and replaced by another object."""
+
+        self.template = template
+        self.in_adhoc_animation = False
+        self.adhoc_animation_index = 0
+
+    def blit_onto_surface(self, surface, image_sequence_id=None, bottom_left_pixel=None, top_left_pixel=None,
+                          blit_time_ms=None):
+        """Blits the instance's current image. Takes the same arguments as
+        InteractiveObject.blit_onto_surface."""
+
+        if not surface or not (bottom_left_pixel or top_left_pixel):
+            return
+
+        image_to_blit = get_sequence_image(
+            self.template.image_sequence_dict,
+            self.template.individual_image_duration_dict,
+            image_sequence_id or self.curr_image_sequence_id,
+            blit_time_ms=blit_time_ms,
+            adhoc_animation_index=self.adhoc_animation_index if self.in_adhoc_animation else None,
+        )
+        blit_image(surface, image_to_blit, bottom_left_pixel=bottom_left_pixel, top_left_pixel=top_left_pixel)
@@ -9,8 +9,7 @@ from lang import language
 
 START_NUM_GOLD_COINS = 100
 
-# Run energy recovery rate in points per minute.
-DEFAULT_RUN_REGEN_PER_MIN = 30
+DEFAULT_RUN_REGEN_PER_MIN = entity.DEFAULT_RUN_REGEN_PER_MIN
 
 IMAGE_INFO_DICT = {
     image_ids.ImageSequenceID.DEFAULT: image_paths.PROT_RANGER_F_OW_DEFAULT,
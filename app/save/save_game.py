@@ -31,3 +31,6 @@ PROTAG_EQUIPMENT = "protag_equipment"
 PROTAG_STATS = "protag_levels"
 PROTAG_RUN_ON = "protag_run_on"
 PROTAG_RUN_ENERGY = "protag_run_energy"
+EXPLORED_TILES = "explored_tiles"
+GAME_TIME_MS = "game_time_ms"
+TERRAIN_CHANGES = "terrain_changes"
@@ -0,0 +1,170 @@
+"""This module contains a skill progression simulator for game balancing.
+
+The simulator projects how long simulated players take to reach a target
+level for a skill, given the rate of skilling actions and the experience
+per successful action. All players are simulated together with NumPy
+arrays, so thousands of players can be projected quickly.
+
+Each simulation step covers a fixed number of actions per player. The
+number of successful actions in a step is drawn from a binomial
+distribution, and the time at which a player reaches the target level is
+interpolated within the step.
+
+This module is meant for balancing tools.
+
+This module requires NumPy.
+"""
+
+import numpy as np
+
+from app.skills import skills
+
+# Experience required for each level as an array, where index 0 is level 1.
+LEVEL_EXP_ARRAY = np.array(skills.Skill.LEVEL_EXP_LIST, dtype=np.int64)
+
+SECONDS_PER_HOUR = 3600
+
+DEFAULT_ACTIONS_PER_STEP = 100
+
+# Safety limit on the number of simulated hours.
+DEFAULT_MAX_HOURS = 10000
+
+
+def get_levels_from_experience(exp_array):
+    """Returns array of levels for the array of experience values."""
+
+    return np.maximum(
+        skills.Skill.MIN_LEVEL,
+        np.searchsorted(LEVEL_EXP_ARRAY, exp_array, side='right'),
+    )
+
+
+class SimulationResult:
+    """Results of a skill progression simulation.
+
+    Attributes:
+        target_level: level that the players tried to reach.
+        hours_to_level: array of hours each player took to reach the target
+            level, or NaN for players that did not reach it.
+        final_exp: array of each player's experience at the end of the
+            simulation.
+    """
+
+    def __init__(self, target_level, hours_to_level, final_exp):
+        self.target_level = target_level
+        self.hours_to_level = hours_to_level
+        self.final_exp = final_exp
+
+    @property
+    def num_players(self):
+        return len(self.hours_to_level)
+
+    def get_completion_rate(self):
+        """Returns the fraction of players that reached the target level."""
+
+        if not self.num_players:
+            return 0.0
+        return float(np.count_nonzero(~np.isnan(self.hours_to_level))) / self.num_players
+
+    def get_percentiles(self, percentiles=(10, 50, 90)):
+        """Returns dict mapping each percentile to the hours taken by the
+        players that reached the target level."""
+
+        reached = self.hours_to_level[~np.isnan(self.hours_to_level)]
+        if not len(reached):
+            return {p: None for p in percentiles}
+        return {p: float(v) for p, v in zip(percentiles, np.percentile(reached, percentiles))}
+
+    def get_summary(self):
+        """Returns dict summarizing the simulation."""
+
+        reached = self.hours_to_level[~np.isnan(self.hours_to_level)]
+        return {
+            'target_level': self.target_level,
+            'num_players': self.num_players,
+            'completion_rate': self.get_completion_rate(),
+            'mean_hours': float(reached.mean()) if len(reached) else None,
+            'percentile_hours': self.get_percentiles(),
+        }
+
+
+def simulate_time_to_level(
+        target_level,
+        exp_per_action,
+        actions_per_hour,
+        success_chance=1.0,
+        num_players=10000,
+        start_level=skills.Skill.MIN_LEVEL,
+        actions_per_step=DEFAULT_ACTIONS_PER_STEP,
+        max_hours=DEFAULT_MAX_HOURS,
+        seed=None):
+    """Simulates players skilling until they reach the target level.
+
+    Args:
+        target_level: level for the players to reach.
+        exp_per_action: experience gained per successful action. Either a
+            number, or a callable that takes an array of levels and returns
+            an array of experience values.
+        actions_per_hour: number of actions a player attempts per hour.
+            Either a number or an array with a value for each player, to
+            model players with different play styles.
+        success_chance: chance from 0 to 1 that an action succeeds. Either
+            a number, or a callable that takes an array of levels and
+            returns an array of chances.
+        num_players: number of players to simulate.
+        start_level: level that all players start at.
+        actions_per_step: number of actions per player per simulation step.
+            Smaller steps are more precise when rewards depend on level.
+        max_hours: players that have not reached the target level after
+            this many hours stop being simulated.
+        seed: optional seed for the random number generator, for
+            reproducible results.
+
+    Returns:
+        SimulationResult object for the simulation.
+    """
+
+    if not (skills.Skill.MIN_LEVEL <= target_level <= skills.Skill.MAX_LEVEL):
+        raise Exception('Invalid target level {}'.format(target_level))
+    if num_players <= 0 or actions_per_step <= 0:
+        raise Exception('Invalid simulation size.')
+
+    rng = np.random.default_rng(seed)
+    target_exp = LEVEL_EXP_ARRAY[target_level - 1]
+
+    actions_per_hour = np.broadcast_to(np.asarray(actions_per_hour, dtype=np.float64), (num_players,))
+    if np.any(actions_per_hour <= 0):
+        raise Exception('Actions per hour must be positive.')
+    hours_per_step = actions_per_step / actions_per_hour
+
+    exp = np.full(num_players, skills.Skill.get_experience_from_level(start_level), dtype=np.int64)
+    elapsed_hours = np.zeros(num_players, dtype=np.float64)
+    hours_to_level = np.full(num_players, np.nan, dtype=np.float64)
+    hours_to_level[exp >= target_exp] = 0.0
+
+    # Indices of players still skilling.
+    active = np.flatnonzero(exp < target_exp)
+
+    while len(active):
+        levels = get_levels_from_experience(exp[active])
+        chances = success_chance(levels) if callable(success_chance) else success_chance
+        rewards = exp_per_action(levels) if callable(exp_per_action) else exp_per_action
+
+        successes = rng.binomial(actions_per_step, np.clip(chances, 0.0, 1.0), size=len(active))
+        gained = (successes * np.asarray(rewards)).astype(np.int64)
+
+        prev_exp = exp[active]
+        exp[active] = np.minimum(prev_exp + gained, skills.Skill.MAX_EXP)
+        step_hours = hours_per_step[active]
+
+        # Interpolate when the target was reached within the step.
+        reached = exp[active] >= target_exp
+        if np.any(reached):
+            reached_ids = active[reached]
+            fraction = (target_exp - prev_exp[reached]) / np.maximum(gained[reached], 1)
+            hours_to_level[reached_ids] = elapsed_hours[reached_ids] + fraction * step_hours[reached]
+
+        elapsed_hours[active] += step_hours
+        active = active[~reached & (elapsed_hours[active] < max_hours)]
+
+    return SimulationResult(target_level, hours_to_level, exp)
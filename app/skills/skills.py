@@ -12,7 +12,8 @@ For experience, the following formula is used:
 more than 1 million experience in a given skill.
 """
 
-import logging
+import bisect
+import math
 from enum import Enum
 from lang import language
 
@@ -30,6 +31,18 @@ class SkillID(Enum):
     WOODCUTTING = 0x14
 
 
+def build_level_exp_list(max_level):
+    """Returns sorted list of the experience required for levels 1 to
+    max_level, where index 0 is level 1."""
+
+    exp_list = [0]
+    total_exp = 0
+    for x in range(1, max_level):
+        total_exp += math.floor(100 * 2 ** (x / 11) + 32 * x + 49.425)
+        exp_list.append(total_exp)
+    return exp_list
+
+
 # TODO - turn these into individual classes
 class Skill:
     # Maps skill IDs to their names in the various languages.
@@ -58,108 +71,11 @@ class Skill:
     MIN_LEVEL = 1
     MIN_EXP = 0
 
-    LEVEL_EXP_MAPPING = {
-        1: 0,
-        2: 187,
-        3: 413,
-        4: 679,
-        5: 985,
-        6: 1331,
-        7: 1718,
-        8: 2146,
-        9: 2616,
-        10: 3129,
-        11: 3686,
-        12: 4287,
-        13: 4933,
-        14: 5625,
-        15: 6364,
-        16: 7150,
-        17: 7985,
-        18: 8870,
-        19: 9806,
-        20: 10794,
-        21: 11836,
-        22: 12932,
-        23: 14085,
-        24: 15296,
-        25: 16567,
-        26: 17899,
-        27: 19295,
-        28: 20756,
-        29: 22285,
-        30: 23884,
-        31: 25555,
-        32: 27301,
-        33: 29125,
-        34: 31030,
-        35: 33019,
-        36: 35095,
-        37: 37262,
-        38: 39524,
-        39: 41885,
-        40: 44350,
-        41: 46922,
-        42: 49607,
-        43: 52410,
-        44: 55337,
-        45: 58394,
-        46: 61587,
-        47: 64923,
-        48: 68409,
-        49: 72053,
-        50: 75862,
-        51: 79846,
-        52: 84014,
-        53: 88376,
-        54: 92942,
-        55: 97724,
-        56: 102733,
-        57: 107982,
-        58: 113485,
-        59: 119256,
-        60: 125310,
-        61: 131664,
-        62: 138335,
-        63: 145342,
-        64: 152705,
-        65: 160444,
-        66: 168582,
-        67: 177143,
-        68: 186152,
-        69: 195637,
-        70: 205626,
-        71: 216150,
-        72: 227241,
-        73: 238935,
-        74: 251268,
-        75: 264280,
-        76: 278013,
-        77: 292512,
-        78: 307825,
-        79: 324002,
-        80: 341098,
-        81: 359170,
-        82: 378280,
-        83: 398493,
-        84: 419879,
-        85: 442512,
-        86: 466471,
-        87: 491841,
-        88: 518711,
-        89: 547176,
-        90: 577338,
-        91: 609305,
-        92: 643193,
-        93: 679125,
-        94: 717231,
-        95: 757651,
-        96: 800533,
-        97: 846035,
-        98: 894325,
-        99: 945583,
-        100: 1000000,
-    }
+    # Experience required for each level, where index 0 is level 1.
+    LEVEL_EXP_LIST = build_level_exp_list(100)
+
+    # Maps levels to the experience required for them.
+    LEVEL_EXP_MAPPING = {level: exp for level, exp in enumerate(LEVEL_EXP_LIST, start=1)}
 
     MAX_LEVEL = len(LEVEL_EXP_MAPPING)
     DEFAULT_MAX_XP = 1000000
@@ -170,14 +86,7 @@ class Skill:
     def get_level_from_experience(experience):
         """Returns the lowest level possible for the given experience."""
 
-        ret_level = Skill.MIN_LEVEL
-        for i in range(Skill.MAX_LEVEL):
-            if Skill.LEVEL_EXP_MAPPING.get(i + 1, Skill.DEFAULT_MAX_XP) <= experience:
-                ret_level = i + 1
-            else:
-                break
-
-        return ret_level
+        return max(Skill.MIN_LEVEL, bisect.bisect_right(Skill.LEVEL_EXP_LIST, experience))
 
     @staticmethod
     def get_experience_from_level(level):
@@ -185,9 +94,8 @@ class Skill:
 
         ret_exp = Skill.MIN_EXP
         if level and (level >= Skill.MIN_LEVEL) and (level <= Skill.MAX_LEVEL):
-            ret_exp = Skill.LEVEL_EXP_MAPPING.get(level, Skill.DEFAULT_MAX_XP)
+            ret_exp = Skill.LEVEL_EXP_LIST[level - 1]
 
-        logging.debug("Exp for level %d is %d", level, ret_exp)
         return ret_exp
 
     # Assumes exp is a valid experience value for the level.
@@ -220,6 +128,36 @@ class Skill:
 
         return ret_exp
 
+    @staticmethod
+    def apply_experience_grants(grants):
+        """Applies a batch of experience grants to entities.
+
+        Grants for the same entity and skill are combined, so each skill of
+        each entity is updated once no matter how many grants it receives.
+
+        Args:
+            grants: iterable of (entity, skill ID, experience) tuples. The
+                entities must provide gain_experience(skill_id, exp).
+
+        Returns:
+            Dict mapping (entity, skill ID) tuples to the number of levels
+            gained, for the skills that gained at least one level.
+        """
+
+        combined_grants = {}
+        for entity, skill_id, exp in grants:
+            if entity is not None and skill_id is not None and exp and exp > 0:
+                key = (entity, skill_id)
+                combined_grants[key] = combined_grants.get(key, 0) + exp
+
+        levels_gained_mapping = {}
+        for (entity, skill_id), exp in combined_grants.items():
+            levels_gained = entity.gain_experience(skill_id, exp)
+            if levels_gained:
+                levels_gained_mapping[(entity, skill_id)] = levels_gained
+
+        return levels_gained_mapping
+
     @staticmethod
     def get_skill_name(skill_id):
         """Returns the skill name for the given skill ID """
@@ -0,0 +1,317 @@
+"""This module contains the day/night and point light overlay for maps.
+
+The ambient light follows the in-game time of day from the Timekeeper.
+The time of day is quantized to LIGHT_LEVEL_STEPS steps per day, so the
+ambient darkness and tint only change a few times per in-game hour, and
+there is no overlay at all during the day.
+
+Point lights (such as fires) brighten the tiles around them. Light
+falloff is precomputed once per radius as a light sprite array, and
+light sprites are composited into per-chunk light maps with NumPy.
+
+The overlay is split into square chunks of CHUNK_SIZE tiles. Chunk
+surfaces are cached per ambient light level and only re-rendered when
+the level changes or a light touching the chunk is added, moved or
+removed. Chunks without any lights share one plain surface per level.
+Each frame then only blits the cached chunks over the viewport, instead
+of blending the whole viewport pixel by pixel.
+
+This module requires NumPy.
+"""
+
+import collections
+
+import numpy as np
+import pygame
+
+from app.tiles import tiles
+from util import timekeeper
+
+# Width and height in tiles of each overlay chunk.
+CHUNK_SIZE = 16
+
+# Number of light map cells along each side of a tile.
+CELLS_PER_TILE = 4
+
+# Number of discrete ambient light levels per in-game day.
+LIGHT_LEVEL_STEPS = 96
+
+# Maximum number of cached chunk surfaces.
+MAX_CACHED_CHUNKS = 64
+
+# Maps (radius, intensity) to light sprite arrays.
+_light_sprites = {}
+
+# (time of day, darkness alpha, tint color) keyframes for the ambient
+# light, with time of day as a fraction of a day.
+NIGHT_TINT = (10, 20, 60)
+AMBIENT_KEYFRAMES = (
+    (0.0, 180, NIGHT_TINT),
+    (0.20, 180, NIGHT_TINT),
+    (0.27, 90, (120, 70, 40)),
+    (0.33, 0, (0, 0, 0)),
+    (0.75, 0, (0, 0, 0)),
+    (0.81, 90, (140, 60, 30)),
+    (0.88, 180, NIGHT_TINT),
+    (1.0, 180, NIGHT_TINT),
+)
+
+
+def get_ambient_light(time_of_day):
+    """Returns the (darkness alpha, tint color) tuple for the ambient
+    light at the time of day, quantized to LIGHT_LEVEL_STEPS levels."""
+
+    time_of_day = int((time_of_day % 1.0) * LIGHT_LEVEL_STEPS) / LIGHT_LEVEL_STEPS
+    for (start_time, start_alpha, start_color), (end_time, end_alpha, end_color) \
+            in zip(AMBIENT_KEYFRAMES, AMBIENT_KEYFRAMES[1:]):
+        if start_time <= time_of_day <= end_time:
+            weight = (time_of_day - start_time) / (end_time - start_time)
+            alpha = int(round(start_alpha + (end_alpha - start_alpha) * weight))
+            color = tuple(
+                int(round(start_value + (end_value - start_value) * weight))
+                for start_value, end_value in zip(start_color, end_color)
+            )
+            return (alpha, color)
+    return (AMBIENT_KEYFRAMES[-1][1], AMBIENT_KEYFRAMES[-1][2])
+
+
+def get_light_sprite(radius, intensity=1.0):
+    """Returns float32 array of the light from a point light over the
+    light map cells within radius tiles of it, with the light at the
+    center cell."""
+
+    key = (radius, intensity)
+    sprite = _light_sprites.get(key, None)
+    if sprite is None:
+        reach = int(radius * CELLS_PER_TILE)
+        offsets = np.arange(-reach, reach + 1, dtype=np.float32)
+        distances_sq = (offsets[np.newaxis, :] ** 2 + offsets[:, np.newaxis] ** 2) / max(1, reach * reach)
+        sprite = (intensity * np.clip(1.0 - distances_sq, 0.0, 1.0)).astype(np.float32)
+        _light_sprites[key] = sprite
+    return sprite
+
+
+class Lighting:
+    """Ambient light and point lights for every map.
+
+    The user should not generate Lighting objects, as the class is
+    primarily for class methods and class-level caches.
+    """
+
+    # Whether to blit the lighting overlay.
+    enabled = True
+
+    # Maps map IDs to dicts mapping light keys to (tile location, radius,
+    # intensity) tuples.
+    _lights = {}
+
+    # Maps (map ID, chunk) to the version of the lights touching the
+    # chunk.
+    _chunk_versions = {}
+
+    # LRU cache mapping (map ID, chunk) to (ambient light, chunk version,
+    # Surface) tuples.
+    _chunk_cache = collections.OrderedDict()
+
+    # Maps chunk pixel sizes to plain chunk Surfaces for the ambient light
+    # they were made for.
+    _plain_chunks = {}
+    _plain_chunks_ambient_light = None
+
+    @classmethod
+    def clear_cache(cls):
+        cls._chunk_cache = collections.OrderedDict()
+        cls._plain_chunks = {}
+        cls._plain_chunks_ambient_light = None
+
+    @classmethod
+    def clear_lights(cls, map_id=None):
+        if map_id is None:
+            cls._lights = {}
+            cls._chunk_versions = {}
+            cls.clear_cache()
+        else:
+            cls._lights.pop(map_id, None)
+            cls._chunk_versions = {
+                chunk_key: version for chunk_key, version in cls._chunk_versions.items() if chunk_key[0] != map_id
+            }
+            for chunk_key in [chunk_key for chunk_key in cls._chunk_cache if chunk_key[0] == map_id]:
+                del cls._chunk_cache[chunk_key]
+
+    @classmethod
+    def get_ambient_light(cls):
+        return get_ambient_light(timekeeper.Timekeeper.get_time_of_day())
+
+    @classmethod
+    def _get_light_chunks(cls, tile_loc, radius):
+        """Returns list of the chunks a light at the tile can reach."""
+
+        reach = int(np.ceil(radius)) + 1
+        min_chunk_x, min_chunk_y = (tile_loc[0] - reach) // CHUNK_SIZE, (tile_loc[1] - reach) // CHUNK_SIZE
+        max_chunk_x, max_chunk_y = (tile_loc[0] + reach) // CHUNK_SIZE, (tile_loc[1] + reach) // CHUNK_SIZE
+        return [
+            (chunk_x, chunk_y)
+            for chunk_y in range(min_chunk_y, max_chunk_y + 1)
+            for chunk_x in range(min_chunk_x, max_chunk_x + 1)
+        ]
+
+    @classmethod
+    def _mark_dirty(cls, map_id, light_info):
+        tile_loc, radius, _ = light_info
+        for chunk in cls._get_light_chunks(tile_loc, radius):
+            chunk_key = (map_id, chunk)
+            cls._chunk_versions[chunk_key] = cls._chunk_versions.get(chunk_key, 0) + 1
+
+    @classmethod
+    def set_light(cls, map_id, light_key, tile_loc, radius, intensity=1.0):
+        """Adds or moves a point light.
+
+        Args:
+            map_id: ID of the map the light is on.
+            light_key: any hashable key for the light, such as the object
+                instance giving off the light.
+            tile_loc: (x, y) tile location of the light.
+            radius: distance in tiles the light reaches.
+            intensity: brightness at the light's center, from 0 to 1.
+        """
+
+        map_lights = cls._lights.setdefault(map_id, {})
+        light_info = (tuple(tile_loc), radius, intensity)
+        old_light_info = map_lights.get(light_key, None)
+        if old_light_info == light_info:
+            return
+        if old_light_info:
+            cls._mark_dirty(map_id, old_light_info)
+        map_lights[light_key] = light_info
+        cls._mark_dirty(map_id, light_info)
+
+    @classmethod
+    def remove_light(cls, map_id, light_key):
+        light_info = cls._lights.get(map_id, {}).pop(light_key, None)
+        if light_info:
+            cls._mark_dirty(map_id, light_info)
+
+    @classmethod
+    def _get_plain_chunk(cls, ambient_light, size):
+        if ambient_light != cls._plain_chunks_ambient_light:
+            cls._plain_chunks = {}
+            cls._plain_chunks_ambient_light = ambient_light
+
+        surface = cls._plain_chunks.get(size, None)
+        if surface is None:
+            alpha, color = ambient_light
+            surface = pygame.Surface(size, pygame.SRCALPHA)
+            surface.fill(color + (alpha,))
+            cls._plain_chunks[size] = surface
+        return surface
+
+    @classmethod
+    def _render_chunk(cls, map_obj, chunk, ambient_light):
+        """Returns the overlay Surface for the chunk at the ambient light
+        level, with the map's point lights cut out of the darkness."""
+
+        left, top = chunk[0] * CHUNK_SIZE, chunk[1] * CHUNK_SIZE
+        width_in_tiles = min(CHUNK_SIZE, map_obj.width_in_tiles - left)
+        height_in_tiles = min(CHUNK_SIZE, map_obj.height_in_tiles - top)
+        size = (width_in_tiles * tiles.TILE_SIZE, height_in_tiles * tiles.TILE_SIZE)
+
+        cell_left, cell_top = left * CELLS_PER_TILE, top * CELLS_PER_TILE
+        width_in_cells, height_in_cells = width_in_tiles * CELLS_PER_TILE, height_in_tiles * CELLS_PER_TILE
+        light_map = None
+        for tile_loc, radius, intensity in cls._lights.get(map_obj.map_id, {}).values():
+            sprite = get_light_sprite(radius, intensity)
+            reach = sprite.shape[0] // 2
+
+            # Sprite bounds in chunk cell coordinates, centered on the
+            # center cell of the light's tile.
+            sprite_left = tile_loc[0] * CELLS_PER_TILE + CELLS_PER_TILE // 2 - reach - cell_left
+            sprite_top = tile_loc[1] * CELLS_PER_TILE + CELLS_PER_TILE // 2 - reach - cell_top
+            min_x, min_y = max(0, sprite_left), max(0, sprite_top)
+            max_x = min(width_in_cells, sprite_left + sprite.shape[1])
+            max_y = min(height_in_cells, sprite_top + sprite.shape[0])
+            if min_x >= max_x or min_y >= max_y:
+                continue
+
+            if light_map is None:
+                light_map = np.zeros((height_in_cells, width_in_cells), dtype=np.float32)
+            np.maximum(
+                light_map[min_y:max_y, min_x:max_x],
+                sprite[min_y - sprite_top:max_y - sprite_top, min_x - sprite_left:max_x - sprite_left],
+                out=light_map[min_y:max_y, min_x:max_x],
+            )
+
+        if light_map is None:
+            return cls._get_plain_chunk(ambient_light, size)
+
+        alpha, color = ambient_light
+        cell_surface = pygame.Surface((width_in_cells, height_in_cells), pygame.SRCALPHA)
+        cell_surface.fill(color + (alpha,))
+        alpha_view = pygame.surfarray.pixels_alpha(cell_surface)
+        alpha_view[:] = (alpha * (1.0 - np.minimum(light_map, 1.0))).astype(np.uint8).T
+        del alpha_view
+        return pygame.transform.smoothscale(cell_surface, size)
+
+    @classmethod
+    def get_chunk_surface(cls, map_obj, chunk, ambient_light):
+        chunk_key = (map_obj.map_id, chunk)
+        version = cls._chunk_versions.get(chunk_key, 0)
+        cached = cls._chunk_cache.get(chunk_key, None)
+        if cached and cached[0] == ambient_light and cached[1] == version:
+            cls._chunk_cache.move_to_end(chunk_key)
+            return cached[2]
+
+        surface = cls._render_chunk(map_obj, chunk, ambient_light)
+        cls._chunk_cache[chunk_key] = (ambient_light, version, surface)
+        cls._chunk_cache.move_to_end(chunk_key)
+        while len(cls._chunk_cache) > MAX_CACHED_CHUNKS:
+            cls._chunk_cache.popitem(last=False)
+        return surface
+
+    @classmethod
+    def blit_overlay(cls, map_obj, surface, tile_subset_rect=None):
+        """Blits the lighting over the map.
+
+        Args:
+            map_obj: Map to light.
+            surface: pygame Surface the map was blitted on.
+            tile_subset_rect: rect of Tile coordinates (top left x, top left
+                y, width, height) to cover, or None for the whole map.
+        """
+
+        if not cls.enabled:
+            return
+        ambient_light = cls.get_ambient_light()
+        if ambient_light[0] <= 0:
+            return
+
+        if tile_subset_rect:
+            start_x, start_y, width, height = tile_subset_rect
+        else:
+            start_x, start_y, width, height = 0, 0, map_obj.width_in_tiles, map_obj.height_in_tiles
+        if width <= 0 or height <= 0:
+            return
+
+        top_left_x, top_left_y = map_obj.top_left_position
+        chunk_px = CHUNK_SIZE * tiles.TILE_SIZE
+        min_chunk_x, min_chunk_y = max(0, start_x) // CHUNK_SIZE, max(0, start_y) // CHUNK_SIZE
+        max_chunk_x = min(map_obj.width_in_tiles - 1, start_x + width - 1) // CHUNK_SIZE
+        max_chunk_y = min(map_obj.height_in_tiles - 1, start_y + height - 1) // CHUNK_SIZE
+        blit_sequence = [
+            (
+                cls.get_chunk_surface(map_obj, (chunk_x, chunk_y), ambient_light),
+                (top_left_x + chunk_x * chunk_px, top_left_y + chunk_y * chunk_px),
+            )
+            for chunk_y in range(min_chunk_y, max_chunk_y + 1)
+            for chunk_x in range(min_chunk_x, max_chunk_x + 1)
+        ]
+
+        if blit_sequence:
+            old_clip = surface.get_clip()
+            surface.set_clip(pygame.Rect(
+                top_left_x + start_x * tiles.TILE_SIZE,
+                top_left_y + start_y * tiles.TILE_SIZE,
+                width * tiles.TILE_SIZE,
+                height * tiles.TILE_SIZE,
+            ).clip(old_clip))
+            surface.blits(blit_sequence, doreturn=False)
+            surface.set_clip(old_clip)
@@ -0,0 +1,462 @@
+"""This module contains the minimap and world map images for maps.
+
+Each map is downscaled into a mip pyramid of levels at 1/2, 1/4, 1/8 and
+so on of the full size, down to one pixel per tile. Pyramids are built
+with NumPy on a background thread, and the main thread does no
+rendering or full-image copies for them:
+- image maps are read and decoded again from their image file by the
+  worker,
+- tileset maps hand a copy of their small tile index layers to the
+  worker, which composes the first level straight from a downscaled
+  tileset atlas instead of rendering the full size map. The atlas pixels
+  are copied once per tileset.
+Every later level is averaged from the one above it.
+
+Finished pyramids are cached on disk, keyed by a hash of the image file
+or of the atlas and tile layers, so unchanged maps skip the downscaling
+on later runs.
+
+Inaccessible and unexplored tiles are drawn over a level from per-tile
+masks, scaled up to the level size. The accessibility mask is patched in
+place from terrain changes, and composed images are cached until the
+terrain or explored tiles change. Terrain changes that replace tile
+images mark the map's pyramid stale, and it is rebuilt in the background
+the next time it is asked for, while the stale levels keep being shown.
+
+This module requires NumPy.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import io
+import logging
+import os
+
+import numpy as np
+import pygame
+
+from app.maps import exploration, terrain
+from app.tiles import tiles
+from util import util
+
+# Bump when the pyramid data changes, to ignore old cache files.
+PYRAMID_FORMAT_VERSION = 2
+
+# Number of levels below the full size image. The last level has one
+# pixel per tile.
+MAX_LEVELS = tiles.TILE_SIZE.bit_length() - 1
+
+# Color drawn over inaccessible tiles.
+INACCESSIBLE_COLOR = (20, 20, 30, 110)
+
+# Color drawn over unexplored tiles.
+UNEXPLORED_COLOR = (0, 0, 0, 255)
+
+# Maximum number of cached composed minimap surfaces.
+MAX_CACHED_MINIMAPS = 8
+
+# Number of tile rows composed at a time for tileset maps, to bound the
+# memory used while blending layers.
+TILE_STRIP_ROWS = 16
+
+NUM_WORKER_THREADS = 1
+
+
+def get_pyramid_cache_dir_path():
+    return os.path.join(util.get_cache_path(), 'minimap')
+
+
+def downscale_half(pixels):
+    """Returns the uint8 array of shape (ceil(height / 2), ceil(width / 2),
+    channels) averaging each 2x2 block of the pixel array. Odd edges repeat
+    their last row or column."""
+
+    height, width = pixels.shape[:2]
+    if height % 2 or width % 2:
+        pixels = np.pad(pixels, ((0, height % 2), (0, width % 2), (0, 0)), mode='edge')
+    blocks = pixels.reshape(pixels.shape[0] // 2, 2, pixels.shape[1] // 2, 2, pixels.shape[2])
+    return ((blocks.sum(axis=(1, 3), dtype=np.uint16) + 2) >> 2).astype(np.uint8)
+
+
+def build_level_arrays(pixels, num_levels=MAX_LEVELS):
+    """Returns list of the downscaled uint8 RGBA pixel arrays of shape
+    (height, width, 4), halving the size at each level."""
+
+    levels = []
+    for _ in range(num_levels):
+        if pixels.shape[0] <= 1 and pixels.shape[1] <= 1:
+            break
+        pixels = downscale_half(pixels)
+        levels.append(pixels)
+    return levels
+
+
+def get_surface_pixels(surface):
+    """Returns uint8 array of shape (height, width, 4) of the surface's RGBA
+    pixels. The surface must not be in use by another thread."""
+
+    return np.dstack((
+        pygame.surfarray.pixels3d(surface),
+        pygame.surfarray.pixels_alpha(surface),
+    )).transpose(1, 0, 2)
+
+
+def get_atlas_tiles(atlas_pixels, num_tiles):
+    """Returns uint8 array of shape (num_tiles + 1, TILE_SIZE, TILE_SIZE,
+    4) of the atlas's tiles in index order, with a transparent tile last
+    for empty cells."""
+
+    rows = atlas_pixels.shape[0] // tiles.TILE_SIZE
+    columns = atlas_pixels.shape[1] // tiles.TILE_SIZE
+    atlas_tiles = atlas_pixels[:rows * tiles.TILE_SIZE, :columns * tiles.TILE_SIZE] \
+        .reshape(rows, tiles.TILE_SIZE, columns, tiles.TILE_SIZE, 4) \
+        .transpose(0, 2, 1, 3, 4) \
+        .reshape(rows * columns, tiles.TILE_SIZE, tiles.TILE_SIZE, 4)[:num_tiles]
+    return np.concatenate((atlas_tiles, np.zeros((1,) + atlas_tiles.shape[1:], dtype=np.uint8)))
+
+
+def compose_tile_layers(atlas_tiles, layers):
+    """Returns uint8 array of shape (height * tile size, width * tile size,
+    4) of the tile index layers drawn bottom to top with the atlas tiles,
+    blending like alpha blits."""
+
+    num_tiles = len(atlas_tiles) - 1
+    tile_size = atlas_tiles.shape[1]
+    height, width = layers[0].shape
+    pixels = np.zeros((height * tile_size, width * tile_size, 4), dtype=np.uint8)
+
+    for top in range(0, height, TILE_STRIP_ROWS):
+        strip = None
+        for layer in layers:
+            indices = layer[top:top + TILE_STRIP_ROWS]
+            indices = np.where(indices < num_tiles, indices, num_tiles)
+            src = atlas_tiles[indices].astype(np.uint16)
+            if strip is None:
+                strip = src
+                continue
+            src_alpha = src[..., 3:4]
+            strip[..., :3] = (src[..., :3] * src_alpha + strip[..., :3] * (255 - src_alpha) + 127) // 255
+            strip[..., 3:4] = src_alpha + (strip[..., 3:4] * (255 - src_alpha) + 127) // 255
+
+        num_rows = strip.shape[0]
+        pixels[top * tile_size:(top + num_rows) * tile_size] = \
+            strip.transpose(0, 2, 1, 3, 4).reshape(num_rows * tile_size, width * tile_size, 4)
+    return pixels
+
+
+class MipPyramid:
+    """Downscaled images of one map.
+
+    Attributes:
+        image_hash: hex digest of the map's source data.
+        levels: list of pygame Surfaces, where level n is 1/2^(n + 1) of
+            the full size.
+    """
+
+    def __init__(self, image_hash, levels):
+        self.image_hash = image_hash
+        self.levels = levels
+
+    def get_level(self, level):
+        if 0 <= level < len(self.levels):
+            return self.levels[level]
+        return None
+
+    @classmethod
+    def build_from_file(cls, image_path):
+        """Returns the MipPyramid for the map image file. Runs on a worker
+        thread."""
+
+        with open(image_path, 'rb') as image_file:
+            image_data = image_file.read()
+        hasher = hashlib.sha1(image_data)
+
+        def make_level_arrays():
+            # Decode a private copy, since the map's own image is in use
+            # by the main thread.
+            image = pygame.image.load(io.BytesIO(image_data), os.path.basename(image_path))
+            if image.get_bitsize() != 32 or not image.get_masks()[3]:
+                rgba_image = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+                rgba_image.blit(image, (0, 0))
+                image = rgba_image
+            return build_level_arrays(get_surface_pixels(image))
+
+        return cls._build(hasher, make_level_arrays)
+
+    @classmethod
+    def build_from_tiles(cls, atlas_bytes, atlas_size, num_tiles, layers):
+        """Returns the MipPyramid for the tile index layers drawn with the
+        RGBA atlas bytes. Runs on a worker thread."""
+
+        hasher = hashlib.sha1(atlas_bytes)
+        hasher.update('{0}x{1}'.format(atlas_size[0], atlas_size[1]).encode('ascii'))
+        for layer in layers:
+            hasher.update(layer.astype('<u2').tobytes())
+            hasher.update('{0}x{1}'.format(layer.shape[1], layer.shape[0]).encode('ascii'))
+
+        def make_level_arrays():
+            atlas_pixels = np.frombuffer(atlas_bytes, dtype=np.uint8).reshape(atlas_size[1], atlas_size[0], 4)
+            atlas_tiles = get_atlas_tiles(atlas_pixels, num_tiles)
+
+            # Downscale the atlas tiles rather than the full size map.
+            stacked_tiles = downscale_half(atlas_tiles.reshape(-1, tiles.TILE_SIZE, 4))
+            half_tile_size = tiles.TILE_SIZE // 2
+            first_level = compose_tile_layers(
+                stacked_tiles.reshape(len(atlas_tiles), half_tile_size, half_tile_size, 4),
+                layers,
+            )
+            return [first_level] + build_level_arrays(first_level, num_levels=MAX_LEVELS - 1)
+
+        return cls._build(hasher, make_level_arrays)
+
+    @classmethod
+    def _build(cls, hasher, make_level_arrays):
+        """Returns the MipPyramid from the disk cache for the hashed source
+        data, or from make_level_arrays() if it is not cached."""
+
+        hasher.update('v{0}'.format(PYRAMID_FORMAT_VERSION).encode('ascii'))
+        image_hash = hasher.hexdigest()
+        cache_path = os.path.join(get_pyramid_cache_dir_path(), '{0}.npz'.format(image_hash))
+
+        level_arrays = cls._load_cached_levels(cache_path)
+        if level_arrays is None:
+            level_arrays = make_level_arrays()
+            cls._save_cached_levels(cache_path, level_arrays)
+
+        # Surfaces share the arrays' memory rather than copying them.
+        levels = []
+        for level_array in level_arrays:
+            level_array = np.ascontiguousarray(level_array)
+            levels.append(pygame.image.frombuffer(level_array, (level_array.shape[1], level_array.shape[0]), 'RGBA'))
+        return MipPyramid(image_hash, levels)
+
+    @staticmethod
+    def _load_cached_levels(cache_path):
+        if not os.path.isfile(cache_path):
+            return None
+        try:
+            with np.load(cache_path) as cached:
+                return [cached['level_{0}'.format(index)] for index in range(len(cached.files))]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Ignoring unreadable minimap cache {0}: {1}'.format(cache_path, e))
+            return None
+
+    @staticmethod
+    def _save_cached_levels(cache_path, level_arrays):
+        # Write to a temporary file first, so a partly written file is
+        # never read.
+        temp_path = cache_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temp_path, 'wb') as cache_file:
+                np.savez_compressed(
+                    cache_file,
+                    **{'level_{0}'.format(index): level_array for index, level_array in enumerate(level_arrays)}
+                )
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logging.warning('Could not write minimap cache {0}: {1}'.format(cache_path, e))
+
+
+class Minimap:
+    """Background mip pyramid builds and composed minimap images for every
+    map.
+
+    The user should not generate Minimap objects, as the class is
+    primarily for class methods and class-level caches.
+    """
+
+    _executor = None
+
+    # Maps map IDs to the latest finished MipPyramid.
+    _pyramids = {}
+
+    # Maps map IDs to Futures for MipPyramid objects being built.
+    _pending = {}
+
+    # IDs of maps whose pyramid no longer matches the map's tiles.
+    _stale_map_ids = set()
+
+    # Maps tileset IDs to (RGBA atlas bytes, atlas size) tuples.
+    _atlas_bytes = {}
+
+    # Maps map IDs to boolean arrays of shape (height, width) that are
+    # True for inaccessible tiles.
+    _inaccessible_masks = {}
+
+    # LRU cache mapping (map ID, level, show accessibility, show
+    # exploration) to (cache key, composed Surface) tuples.
+    _composed = collections.OrderedDict()
+
+    @classmethod
+    def clear(cls):
+        cls._pyramids = {}
+        cls._pending = {}
+        cls._stale_map_ids = set()
+        cls._atlas_bytes = {}
+        cls._inaccessible_masks = {}
+        cls._composed = collections.OrderedDict()
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            cls._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=NUM_WORKER_THREADS,
+                thread_name_prefix='minimap_builder',
+            )
+        return cls._executor
+
+    @classmethod
+    def request_pyramid(cls, map_obj):
+        """Starts building the map's pyramid in the background, unless it
+        is already built and up to date or being built."""
+
+        map_id = map_obj.map_id
+        if map_id in cls._pending:
+            return
+        if map_id in cls._pyramids and map_id not in cls._stale_map_ids:
+            return
+
+        if map_obj.tile_renderer:
+            renderer = map_obj.tile_renderer
+            atlas_bytes, atlas_size = cls._get_atlas_bytes(renderer.tileset)
+            submit_args = (
+                MipPyramid.build_from_tiles,
+                atlas_bytes,
+                atlas_size,
+                renderer.tileset.num_tiles,
+                # Copy the layers, since terrain changes edit them in place.
+                [layer.copy() for layer in renderer.layers],
+            )
+        elif map_obj.image_path:
+            submit_args = (MipPyramid.build_from_file, map_obj.image_path)
+        else:
+            return
+
+        cls._stale_map_ids.discard(map_id)
+        cls._pending[map_id] = cls._get_executor().submit(*submit_args)
+
+    @classmethod
+    def _get_atlas_bytes(cls, map_tileset):
+        atlas_info = cls._atlas_bytes.get(map_tileset.tileset_id, None)
+        if atlas_info is None:
+            atlas_info = (pygame.image.tobytes(map_tileset.image, 'RGBA'), map_tileset.image.get_size())
+            cls._atlas_bytes[map_tileset.tileset_id] = atlas_info
+        return atlas_info
+
+    @classmethod
+    def _collect_finished(cls):
+        for map_id, future in list(cls._pending.items()):
+            if not future.done():
+                continue
+            del cls._pending[map_id]
+            try:
+                cls._pyramids[map_id] = future.result()
+            except Exception as e:
+                logging.error('Failed to build minimap for map {0}: {1}'.format(map_id, e))
+
+    @classmethod
+    def get_pyramid(cls, map_obj):
+        """Returns the map's latest MipPyramid, or None if none is built
+        yet. Never blocks; requests a build if needed."""
+
+        cls._collect_finished()
+        cls.request_pyramid(map_obj)
+        return cls._pyramids.get(map_obj.map_id, None)
+
+    @classmethod
+    def get_level_for_size(cls, map_obj, max_size):
+        """Returns the index of the largest level that fits within the
+        (width, height) size, or the smallest level if none fit."""
+
+        width = map_obj.width_in_tiles * tiles.TILE_SIZE
+        height = map_obj.height_in_tiles * tiles.TILE_SIZE
+        for level in range(MAX_LEVELS):
+            width, height = (width + 1) // 2, (height + 1) // 2
+            if width <= max_size[0] and height <= max_size[1]:
+                return level
+        return MAX_LEVELS - 1
+
+    @classmethod
+    def _get_inaccessible_mask(cls, map_obj):
+        mask = cls._inaccessible_masks.get(map_obj.map_id, None)
+        if mask is None:
+            mask = np.array(map_obj.accessibility_grid) == tiles.Accessibility.TILE_NOT_ACCESSIBLE_F
+            cls._inaccessible_masks[map_obj.map_id] = mask
+        return mask
+
+    @classmethod
+    def _get_overlay(cls, map_obj, show_accessibility, show_exploration, size):
+        """Returns a Surface of the given size with the overlay colors for
+        the map's tiles, or None if nothing is drawn over the level."""
+
+        colors = np.zeros((map_obj.height_in_tiles, map_obj.width_in_tiles, 4), dtype=np.uint8)
+        if show_accessibility:
+            colors[cls._get_inaccessible_mask(map_obj)] = INACCESSIBLE_COLOR
+        if show_exploration:
+            explored = exploration.Exploration.get_exploration_map(map_obj).get_explored_mask()
+            colors[~explored] = UNEXPLORED_COLOR
+        if not colors[:, :, 3].any():
+            return None
+
+        tile_overlay = pygame.image.frombytes(
+            colors.tobytes(),
+            (map_obj.width_in_tiles, map_obj.height_in_tiles),
+            'RGBA',
+        )
+        return pygame.transform.scale(tile_overlay, size)
+
+    @classmethod
+    def get_minimap(cls, map_obj, level, show_accessibility=True, show_exploration=True):
+        """Returns the map's image at the level with the overlays drawn on
+        it, or None if the pyramid is not built yet. Never blocks.
+
+        Args:
+            map_obj: Map to show.
+            level: pyramid level, where level n is 1/2^(n + 1) of the full
+                size.
+            show_accessibility: whether to shade inaccessible tiles.
+            show_exploration: whether to hide unexplored tiles.
+        """
+
+        pyramid = cls.get_pyramid(map_obj)
+        level_surface = pyramid.get_level(level) if pyramid else None
+        if level_surface is None:
+            return None
+
+        exploration_version = exploration.Exploration.get_exploration_map(map_obj).version \
+            if show_exploration else None
+        cache_key = (pyramid, terrain.Terrain.get_version(map_obj.map_id), exploration_version)
+        key = (map_obj.map_id, level, show_accessibility, show_exploration)
+        cached = cls._composed.get(key, None)
+        if cached and cached[0] == cache_key:
+            cls._composed.move_to_end(key)
+            return cached[1]
+
+        composed = level_surface
+        overlay = cls._get_overlay(map_obj, show_accessibility, show_exploration, level_surface.get_size())
+        if overlay:
+            composed = level_surface.copy()
+            composed.blit(overlay, (0, 0))
+
+        cls._composed[key] = (cache_key, composed)
+        while len(cls._composed) > MAX_CACHED_MINIMAPS:
+            cls._composed.popitem(last=False)
+        return composed
+
+    @classmethod
+    def handle_terrain_change(cls, map_obj, change):
+        """Patches the map's accessibility mask for the changed tiles, and
+        marks the pyramid stale if any tile images changed."""
+
+        mask = cls._inaccessible_masks.get(map_obj.map_id, None)
+        if mask is not None:
+            xs, ys = change.tile_locs[:, 0], change.tile_locs[:, 1]
+            mask[ys, xs] = change.new_flags == tiles.Accessibility.TILE_NOT_ACCESSIBLE_F
+
+        if any(tile_id is not None for tile_id in change.tile_ids):
+            cls._stale_map_ids.add(map_obj.map_id)
+
+
+terrain.Terrain.subscribe(Minimap.handle_terrain_change)
@@ -0,0 +1,375 @@
+"""This module contains particle effects and weather for the overworld.
+
+Particles live in preallocated NumPy arrays (position, velocity,
+acceleration, remaining lifetime and sprite index), with the live
+particles packed at the front. Each update moves every particle with a
+few array operations and compacts out the expired ones, and each draw
+is a single Surface.blits call using sprites from one shared atlas.
+
+Particles are updated once per frame from the overworld loop and only
+drawn when the map is blitted. Positions are in map pixel coordinates,
+so particles scroll with the map. The number of particles is capped at
+the system's capacity, and emissions beyond it are dropped. While
+frames are running behind, the system lowers its quality, which scales
+down both new emissions and the number of particles drawn, and recovers
+it once frames are back on time.
+
+This module requires NumPy.
+"""
+
+import random
+from enum import Enum
+
+import numpy as np
+import pygame
+
+from app.tiles import tiles
+from util import timekeeper
+
+# Maximum number of live particles.
+DEFAULT_CAPACITY = 4000
+
+# Maximum elapsed time in milliseconds for a single update, so particles
+# do not jump after long stalls.
+MAX_UPDATE_MS = 100
+
+# Quality is multiplied by this factor for each frame running behind,
+# and recovers by QUALITY_RECOVERY per frame on time.
+QUALITY_DEGRADE_FACTOR = 0.8
+QUALITY_RECOVERY = 0.02
+MIN_QUALITY = 0.2
+
+# Sprite indices in the particle atlas.
+SPRITE_RAIN = 0
+SPRITE_SNOW = 1
+SPRITE_DUST = 2
+SPRITE_WOOD_CHIP = 3
+SPRITE_ROCK_CHIP = 4
+
+# Width and height in pixels of each atlas cell.
+ATLAS_CELL_SIZE = 8
+
+
+class ParticleEffectID(Enum):
+    WOOD_CHIPS = 0x1
+    ROCK_DUST = 0x2
+
+
+class WeatherID(Enum):
+    CLEAR = 0x0
+    RAIN = 0x1
+    SNOW = 0x2
+
+
+# Maps effect IDs to lists of burst parameters: (sprite index, number of
+# particles, x velocity range, y velocity range, lifetime range in
+# milliseconds, y acceleration). Velocities are in pixels per second.
+EFFECT_BURSTS = {
+    ParticleEffectID.WOOD_CHIPS: [
+        (SPRITE_WOOD_CHIP, 8, (-90, 90), (-160, -60), (300, 500), 500),
+    ],
+    ParticleEffectID.ROCK_DUST: [
+        (SPRITE_ROCK_CHIP, 6, (-80, 80), (-150, -50), (250, 450), 600),
+        (SPRITE_DUST, 10, (-40, 40), (-50, -10), (400, 800), -20),
+    ],
+}
+
+# Maps weather IDs to (sprite index, particles per second per screen,
+# x velocity range, y velocity range, lifetime range in milliseconds).
+WEATHER_EMITTERS = {
+    WeatherID.RAIN: (SPRITE_RAIN, 400, (-80, -40), (600, 760), (500, 1000)),
+    WeatherID.SNOW: (SPRITE_SNOW, 80, (-30, 30), (40, 80), (3000, 8000)),
+}
+
+# Screen area in pixels that the weather rates are for.
+REFERENCE_SCREEN_AREA = 800 * 600
+
+
+def create_particle_atlas():
+    """Returns (atlas Surface, list of sprite area Rects indexed by sprite
+    index) for the particle sprites."""
+
+    sprite_painters = [
+        lambda surface: pygame.draw.line(surface, (170, 190, 230, 200), (5, 0), (3, 7)),
+        lambda surface: pygame.draw.circle(surface, (250, 250, 255, 230), (4, 4), 2),
+        lambda surface: pygame.draw.circle(surface, (150, 130, 110, 140), (4, 4), 3),
+        lambda surface: pygame.draw.rect(surface, (140, 90, 40, 255), (2, 3, 4, 2)),
+        lambda surface: pygame.draw.rect(surface, (110, 110, 115, 255), (3, 3, 3, 3)),
+    ]
+
+    atlas = pygame.Surface((ATLAS_CELL_SIZE * len(sprite_painters), ATLAS_CELL_SIZE), pygame.SRCALPHA)
+    areas = []
+    for index, painter in enumerate(sprite_painters):
+        cell = pygame.Surface((ATLAS_CELL_SIZE, ATLAS_CELL_SIZE), pygame.SRCALPHA)
+        painter(cell)
+        atlas.blit(cell, (index * ATLAS_CELL_SIZE, 0))
+        areas.append(pygame.Rect(index * ATLAS_CELL_SIZE, 0, ATLAS_CELL_SIZE, ATLAS_CELL_SIZE))
+    return atlas, areas
+
+
+class ParticleSystem:
+    """Pool of particles updated and drawn in bulk.
+
+    Attributes:
+        capacity: maximum number of live particles.
+        count: number of live particles, stored in the first count rows
+            of each array.
+        quality: current quality from MIN_QUALITY to 1, scaling emission
+            and drawing.
+        rng: NumPy random Generator for particle properties.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, seed=None):
+        self.capacity = capacity
+        self.count = 0
+        self.quality = 1.0
+        self.positions = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocities = np.zeros((capacity, 2), dtype=np.float32)
+        self.accelerations = np.zeros((capacity, 2), dtype=np.float32)
+        self.lifetimes_ms = np.zeros(capacity, dtype=np.float32)
+        self.sprites = np.zeros(capacity, dtype=np.int16)
+        self.rng = np.random.default_rng(seed)
+        self._atlas = None
+        self._atlas_areas = None
+
+    def clear(self):
+        self.count = 0
+
+    def emit(self, num_particles, positions, x_velocity_range, y_velocity_range, lifetime_range_ms, sprite,
+             y_acceleration=0.0):
+        """Adds particles with uniformly random velocities and lifetimes.
+
+        Args:
+            num_particles: number of particles requested, before scaling by
+                quality and capping at the capacity.
+            positions: (x, y) pixel position for every particle, or (N, 2)
+                array of positions for each particle.
+            x_velocity_range: (min, max) x velocity in pixels per second.
+            y_velocity_range: (min, max) y velocity in pixels per second.
+            lifetime_range_ms: (min, max) lifetime in milliseconds.
+            sprite: sprite index in the atlas.
+            y_acceleration: y acceleration in pixels per second squared.
+
+        Returns:
+            Number of particles added.
+        """
+
+        num_particles = min(int(round(num_particles * self.quality)), self.capacity - self.count)
+        if num_particles <= 0:
+            return 0
+
+        start, end = self.count, self.count + num_particles
+        positions = np.asarray(positions, dtype=np.float32)
+        if positions.ndim == 2:
+            positions = positions[:num_particles]
+        self.positions[start:end] = positions
+        self.velocities[start:end, 0] = self.rng.uniform(*x_velocity_range, size=num_particles)
+        self.velocities[start:end, 1] = self.rng.uniform(*y_velocity_range, size=num_particles)
+        self.accelerations[start:end] = (0.0, y_acceleration)
+        self.lifetimes_ms[start:end] = self.rng.uniform(*lifetime_range_ms, size=num_particles)
+        self.sprites[start:end] = sprite
+        self.count = end
+        return num_particles
+
+    def update(self, elapsed_ms):
+        """Moves the live particles and removes the expired ones."""
+
+        if timekeeper.Timekeeper.is_behind():
+            self.quality = max(MIN_QUALITY, self.quality * QUALITY_DEGRADE_FACTOR)
+        else:
+            self.quality = min(1.0, self.quality + QUALITY_RECOVERY)
+
+        count = self.count
+        if not count or elapsed_ms <= 0:
+            return
+
+        elapsed_ms = min(elapsed_ms, MAX_UPDATE_MS)
+        elapsed_s = elapsed_ms / 1000.0
+        self.velocities[:count] += self.accelerations[:count] * elapsed_s
+        self.positions[:count] += self.velocities[:count] * elapsed_s
+        self.lifetimes_ms[:count] -= elapsed_ms
+
+        # Pack the surviving particles at the front.
+        alive = self.lifetimes_ms[:count] > 0
+        num_alive = int(np.count_nonzero(alive))
+        if num_alive < count:
+            for array in (self.positions, self.velocities, self.accelerations, self.lifetimes_ms, self.sprites):
+                array[:num_alive] = array[:count][alive]
+            self.count = num_alive
+
+    def blit_onto_surface(self, surface, offset=(0, 0)):
+        """Blits the live particles, offset by the pixel offset, with a
+        single Surface.blits call.
+
+        Returns:
+            Number of particles drawn.
+        """
+
+        if self._atlas is None:
+            self._atlas, self._atlas_areas = create_particle_atlas()
+
+        num_drawn = int(self.count * self.quality)
+        if not num_drawn:
+            return 0
+
+        clip = surface.get_clip()
+        xs = self.positions[:num_drawn, 0].astype(np.int32) + int(offset[0])
+        ys = self.positions[:num_drawn, 1].astype(np.int32) + int(offset[1])
+        visible = (xs > clip.left - ATLAS_CELL_SIZE) & (xs < clip.right) \
+            & (ys > clip.top - ATLAS_CELL_SIZE) & (ys < clip.bottom)
+
+        atlas, areas = self._atlas, self._atlas_areas
+        surface.blits(
+            [
+                (atlas, (x, y), areas[sprite])
+                for x, y, sprite in zip(xs[visible].tolist(), ys[visible].tolist(), self.sprites[:num_drawn][visible]
+                                        .tolist())
+            ],
+            doreturn=False,
+        )
+        return int(np.count_nonzero(visible))
+
+
+class Particles:
+    """Particle effects and weather for the current map.
+
+    The user should not generate Particles objects, as the class is
+    primarily for class methods and class-level data.
+    """
+
+    # Whether to update and blit particles.
+    enabled = True
+
+    _system = None
+    _map_id = None
+    _weather_id = WeatherID.CLEAR
+    _last_update_time_ms = None
+
+    # Fractional number of weather particles carried over between
+    # updates.
+    _weather_carry = 0.0
+
+    @classmethod
+    def get_system(cls, map_obj):
+        """Returns the particle system for the map. Particles from the
+        previous map are discarded when the map changes."""
+
+        if cls._system is None:
+            cls._system = ParticleSystem()
+        if cls._map_id != map_obj.map_id:
+            cls._system.clear()
+            cls._map_id = map_obj.map_id
+        return cls._system
+
+    @classmethod
+    def set_weather(cls, weather_id):
+        cls._weather_id = weather_id
+        cls._weather_carry = 0.0
+
+    @classmethod
+    def get_weather(cls):
+        return cls._weather_id
+
+    @classmethod
+    def emit_effect(cls, map_obj, effect_id, pixel_pos):
+        """Emits the bursts for the effect at the map pixel position."""
+
+        if not cls.enabled:
+            return
+        system = cls.get_system(map_obj)
+        for sprite, num_particles, x_velocity_range, y_velocity_range, lifetime_range_ms, y_acceleration \
+                in EFFECT_BURSTS.get(effect_id, []):
+            system.emit(
+                num_particles,
+                pixel_pos,
+                x_velocity_range,
+                y_velocity_range,
+                lifetime_range_ms,
+                sprite,
+                y_acceleration=y_acceleration,
+            )
+
+    @classmethod
+    def emit_effect_at_tile(cls, map_obj, effect_id, tile_loc, width_in_tiles=1):
+        """Emits the effect from the bottom middle of the object with the
+        given width whose bottom left tile is tile_loc."""
+
+        cls.emit_effect(
+            map_obj,
+            effect_id,
+            (
+                tile_loc[0] * tiles.TILE_SIZE + width_in_tiles * tiles.TILE_SIZE // 2 + random.randint(-4, 4),
+                (tile_loc[1] + 1) * tiles.TILE_SIZE - tiles.TILE_SIZE // 4,
+            ),
+        )
+
+    @classmethod
+    def _emit_weather(cls, system, elapsed_ms, visible_rect):
+        emitter = WEATHER_EMITTERS.get(cls._weather_id, None)
+        if not emitter or elapsed_ms <= 0:
+            return
+
+        sprite, rate, x_velocity_range, y_velocity_range, lifetime_range_ms = emitter
+        cls._weather_carry += rate * (visible_rect.width * visible_rect.height / REFERENCE_SCREEN_AREA) \
+            * min(elapsed_ms, MAX_UPDATE_MS) / 1000.0
+        num_particles = int(cls._weather_carry)
+        if not num_particles:
+            return
+        cls._weather_carry -= num_particles
+
+        # Spawn along the top of the visible area, with extra width on the
+        # upwind side for slanted rain.
+        margin = visible_rect.height // 4
+        xs = system.rng.uniform(visible_rect.left - margin, visible_rect.right + margin, size=num_particles)
+        ys = system.rng.uniform(visible_rect.top - margin, visible_rect.top, size=num_particles)
+        system.emit(
+            num_particles,
+            np.column_stack((xs, ys)),
+            x_velocity_range,
+            y_velocity_range,
+            lifetime_range_ms,
+            sprite,
+        )
+
+    @classmethod
+    def is_active(cls):
+        """Returns True if there are particles that need redrawing every
+        frame."""
+
+        return cls.enabled and (
+            cls._weather_id in WEATHER_EMITTERS or (cls._system is not None and cls._system.count > 0)
+        )
+
+    @classmethod
+    def update(cls, map_obj, tile_subset_rect=None):
+        """Updates the particles for the time since the last update and
+        emits weather over the visible tile rect, or the whole map if None.
+        Call once per frame, whether or not the map is reblitted."""
+
+        if not cls.enabled:
+            return
+
+        curr_time_ms = pygame.time.get_ticks()
+        elapsed_ms = curr_time_ms - cls._last_update_time_ms if cls._last_update_time_ms is not None else 0
+        cls._last_update_time_ms = curr_time_ms
+
+        if tile_subset_rect:
+            visible_rect = pygame.Rect(
+                tile_subset_rect[0] * tiles.TILE_SIZE,
+                tile_subset_rect[1] * tiles.TILE_SIZE,
+                tile_subset_rect[2] * tiles.TILE_SIZE,
+                tile_subset_rect[3] * tiles.TILE_SIZE,
+            )
+        else:
+            visible_rect = pygame.Rect(0, 0, map_obj.width_in_px, map_obj.height_in_px)
+
+        system = cls.get_system(map_obj)
+        system.update(elapsed_ms)
+        cls._emit_weather(system, elapsed_ms, visible_rect)
+
+    @classmethod
+    def blit_onto_surface(cls, map_obj, surface):
+        """Blits the map's particles as of the last update."""
+
+        if cls.enabled and cls._system is not None and cls._system.count and cls._map_id == map_obj.map_id:
+            cls._system.blit_onto_surface(surface, offset=map_obj.top_left_position)
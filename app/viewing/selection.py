@@ -434,6 +434,9 @@ class SelectionGridViewing(viewing.BaseView):
                     pygame.display.update()
                 while not received_input:
                     timekeeper.Timekeeper.tick()
+                    # Nothing here runs on logic ticks, so drop them rather than
+                    # letting them carry over once the selection closes.
+                    timekeeper.Timekeeper.consume_logic_ticks()
 
                     for events in pygame.event.get():
                         if events.type == pygame.QUIT:
@@ -551,6 +554,9 @@ class SelectionGridViewing(viewing.BaseView):
 
             while not received_input:
                 timekeeper.Timekeeper.tick()
+                # Nothing here runs on logic ticks, so drop them rather than
+                # letting them carry over once the selection closes.
+                timekeeper.Timekeeper.consume_logic_ticks()
 
                 for events in pygame.event.get():
                     if events.type == pygame.QUIT:
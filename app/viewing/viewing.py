@@ -3,7 +3,7 @@ import logging
 import sys
 
 from app.maps import directions
-from app.viewing import display, colors, fonts, menu_options
+from app.viewing import display, colors, fonts, menu_options, particles
 from app.images import image_paths, image_ids
 from app.tiles import tiles
 from util import timekeeper, util
@@ -435,10 +435,19 @@ class BaseView:
 
                 while not advance:
                     timekeeper.Timekeeper.tick()
-                    refresh_tick_counter = (refresh_tick_counter + 1) % timekeeper.MAP_REFRESH_TICK_INTERVAL
-                    reblit_tick_counter = (reblit_tick_counter + 1) % timekeeper.MAP_REFRESH_TICK_INTERVAL
+                    num_logic_ticks = timekeeper.Timekeeper.consume_logic_ticks()
+                    refresh_tick_counter, refresh_due = timekeeper.advance_tick_counter(
+                        refresh_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.MAP_REFRESH_TICK_INTERVAL,
+                    )
+                    reblit_tick_counter, reblit_due = timekeeper.advance_tick_counter(
+                        reblit_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL,
+                    )
 
-                    if refresh_during and (refresh_tick_counter == 0):
+                    if refresh_during and refresh_due:
                         # Refresh and reblit self and page.
                         logging.debug('Refreshing while waiting.')
                         self.refresh_and_blit_self()
@@ -454,7 +463,7 @@ class BaseView:
                         if not no_display_update:
                             pygame.display.update()
 
-                    elif reblit_tick_counter == 0:
+                    elif reblit_due:
                         self.blit_self()
                         text_display.blit_page(
                             self._main_display_surface,
@@ -866,11 +875,19 @@ class BaseView:
                 while not given_input:
                     timekeeper.Timekeeper.tick()
 
-                    refresh_tick_counter = (refresh_tick_counter + 1) % timekeeper.MAP_REFRESH_TICK_INTERVAL
-                    reblit_tick_counter = (reblit_tick_counter + 1) % timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL
+                    num_logic_ticks = timekeeper.Timekeeper.consume_logic_ticks()
+                    refresh_tick_counter, refresh_due = timekeeper.advance_tick_counter(
+                        refresh_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.MAP_REFRESH_TICK_INTERVAL,
+                    )
+                    reblit_tick_counter, reblit_due = timekeeper.advance_tick_counter(
+                        reblit_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL,
+                    )
 
-                    if refresh_during \
-                            and (refresh_tick_counter == 0):
+                    if refresh_during and refresh_due:
                         logging.debug("Refreshing while waiting.")
                         self.refresh_and_blit_self()
                         text_lines = [
@@ -892,7 +909,7 @@ class BaseView:
                         )
                         if not no_display_update:
                             pygame.display.update()
-                    elif reblit_tick_counter == 0:
+                    elif reblit_due:
                         self.blit_self()
                         text_lines = [
                             prompt_text_to_display,
@@ -1118,10 +1135,19 @@ class BaseView:
                     next_option = False
                     prev_option = False
 
-                    refresh_tick_counter = (refresh_tick_counter + 1) % timekeeper.MAP_REFRESH_TICK_INTERVAL
-                    reblit_tick_counter = (reblit_tick_counter + 1) % timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL
+                    num_logic_ticks = timekeeper.Timekeeper.consume_logic_ticks()
+                    refresh_tick_counter, refresh_due = timekeeper.advance_tick_counter(
+                        refresh_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.MAP_REFRESH_TICK_INTERVAL,
+                    )
+                    reblit_tick_counter, reblit_due = timekeeper.advance_tick_counter(
+                        reblit_tick_counter,
+                        num_logic_ticks,
+                        timekeeper.OVERWORLD_REBLIT_TICK_INTERVAL,
+                    )
 
-                    if refresh_during and (refresh_tick_counter == 0):
+                    if refresh_during and refresh_due:
                         logging.debug("Refreshing while waiting.")
                         self.refresh_and_blit_self()
                         menu_display.blit_menu_page(
@@ -1133,7 +1159,7 @@ class BaseView:
                             alternative_top_left=alternative_top_left,
                         )
                         pygame.display.update()
-                    if reblit_tick_counter == 0:
+                    if reblit_due:
                         self.blit_self()
                         menu_display.blit_menu_page(
                             self._main_display_surface,
@@ -1707,6 +1733,23 @@ class OverworldView(BaseView):
                 blit_time_ms=pygame.time.get_ticks(),
             )
 
+    def update_particles(self):
+        """Advances particles and weather over the visible part of the
+        current map.
+
+        Does not blit the particles.
+        """
+
+        if self._curr_map:
+            top_left_viewing_tile_coord = OverworldView.get_top_left_ow_viewing_tile(self._curr_map.top_left_position)
+            particles.Particles.update(
+                self._curr_map,
+                tile_subset_rect=OverworldView.calculate_tile_viewing_rect(
+                    self._curr_map,
+                    top_left_viewing_tile_coord,
+                ),
+            )
+
     def display_overworld_side_menu(
             self,
             menu_option_ids,
@@ -1924,11 +1967,11 @@ class OverworldView(BaseView):
         elif char_move_direction == directions.CardinalDirection.WEST:
             walk_sequence_id = image_ids.ImageSequenceID.WALK_WEST
 
-        # Get wait time in between pixel movements.
+        # Get time to scroll a full tile.
         if run:
-            wait_time = int(ViewingTime.RUN_SINGLE_TILE_SCROLL_TIME_MS / tiles.TILE_SIZE)
+            tile_scroll_time_ms = ViewingTime.RUN_SINGLE_TILE_SCROLL_TIME_MS
         else:
-            wait_time = int(ViewingTime.WALK_SINGLE_TILE_SCROLL_TIME_MS / tiles.TILE_SIZE)
+            tile_scroll_time_ms = ViewingTime.WALK_SINGLE_TILE_SCROLL_TIME_MS
 
         if walk_sequence_id:
             walk_sequence_images = self._protagonist.image_sequence_dict.get(
@@ -1947,28 +1990,40 @@ class OverworldView(BaseView):
                 self._protagonist.adhoc_animation_index = 0
                 self._protagonist.curr_image_sequence_id = walk_sequence_id
 
-                for i in range(tiles.TILE_SIZE):
+                # Scroll distance follows elapsed time, so slow frames
+                # move further per frame instead of slowing the walk down.
+                elapsed_ms = 0
+                scrolled_px = 0
+                while scrolled_px < tiles.TILE_SIZE:
+                    elapsed_ms += timekeeper.Timekeeper.tick()
+                    target_px = min(tiles.TILE_SIZE, (elapsed_ms * tiles.TILE_SIZE) // tile_scroll_time_ms)
+
+                    if target_px > scrolled_px:
+                        self._curr_map.scroll(
+                            self._main_display_surface,
+                            scroll_direction,
+                            target_px - scrolled_px,
+                            tile_subset_rect=tile_subset_rect,
+                            blit=False,
+                        )
+                        scrolled_px = target_px
+
+                    # Always render the final position.
+                    if scrolled_px < tiles.TILE_SIZE and not timekeeper.Timekeeper.should_render():
+                        continue
+
                     # Get index for animation sequence.
-                    self._protagonist.adhoc_animation_index = i // phase_duration
+                    self._protagonist.adhoc_animation_index = min(scrolled_px // phase_duration,
+                                                                  len(walk_sequence_images) - 1)
 
                     # Reset the surface screen to default to black for empty map
                     # spaces.
                     self.blit_background(fill_color=colors.COLOR_BLACK)
-
-                    # scroll 1 pixel at a time
-                    self._curr_map.scroll(
-                        self._main_display_surface,
-                        scroll_direction,
-                        1,
-                        tile_subset_rect=tile_subset_rect
-                    )
+                    self._curr_map.blit_onto_surface(self._main_display_surface, tile_subset_rect=tile_subset_rect)
 
                     # Update main display
                     pygame.display.update()
 
-                    # Wait till next iteration
-                    pygame.time.wait(wait_time)
-
                 # End walk animation.
                 self._protagonist.in_adhoc_animation = False
                 self._protagonist.adhoc_animation_index = 0
@@ -0,0 +1,59 @@
+"""Compiles the inline translations into the catalog files in
+lang/catalogs, which are the only translations the game loads.
+
+Run from the repository root after changing translated text:
+
+    python compile_catalogs.py
+"""
+
+import glob
+import logging
+import os
+import sys
+
+from lang import language
+
+# Record inline translations before importing the modules below, since
+# they create their translated text on import.
+language.StringCatalog.record_inline_translations = True
+
+from app import application  # noqa: E402, F401
+from conf.settings import Settings  # noqa: E402
+from util import util  # noqa: E402
+
+# Translated fields of the item YAML files.
+ITEM_TEXT_FIELDS = ('name', 'description', 'usage')
+
+
+def intern_item_text():
+    """Interns the translated text of the standard item YAML files without
+    building the items, which would load their images."""
+
+    for item_yaml in glob.glob(os.path.join(util.get_yaml_path(), 'items', 'standard', '*.yml')):
+        stripped = util.strip_yaml(item_yaml)
+        if not stripped:
+            raise Exception('Empty item yaml {} provided'.format(item_yaml))
+        for item_yaml_info in stripped[0]:
+            for field in ITEM_TEXT_FIELDS:
+                if item_yaml_info.get(field, None):
+                    language.MultiLanguageText(language_dict=item_yaml_info[field])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)-5s] %(message)s')
+
+    try:
+        Settings.load_settings()
+        Settings.get_game_title()
+        intern_item_text()
+    except Exception as e:
+        logging.exception('Exception when loading translated text: {}'.format(e))
+        sys.exit(1)
+
+    for lang in language.LanguageEnum:
+        if lang != language.SOURCE_LANGUAGE:
+            language.StringCatalog.compile_catalog(lang)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,241 @@
+"""This module contains the game languages and translated text.
+
+Translated strings are interned into a string catalog, indexed by string
+ID. MultiLanguageText objects only hold a string ID, and the string
+table (a list) for the current language is kept as the active table, so
+getting text is a single list index.
+
+Only the source (English) text of each string is kept in memory. Other
+languages are loaded from compiled catalog files in
+lang/catalogs/<language code>.json, which map source text to translated
+text. Only the current language's catalog and table are loaded, and they
+are dropped again when the current language changes, so adding
+languages does not grow the memory held by the running game. Strings
+missing from a catalog fall back to their source text.
+
+Inline translations for other languages (the es argument of
+MultiLanguageText and the es keys in YAML files) are only the input for
+compiling catalogs, and are discarded unless they are being recorded by
+compile_catalogs.py.
+"""
+
+import json
+import logging
+import os
 from enum import Enum
 
+# Directory containing compiled catalog files.
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogs')
+
+CATALOG_FILE_EXTENSION = '.json'
+
 
 class LanguageEnum(Enum):
     EN = 0x0
     ES = 0x1
 
 
+# Language of the text used as keys in catalog files.
+SOURCE_LANGUAGE = LanguageEnum.EN
+
+
+class StringCatalog:
+    """Holds the interned source strings and the loaded string tables.
+
+    The user should not generate StringCatalog objects, as the class is
+    primarily for class methods and class-level tables.
+    """
+
+    # Maps source text to string ID, so that identical texts share one
+    # ID.
+    _string_ids = {}
+
+    # Maps LanguageEnum to list of strings, indexed by string ID. The
+    # source language's table holds the source text of every string, and
+    # other languages only have a table while they are loaded.
+    _tables = {SOURCE_LANGUAGE: []}
+
+    # Maps LanguageEnum to dict of source text to translated text, for
+    # the loaded languages other than the source language.
+    _loaded_catalogs = {}
+
+    # If True, inline translations are kept in _inline_translations so
+    # that compile_catalog() can write them.
+    record_inline_translations = False
+
+    # Maps LanguageEnum to dict of source text to inline translated text,
+    # only filled while recording.
+    _inline_translations = {}
+
+    @classmethod
+    def intern(cls, translation_dict):
+        """Adds the source text to the string tables and returns the string
+        ID for it.
+
+        Args:
+            translation_dict: dict mapping LanguageEnum to translated text.
+                Only the source language's text is kept, unless inline
+                translations are being recorded.
+
+        Returns:
+            Integer string ID for the source text.
+        """
+
+        source_text = translation_dict.get(SOURCE_LANGUAGE, '') or ''
+        if cls.record_inline_translations and source_text:
+            for lang, text in translation_dict.items():
+                if lang != SOURCE_LANGUAGE and text:
+                    cls._record_inline_translation(lang, source_text, text)
+
+        string_id = cls._string_ids.get(source_text, None)
+        if string_id is not None:
+            return string_id
+
+        string_id = len(cls._string_ids)
+        cls._string_ids[source_text] = string_id
+        cls._tables[SOURCE_LANGUAGE].append(source_text)
+        for lang, catalog in cls._loaded_catalogs.items():
+            cls._tables[lang].append(catalog.get(source_text, source_text))
+        return string_id
+
+    @classmethod
+    def _record_inline_translation(cls, lang, source_text, text):
+        translations = cls._inline_translations.setdefault(lang, {})
+        prev_text = translations.get(source_text, None)
+        if prev_text is not None and prev_text != text:
+            logging.warning('Conflicting {0} translations for "{1}": "{2}" and "{3}"'.format(
+                lang.name, source_text, prev_text, text))
+        translations[source_text] = text
+
+    @classmethod
+    def is_table_built(cls, lang):
+        return lang in cls._tables
+
+    @classmethod
+    def get_table(cls, lang):
+        """Returns the string table for the language, loading it from its
+        catalog first if needed. The table is kept until drop_table() is
+        called for the language."""
+
+        table = cls._tables.get(lang, None)
+        if table is None:
+            catalog = cls.read_catalog(lang)
+            table = [catalog.get(source_text, source_text) for source_text in cls._tables[SOURCE_LANGUAGE]]
+            cls._loaded_catalogs[lang] = catalog
+            cls._tables[lang] = table
+            logging.info('Built %s string table with %d strings', lang.name, len(table))
+        return table
+
+    @classmethod
+    def get_text(cls, lang, string_id):
+        """Returns the text of the string ID in the language. Reads the
+        language's catalog without keeping it if its table is not
+        loaded."""
+
+        table = cls._tables.get(lang, None)
+        if table is not None:
+            return table[string_id]
+        source_text = cls._tables[SOURCE_LANGUAGE][string_id]
+        return cls.read_catalog(lang).get(source_text, source_text)
+
+    @classmethod
+    def drop_table(cls, lang):
+        """Drops the loaded table and catalog for the language. The source
+        language's table is always kept."""
+
+        if lang != SOURCE_LANGUAGE:
+            cls._tables.pop(lang, None)
+            cls._loaded_catalogs.pop(lang, None)
+
+    @classmethod
+    def get_num_strings(cls):
+        return len(cls._string_ids)
+
+    @staticmethod
+    def get_catalog_path(lang, catalog_dir=CATALOG_DIR):
+        return os.path.join(catalog_dir, lang.name.lower() + CATALOG_FILE_EXTENSION)
+
+    @classmethod
+    def read_catalog(cls, lang, catalog_dir=CATALOG_DIR):
+        """Returns dict of source text to translated text from the compiled
+        catalog file for the language, or an empty dict if there is none."""
+
+        catalog = {}
+        catalog_path = cls.get_catalog_path(lang, catalog_dir=catalog_dir)
+        if os.path.isfile(catalog_path):
+            with open(catalog_path, 'r', encoding='utf-8') as catalog_file:
+                catalog = json.load(catalog_file)
+            logging.info('Loaded %d strings from catalog %s', len(catalog), catalog_path)
+        return catalog
+
+    @classmethod
+    def compile_catalog(cls, lang, catalog_dir=CATALOG_DIR):
+        """Writes the recorded inline translations for the language to its
+        catalog file. Returns the path of the catalog file."""
+
+        if not cls.record_inline_translations:
+            raise Exception('Inline translations were not recorded')
+
+        catalog = dict(cls._inline_translations.get(lang, {}))
+        os.makedirs(catalog_dir, exist_ok=True)
+        catalog_path = cls.get_catalog_path(lang, catalog_dir=catalog_dir)
+        with open(catalog_path, 'w', encoding='utf-8') as catalog_file:
+            json.dump(catalog, catalog_file, ensure_ascii=False, indent=2, sort_keys=True)
+            catalog_file.write('\n')
+        logging.info('Wrote %d strings to catalog %s', len(catalog), catalog_path)
+        return catalog_path
+
+
 class Language:
     DEFAULT_LANGUAGE: LanguageEnum = LanguageEnum.ES
     _current_language: LanguageEnum = DEFAULT_LANGUAGE
 
+    # String table for the current language.
+    _active_table: list = StringCatalog.get_table(DEFAULT_LANGUAGE)
+
+    # Callables taking (old language, new language), called when the
+    # current language changes.
+    _language_change_listeners: list = []
+
     @classmethod
     def set_current_language(cls, new_language: LanguageEnum):
-        if new_language in list(LanguageEnum):
-            cls._current_language = new_language
+        """Sets the current language and notifies the language change
+        listeners if the language changed."""
+
+        if new_language not in list(LanguageEnum):
+            return
+
+        old_language = cls._current_language
+        cls._current_language = new_language
+        cls._active_table = StringCatalog.get_table(new_language)
+        if old_language != new_language:
+            StringCatalog.drop_table(old_language)
+
+        if old_language != new_language:
+            for listener in list(cls._language_change_listeners):
+                listener(old_language, new_language)
 
     @classmethod
     def get_current_language(cls) -> LanguageEnum:
         return cls._current_language
 
+    @classmethod
+    def get_active_table(cls) -> list:
+        return cls._active_table
+
+    @classmethod
+    def add_language_change_listener(cls, listener):
+        """Registers a callable taking (old language, new language) to call
+        when the current language changes."""
+
+        if listener not in cls._language_change_listeners:
+            cls._language_change_listeners.append(listener)
+
+    @classmethod
+    def remove_language_change_listener(cls, listener):
+        if listener in cls._language_change_listeners:
+            cls._language_change_listeners.remove(listener)
+
     @staticmethod
     def get_language_enum_from_str(lang_val: str) -> LanguageEnum:
         try:
@@ -28,20 +245,31 @@ class Language:
 
 
 class MultiLanguageText:
-    """Encapsulates language translations for text."""
+    """Encapsulates language translations for text.
+
+    The source text is stored in the StringCatalog, and each object only
+    holds the string ID. Translations come from the compiled catalogs.
+    """
+
+    __slots__ = ('string_id',)
 
     def __init__(self, en='', es='', language_dict=None):
         if language_dict:
-            self._translations = {
+            translations = {
                 LanguageEnum.EN: language_dict['en'],
                 LanguageEnum.ES: language_dict['es'],
             }
         else:
-            self._translations = {
+            translations = {
                 LanguageEnum.EN: en,
                 LanguageEnum.ES: es,
             }
+        self.string_id = StringCatalog.intern(translations)
 
     def get_text(self) -> str:
         """Gets underlying text translated to the current game language."""
-        return self._translations.get(Language.get_current_language(), '')
+        return Language._active_table[self.string_id]
+
+    def get_text_for_language(self, lang: LanguageEnum) -> str:
+        """Gets underlying text translated to the given language."""
+        return StringCatalog.get_text(lang, self.string_id)
@@ -4,11 +4,13 @@ import sys
 import pygame
 
 from app import application
+from app.audio import audio
 from app.interactions import interaction
 from app.items import items
 from app.maps import maps
 from app.viewing import viewing, display, fonts
 from conf.settings import Settings
+from util import timekeeper
 from util.timekeeper import Timekeeper
 
 
@@ -45,9 +47,13 @@ def main():
     pygame.init()
     pygame.font.init()
     pygame.mixer.init()
+    audio.Audio.init_audio()
 
     # Initialize clock
-    Timekeeper.init_clock()
+    Timekeeper.init_clock(
+        target_fps=Settings.get_setting('target_fps', timekeeper.DEFAULT_TARGET_FPS),
+        busy_loop=Settings.get_setting('busy_loop', False),
+    )
     logging.info('Initialized clock.')
 
     # TODO - load images and other game data
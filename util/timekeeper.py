@@ -1,5 +1,6 @@
 import pygame
 
+# Number of fixed game logic ticks per second.
 TICKS_PER_SECOND = 30
 
 # Number of milliseconds in a second.
@@ -14,6 +15,44 @@ MAP_REFRESH_TICK_INTERVAL = 30
 # Number of ticks between reblitting overworld.
 OVERWORLD_REBLIT_TICK_INTERVAL = 3
 
+# Default number of frames per second to render.
+DEFAULT_TARGET_FPS = TICKS_PER_SECOND
+
+# Maximum number of consecutive frames that can skip rendering.
+MAX_FRAME_SKIP = 4
+
+# A frame is running behind if it takes longer than this multiple of
+# the target frame time.
+FRAME_BEHIND_TOLERANCE = 1.5
+
+# Maximum number of logic ticks to catch up on in a single frame. Time
+# beyond this (e.g. after a long stall) is dropped.
+MAX_CATCH_UP_TICKS = 5
+
+# Number of real milliseconds in a full in-game day.
+GAME_DAY_LENGTH_MS = 24 * 60 * MS_PER_SECOND
+
+# In-game time when a new game starts, at 8 in the morning.
+GAME_START_TIME_MS = GAME_DAY_LENGTH_MS * 8 // 24
+
+
+def advance_tick_counter(tick_counter, num_ticks, tick_interval):
+    """Advances a tick counter that wraps every tick_interval ticks.
+
+    Args:
+        tick_counter: number of ticks counted since the interval last
+            elapsed.
+        num_ticks: number of logic ticks to add, usually from
+            Timekeeper.consume_logic_ticks().
+        tick_interval: number of ticks in the interval.
+
+    Returns:
+        Tuple of (new tick counter, True if the interval elapsed).
+    """
+
+    tick_counter += num_ticks
+    return tick_counter % tick_interval, tick_counter >= tick_interval
+
 
 class Timekeeper:
     """Handles time-based methods and functions, such as ticks.
@@ -21,27 +60,152 @@ class Timekeeper:
     The user should not generate Timekeeper overworld_obj, as the class
     is primarily for class methods related to time and the
     pygame clock.
+
+    Frames are paced to the target frame rate, while game logic runs in
+    fixed ticks of MS_PER_TICK. Each frame, consume_logic_ticks() returns
+    how many logic ticks are due, so logic catches up after slow frames,
+    and should_render() lets callers skip drawing while they are behind.
     """
 
     # Class pygame Clock object.
     _clock = None
 
+    # Frame pacing settings.
+    _target_fps = DEFAULT_TARGET_FPS
+    _busy_loop = False
+
+    # Milliseconds taken by the last frame.
+    _delta_ms = 0
+
+    # Milliseconds of elapsed time not yet consumed by logic ticks.
+    _logic_accumulator_ms = 0
+
+    # Number of consecutive frames that skipped rendering.
+    _num_skipped_frames = 0
+
+    # Milliseconds of in-game time elapsed, which drives the time of day.
+    _game_time_ms = GAME_START_TIME_MS
+
     @classmethod
-    def init_clock(cls):
-        """Sets up the pygame Clock object."""
+    def init_clock(cls, target_fps=DEFAULT_TARGET_FPS, busy_loop=False):
+        """Sets up the pygame Clock object.
+
+        Args:
+            target_fps: number of frames per second to pace to.
+            busy_loop: if True, uses Clock.tick_busy_loop for more precise
+                frame timing at the cost of CPU usage.
+        """
 
         cls._clock = pygame.time.Clock()
+        cls.set_target_fps(target_fps)
+        cls._busy_loop = bool(busy_loop)
+        cls._delta_ms = 0
+        cls._logic_accumulator_ms = 0
+        cls._num_skipped_frames = 0
+
+    @classmethod
+    def set_target_fps(cls, target_fps):
+        """Sets the number of frames per second to pace to."""
+
+        if not target_fps or target_fps <= 0:
+            raise Exception('Invalid target frame rate: {}'.format(target_fps))
+        cls._target_fps = int(target_fps)
+
+    @classmethod
+    def get_target_fps(cls):
+        return cls._target_fps
+
+    @classmethod
+    def get_target_frame_ms(cls):
+        """Returns the number of milliseconds per frame at the target rate."""
+
+        return MS_PER_SECOND / cls._target_fps
 
     @classmethod
-    def tick(cls, tick_amount=TICKS_PER_SECOND):
-        """Have the class Clock object tick.
+    def tick(cls, tick_amount=None):
+        """Have the class Clock object tick and returns the milliseconds
+        elapsed since the previous tick.
 
         Args:
             cls: class object.
             tick_amount: integer to determine the tick length. Higher tick
                 means pausing for a shorter amount of time (time paused is
                 approximately equal to 1 second / tick_amount).
-                Defaults to 30 ticks per second.
+                Defaults to the target frame rate.
+
+        Returns:
+            Number of milliseconds since the previous tick.
+        """
+
+        rate = tick_amount if tick_amount else cls._target_fps
+        if cls._busy_loop:
+            delta_ms = cls._clock.tick_busy_loop(rate)
+        else:
+            delta_ms = cls._clock.tick(rate)
+
+        cls._delta_ms = delta_ms
+        cls._game_time_ms += delta_ms
+        cls._logic_accumulator_ms = min(
+            cls._logic_accumulator_ms + delta_ms,
+            MAX_CATCH_UP_TICKS * MS_PER_TICK,
+        )
+        return delta_ms
+
+    @classmethod
+    def get_delta_ms(cls):
+        """Returns the number of milliseconds taken by the last frame."""
+
+        return cls._delta_ms
+
+    @classmethod
+    def get_game_time_ms(cls):
+        return cls._game_time_ms
+
+    @classmethod
+    def set_game_time_ms(cls, game_time_ms):
+        cls._game_time_ms = max(0, int(game_time_ms))
+
+    @classmethod
+    def get_time_of_day(cls):
+        """Returns the in-game time of day as a fraction of a day in
+        [0, 1), with 0 at midnight and 0.5 at noon."""
+
+        return (cls._game_time_ms % GAME_DAY_LENGTH_MS) / GAME_DAY_LENGTH_MS
+
+    @classmethod
+    def get_fps(cls):
+        """Returns the measured frame rate averaged over recent frames."""
+
+        return cls._clock.get_fps() if cls._clock else 0.0
+
+    @classmethod
+    def is_behind(cls):
+        """Returns True if the last frame took noticeably longer than the
+        target frame time."""
+
+        return cls._delta_ms > cls.get_target_frame_ms() * FRAME_BEHIND_TOLERANCE
+
+    @classmethod
+    def consume_logic_ticks(cls):
+        """Returns the number of fixed logic ticks due since the last call.
+
+        Returns 0 on fast frames and more than 1 after slow frames, so
+        logic runs at TICKS_PER_SECOND regardless of the frame rate.
+        """
+
+        num_ticks, cls._logic_accumulator_ms = divmod(cls._logic_accumulator_ms, MS_PER_TICK)
+        return int(num_ticks)
+
+    @classmethod
+    def should_render(cls):
+        """Returns False if the caller should skip rendering this frame.
+
+        Rendering is skipped while frames are running behind, for at most
+        MAX_FRAME_SKIP frames in a row so the screen still updates.
         """
 
-        cls._clock.tick(tick_amount)
+        if cls.is_behind() and cls._num_skipped_frames < MAX_FRAME_SKIP:
+            cls._num_skipped_frames += 1
+            return False
+        cls._num_skipped_frames = 0
+        return True
@@ -78,6 +78,14 @@ def get_yaml_path():
     return os.path.join(get_resources_path(), 'yaml')
 
 
+def get_grids_path():
+    return os.path.join(get_resources_path(), 'grids')
+
+
+def get_cache_path():
+    return os.path.join(get_base_path(), 'cache')
+
+
 def get_fonts_path():
     return os.path.join(get_resources_path(), 'fonts')
 